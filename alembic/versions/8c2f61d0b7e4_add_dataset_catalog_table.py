@@ -0,0 +1,51 @@
+"""add dataset catalog table
+
+Revision ID: 8c2f61d0b7e4
+Revises: 46c6ae70f1b1
+Create Date: 2026-10-18 09:12:40.218337
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c2f61d0b7e4'
+down_revision: Union[str, None] = '46c6ae70f1b1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    query = """
+        CREATE TABLE `dataset_catalog` (
+        `id` char(64) NOT NULL,
+        `user` varchar(50) NOT NULL,
+        `dataset` varchar(255) NOT NULL,
+        `file_name` varchar(255) NULL,
+        `ancestry` varchar(50) NULL,
+        `genome_build` varchar(50) NULL,
+        `phenotype` varchar(255) NULL,
+        `status` varchar(255) NULL,
+        `uploaded_at` datetime NULL,
+        `updated_at` datetime NOT NULL,
+        PRIMARY KEY (`id`),
+        KEY `idx_dataset_catalog_user_dataset` (`user`, `dataset`),
+        KEY `idx_dataset_catalog_user_uploaded_at` (`user`, `uploaded_at`)
+        )
+        """
+    op.execute(query)
+    # datasets uploaded before the catalog existed, anything only present in S3 is picked up by the reconciler
+    op.execute("""
+        INSERT INTO dataset_catalog (id, user, dataset, file_name, ancestry, genome_build, phenotype, status,
+        uploaded_at, updated_at)
+        SELECT d.id, d.uploaded_by, d.metadata->>'$.name', d.metadata->>'$.file', d.metadata->>'$.ancestry',
+        d.metadata->>'$.genome_build', NULLIF(d.metadata->>'$.phenotype', 'null'), dj.status, d.uploaded_at, NOW()
+        FROM datasets d LEFT JOIN dataset_jobs dj ON dj.id = d.id
+        """)
+
+
+def downgrade() -> None:
+    op.execute("drop table dataset_catalog")
@@ -0,0 +1,33 @@
+"""add bulk to dataset_jobs
+
+Revision ID: a9c5e2f7b3d1
+Revises: e8b4f1a6c3d9
+Create Date: 2026-10-18 23:05:12.640219
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9c5e2f7b3d1'
+down_revision: Union[str, None] = 'e8b4f1a6c3d9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # jobs queued by the bulk endpoint, which the scheduler submits together as array jobs
+    op.execute("""
+        ALTER TABLE `dataset_jobs`
+        ADD COLUMN `bulk` tinyint(1) NOT NULL DEFAULT 0
+        """)
+
+
+def downgrade() -> None:
+    op.execute("""
+        ALTER TABLE `dataset_jobs`
+        DROP COLUMN `bulk`
+        """)
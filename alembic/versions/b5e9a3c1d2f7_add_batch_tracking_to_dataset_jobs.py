@@ -0,0 +1,46 @@
+"""add batch tracking to dataset jobs
+
+Revision ID: b5e9a3c1d2f7
+Revises: 8c2f61d0b7e4
+Create Date: 2026-10-18 11:03:27.514902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e9a3c1d2f7'
+down_revision: Union[str, None] = '8c2f61d0b7e4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    query = """
+        ALTER TABLE `dataset_jobs`
+        ADD COLUMN `dataset` varchar(255) NULL,
+        ADD COLUMN `method` varchar(20) NULL,
+        ADD COLUMN `batch_job_id` varchar(64) NULL,
+        ADD COLUMN `batch_status` varchar(20) NULL,
+        ADD COLUMN `submitted_at` datetime NULL,
+        ADD COLUMN `last_polled_at` datetime NULL,
+        ADD KEY `idx_dataset_jobs_batch_status` (`batch_status`)
+        """
+    op.execute(query)
+    op.execute("UPDATE dataset_jobs dj JOIN datasets d ON d.id = dj.id SET dj.dataset = d.metadata->>'$.name'")
+
+
+def downgrade() -> None:
+    op.execute("""
+        ALTER TABLE `dataset_jobs`
+        DROP KEY `idx_dataset_jobs_batch_status`,
+        DROP COLUMN `dataset`,
+        DROP COLUMN `method`,
+        DROP COLUMN `batch_job_id`,
+        DROP COLUMN `batch_status`,
+        DROP COLUMN `submitted_at`,
+        DROP COLUMN `last_polled_at`
+        """)
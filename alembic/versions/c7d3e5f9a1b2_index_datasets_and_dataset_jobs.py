@@ -0,0 +1,33 @@
+"""index datasets and dataset_jobs by user
+
+Revision ID: c7d3e5f9a1b2
+Revises: f2a6b8d4c1e3
+Create Date: 2026-10-18 18:02:13.518420
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7d3e5f9a1b2'
+down_revision: Union[str, None] = 'f2a6b8d4c1e3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # the dataset name is stored once at write time rather than parsed out of metadata on every read
+    op.execute("""
+        ALTER TABLE `datasets`
+        ADD COLUMN `name` varchar(255) GENERATED ALWAYS AS (`metadata`->>'$.name') STORED,
+        ADD KEY `idx_datasets_uploaded_by_name` (`uploaded_by`, `name`)
+        """)
+    op.execute("ALTER TABLE `dataset_jobs` ADD KEY `idx_dataset_jobs_user_updated_at` (`user`, `updated_at`)")
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE `dataset_jobs` DROP KEY `idx_dataset_jobs_user_updated_at`")
+    op.execute("ALTER TABLE `datasets` DROP KEY `idx_datasets_uploaded_by_name`, DROP COLUMN `name`")
@@ -0,0 +1,37 @@
+"""add job events table
+
+Revision ID: d41f7c8e9a20
+Revises: b5e9a3c1d2f7
+Create Date: 2026-10-18 13:42:09.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41f7c8e9a20'
+down_revision: Union[str, None] = 'b5e9a3c1d2f7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    query = """
+        CREATE TABLE IF NOT EXISTS `job_events` (
+        `id` bigint NOT NULL AUTO_INCREMENT,
+        `channel` varchar(100) NOT NULL,
+        `payload` text NOT NULL,
+        `created_at` datetime NOT NULL,
+        PRIMARY KEY (`id`),
+        KEY `idx_job_events_channel_id` (`channel`, `id`),
+        KEY `idx_job_events_created_at` (`created_at`)
+        )
+        """
+    op.execute(query)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE `job_events`")
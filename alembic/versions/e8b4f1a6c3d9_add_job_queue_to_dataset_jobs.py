@@ -0,0 +1,37 @@
+"""add job queue to dataset_jobs
+
+Revision ID: e8b4f1a6c3d9
+Revises: c7d3e5f9a1b2
+Create Date: 2026-10-18 21:14:37.204816
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8b4f1a6c3d9'
+down_revision: Union[str, None] = 'c7d3e5f9a1b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # queued jobs wait in dataset_jobs until the scheduler releases them to Batch
+    op.execute("""
+        ALTER TABLE `dataset_jobs`
+        ADD COLUMN `priority` int NOT NULL DEFAULT 0,
+        ADD COLUMN `queued_at` datetime(6) NULL,
+        ADD KEY `idx_dataset_jobs_status_priority` (`status`, `priority`, `queued_at`)
+        """)
+
+
+def downgrade() -> None:
+    op.execute("""
+        ALTER TABLE `dataset_jobs`
+        DROP KEY `idx_dataset_jobs_status_priority`,
+        DROP COLUMN `queued_at`,
+        DROP COLUMN `priority`
+        """)
@@ -0,0 +1,38 @@
+"""add job log chunks table
+
+Revision ID: f2a6b8d4c1e3
+Revises: d41f7c8e9a20
+Create Date: 2026-10-18 15:20:44.307162
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a6b8d4c1e3'
+down_revision: Union[str, None] = 'd41f7c8e9a20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    query = """
+        CREATE TABLE IF NOT EXISTS `job_log_chunks` (
+        `job_id` char(64) NOT NULL,
+        `seq` int NOT NULL,
+        `first_line` bigint NOT NULL,
+        `line_count` int NOT NULL,
+        `byte_offset` bigint NOT NULL,
+        `byte_length` int NOT NULL,
+        `data` mediumblob NOT NULL,
+        PRIMARY KEY (`job_id`, `seq`)
+        )
+        """
+    op.execute(query)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE `job_log_chunks`")
@@ -0,0 +1,68 @@
+import asyncio
+import os
+import tempfile
+import time
+
+import typer
+
+app = typer.Typer()
+
+
+async def measure_loop_lag(stop: asyncio.Event, interval: float = 0.005) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+async def run_requests(requests: int, concurrency: int, offload: bool, job_id: str) -> tuple[float, float]:
+    from job_server import database_utils
+    from job_server.database import get_db, run_db
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def handler():
+        async with semaphore:
+            if offload:
+                await run_db(database_utils.get_jobs_for_user, get_db(), "benchuser")
+                await run_db(database_utils.get_job_status, get_db(), job_id)
+            else:
+                database_utils.get_jobs_for_user(get_db(), "benchuser")
+                database_utils.get_job_status(get_db(), job_id)
+
+    stop = asyncio.Event()
+    lag = asyncio.create_task(measure_loop_lag(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*[handler() for _ in range(requests)])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    return elapsed, await lag
+
+
+@app.command()
+def run(requests: int = 2000, concurrency: int = 50, jobs: int = 500):
+    """
+    Compares calling database_utils directly from coroutines with offloading them through run_db,
+    against a sqlite stand-in for MySQL.
+    """
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['DIG_JOB_SERVER_DB'] = f"sqlite:///{db_path}"
+    from job_server import database_utils, sqlite_schema
+    from job_server.database import get_db
+
+    with get_db() as connection:
+        sqlite_schema.create_schema(connection)
+    for i in range(jobs):
+        database_utils.log_job_start(get_db(), "benchuser", f"dataset-{i}", "RUNNING sumstats")
+    job_id = database_utils.get_dataset_hash("dataset-0", "benchuser")
+
+    for offload in (False, True):
+        elapsed, lag = asyncio.run(run_requests(requests, concurrency, offload, job_id))
+        print(f"{'run_db' if offload else 'blocking':10} {requests / elapsed:8.0f} req/s, "
+              f"worst event loop stall {lag * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    app()
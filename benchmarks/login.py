@@ -0,0 +1,95 @@
+import asyncio
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import typer
+
+from benchmarks.database import measure_loop_lag
+
+app = typer.Typer()
+
+
+async def run_logins(logins: int, backend, offload: bool, workers: int, queue_limit: int) -> dict:
+    from job_server.auth_backend import LoginSaturated, PasswordVerifier
+
+    verifier = PasswordVerifier(workers, queue_limit)
+    latencies = []
+    rejected = 0
+
+    async def login():
+        nonlocal rejected
+        start = time.perf_counter()
+        try:
+            if offload:
+                await verifier.authenticate(backend, "benchuser", "change.me")
+            else:
+                backend.authenticate_user("benchuser", "change.me")
+        except LoginSaturated:
+            rejected += 1
+            return
+        latencies.append(time.perf_counter() - start)
+
+    stop = asyncio.Event()
+    lag = asyncio.create_task(measure_loop_lag(stop))
+    start = time.perf_counter()
+    # everyone presses the button at once
+    await asyncio.gather(*[login() for _ in range(logins)])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    latencies.sort()
+    return {"throughput": len(latencies) / elapsed, "p50": statistics.median(latencies) if latencies else 0,
+            "p95": latencies[int(len(latencies) * 0.95) - 1] if latencies else 0, "rejected": rejected,
+            "stall": await lag}
+
+
+def sqlite_backend(directory: str):
+    from werkzeug.security import generate_password_hash
+    from job_server.auth_sql_lite import SQLiteAuthBackend
+
+    db_path = os.path.join(directory, 'users.db')
+    with sqlite3.connect(db_path) as connection:
+        connection.execute("CREATE TABLE users (username text, password_hash text)")
+        connection.execute("INSERT INTO users VALUES ('benchuser', ?)", (generate_password_hash("change.me"),))
+    return SQLiteAuthBackend(db_path)
+
+
+def sql_backend(directory: str):
+    import bcrypt
+    from sqlalchemy import text
+
+    os.environ['DIG_JOB_SERVER_DB'] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+    from job_server import sqlite_schema
+    from job_server.auth_mysql import MySQLAuthBackend
+    from job_server.database import get_db
+
+    with get_db() as connection:
+        sqlite_schema.create_schema(connection)
+        connection.execute(text("INSERT INTO users (user_name, password, created_at) VALUES "
+                                "('benchuser', :password, NOW())"),
+                           {"password": bcrypt.hashpw(b"change.me", bcrypt.gensalt(12)).decode('utf-8')})
+        connection.commit()
+    return MySQLAuthBackend()
+
+
+@app.command()
+def run(logins: int = 40, workers: int = os.cpu_count() or 2, queue_limit: int = 32):
+    """
+    A burst of simultaneous logins, checked inline on the event loop as /login used to and through the
+    bounded PasswordVerifier pool, for the bcrypt (MySQLAuthBackend) and pbkdf2 (SQLiteAuthBackend) backends.
+    """
+    directory = tempfile.mkdtemp()
+    print(f"{logins} logins, {workers} workers, queue limit {queue_limit}")
+    print(f"{'backend':10} {'mode':10} {'logins/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'rejected':>9} {'stall ms':>9}")
+    for name, backend in (("bcrypt", sql_backend(directory)), ("pbkdf2", sqlite_backend(directory))):
+        for offload in (False, True):
+            result = asyncio.run(run_logins(logins, backend, offload, workers, queue_limit))
+            print(f"{name:10} {'pool' if offload else 'inline':10} {result['throughput']:9.1f} "
+                  f"{result['p50'] * 1000:9.0f} {result['p95'] * 1000:9.0f} {result['rejected']:9d} "
+                  f"{result['stall'] * 1000:9.0f}")
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,59 @@
+import asyncio
+import gzip
+import io
+import time
+import tracemalloc
+
+import typer
+from fastapi import UploadFile
+
+from job_server import file_utils
+
+app = typer.Typer()
+
+
+def synthetic_sumstats(rows: int) -> bytes:
+    lines = ["chromosome\tposition\treference\talt\tpValue\tbeta\toddsRatio\tn"]
+    lines += [f"{i % 22 + 1}\t{i * 37}\tA\tG\t{(i % 9973) / 9973:.6f}\t{(i % 101) / 100 - 0.5:.4f}\t1.01\t50000"
+              for i in range(rows)]
+    return ("\n".join(lines) + "\n").encode('utf-8')
+
+
+async def whole_file_sample(file: UploadFile) -> list:
+    # the preview implementation this replaced: read everything, inflate everything, split every line
+    compressed_bytes = b""
+    while True:
+        chunk = await file.read(2048)
+        if not chunk:
+            break
+        compressed_bytes += chunk
+    with gzip.open(io.BytesIO(compressed_bytes), 'rt') as f:
+        lines = [line.rstrip('\n') for line in f]
+    return lines[:-1]
+
+
+def measure(sample, data: bytes) -> tuple:
+    tracemalloc.start()
+    start = time.perf_counter()
+    lines = asyncio.run(sample(UploadFile(io.BytesIO(data), filename="sumstats.tsv.gz")))
+    elapsed = (time.perf_counter() - start) * 1000
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    file_utils.detect_delimiter(lines[:file_utils.SAMPLE_LINES + 1])
+    return elapsed, peak
+
+
+@app.command()
+def run(rows: int = 2_000_000, baseline: bool = True):
+    data = gzip.compress(synthetic_sumstats(rows), compresslevel=6)
+    print(f"{rows} rows, {len(data) / 1e6:.1f} MB gzipped")
+    print(f"{'sampler':20} {'ms':>10} {'peak MB':>10}")
+    elapsed, peak = measure(file_utils.read_sample_lines, data)
+    print(f"{'streaming':20} {elapsed:10.1f} {peak / 1e6:10.2f}")
+    if baseline:
+        elapsed, peak = measure(whole_file_sample, data)
+        print(f"{'whole file':20} {elapsed:10.1f} {peak / 1e6:10.2f}")
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,74 @@
+import io
+import time
+
+import numpy as np
+import pandas as pd
+import typer
+
+from job_server.results_cache import read_results
+from job_server.results_query import ResultsQuery
+
+app = typer.Typer()
+
+SCENARIOS = [
+    ("first page", {}, None, 1),
+    ("sort by enrichment desc", {}, 'enrichment', -1),
+    ("tissue contains + p filter", {'tissue': 'liver', 'pValue': '<0.05'}, None, 1),
+    ("annotation eq + enrichment filter", {'annotation': 'eq:enhancer', 'enrichment': '>1.5'}, 'enrichment', -1),
+]
+
+
+def synthetic_results(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    tsv = pd.DataFrame({
+        'annotation': rng.choice([f"annotation_{i}" for i in range(50)] + ['enhancer'], rows),
+        'tissue': rng.choice([f"tissue_{i}" for i in range(200)] + ['liver'], rows),
+        'biosample': rng.choice([f"biosample_{i}" for i in range(2000)], rows),
+        'enrichment': rng.normal(1, 0.5, rows),
+        'pValue': rng.uniform(0, 1, rows),
+    }).to_csv(sep='\t', index=False, header=False)
+    return read_results(io.BytesIO(tsv.encode('utf-8')))
+
+
+def pandas_page(df: pd.DataFrame, filters: dict, first: int, rows: int, sort_field, sort_order) -> dict:
+    # the /results implementation this engine replaced
+    for column, value in filters.items():
+        if df[column].dtype.kind in 'ifc':
+            if value.startswith(">"):
+                df = df[df[column] > float(value[1:])]
+            elif value.startswith("<"):
+                df = df[df[column] < float(value[1:])]
+        elif value.startswith("eq:"):
+            df = df[df[column].astype(str).str.lower() == value[3:].lower()]
+        else:
+            df = df[df[column].astype(str).str.contains(value, case=False, na=False)]
+    df = df.sort_values(by=sort_field, ascending=sort_order == 1) if sort_field else df.sort_values(by='pValue')
+    total = len(df)
+    facets = (df['tissue'].unique().tolist(), df['biosample'].unique().tolist(), df['annotation'].unique().tolist())
+    return {"items": df.iloc[first:first + rows].to_dict('records'), "totalRecords": total, "facets": facets}
+
+
+def timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for i in range(repeat):
+        fn(i)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+@app.command()
+def run(rows: int = 1_000_000, repeat: int = 5):
+    df = synthetic_results(rows)
+    start = time.perf_counter()
+    query = ResultsQuery(df)
+    print(f"{rows} rows, index build {(time.perf_counter() - start) * 1000:.1f} ms, {query.nbytes / 1e6:.1f} MB")
+    print(f"{'scenario':40} {'pandas ms':>10} {'first ms':>10} {'paging ms':>10}")
+    for name, filters, sort_field, sort_order in SCENARIOS:
+        baseline = timed(lambda i: pandas_page(df, filters, i * 10, 10, sort_field, sort_order), repeat)
+        fresh = ResultsQuery(df)
+        first = timed(lambda i: fresh.page(filters, 0, 10, sort_field, sort_order == 1), 1)
+        paging = timed(lambda i: fresh.page(filters, (i + 1) * 10, 10, sort_field, sort_order == 1), repeat)
+        print(f"{name:40} {baseline:10.1f} {first:10.1f} {paging:10.2f}")
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,73 @@
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import typer
+
+app = typer.Typer()
+
+
+async def run_schedule(heavy_jobs: int, light_users: int, max_running: int, max_running_per_user: int,
+                       job_seconds: float) -> dict:
+    from job_server.execution import FakeBackend
+    from job_server.scheduler import Scheduler
+
+    backend = FakeBackend(job_seconds / 2, job_seconds * 1.5)
+    scheduler = Scheduler(backend, max_running, max_running_per_user, interval=job_seconds / 10)
+    queued_at = {}
+    waits = {}
+    start = time.perf_counter()
+    # one user's sweep is already running when everyone else asks for a couple of analyses each
+    await scheduler.enqueue("heavy", [(f"heavy-{i}", "sumstats") for i in range(heavy_jobs)])
+    queued_at["heavy"] = time.perf_counter()
+    task = asyncio.create_task(scheduler.run())
+    await asyncio.sleep(job_seconds / 4)
+    for i in range(light_users):
+        await scheduler.enqueue(f"light-{i}", [(f"light-{i}-{j}", "sumstats") for j in range(2)])
+        queued_at[f"light-{i}"] = time.perf_counter()
+
+    total = heavy_jobs + light_users * 2
+    seen = 0
+    while len(backend.started) < total or scheduler.tasks:
+        for user, _ in backend.started[seen:]:
+            waits.setdefault(user, []).append(time.perf_counter() - queued_at[user])
+        seen = len(backend.started)
+        await asyncio.sleep(job_seconds / 20)
+    elapsed = time.perf_counter() - start
+    task.cancel()
+    light_waits = [wait for user, user_waits in waits.items() if user != "heavy" for wait in user_waits]
+    return {"throughput": total / elapsed, "elapsed": elapsed,
+            "light_p50": statistics.median(light_waits) if light_waits else 0,
+            "light_max": max(light_waits, default=0), "heavy_max": max(waits.get("heavy", [0]))}
+
+
+@app.command()
+def run(heavy_jobs: int = 200, light_users: int = 10, max_running: int = 20, job_seconds: float = 0.2):
+    """
+    One user queues a large sweep just before others queue a couple of analyses each, run against the fake
+    backend with and without a per-user limit.  Shows how long the light users wait to start and what the
+    limits cost in throughput.
+    """
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['DIG_JOB_SERVER_DB'] = f"sqlite:///{db_path}"
+    from sqlalchemy import text
+    from job_server import sqlite_schema
+    from job_server.database import get_db
+
+    with get_db() as connection:
+        sqlite_schema.create_schema(connection)
+    print(f"{heavy_jobs} heavy jobs, {light_users} light users, {max_running} slots, ~{job_seconds}s jobs")
+    print(f"{'per user':>9} {'jobs/s':>9} {'total s':>9} {'light p50':>10} {'light max':>10} {'heavy max':>10}")
+    for per_user in (max_running, max(1, max_running // 4)):
+        with get_db() as connection:
+            connection.execute(text("DELETE FROM dataset_jobs"))
+            connection.commit()
+        result = asyncio.run(run_schedule(heavy_jobs, light_users, max_running, per_user, job_seconds))
+        print(f"{per_user:9d} {result['throughput']:9.1f} {result['elapsed']:9.1f} {result['light_p50']:10.2f} "
+              f"{result['light_max']:10.2f} {result['heavy_max']:10.2f}")
+
+
+if __name__ == "__main__":
+    app()
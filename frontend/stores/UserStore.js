@@ -120,6 +120,32 @@ export const useUserStore = defineStore("UserStore", {
             );
             return data;
         },
+        async createMultipartUpload(fileName, dataset, size) {
+            const { data } = await this.axios.post(
+                `/api/multipart-upload/${dataset}`,
+                JSON.stringify({ filename: fileName, size }),
+            );
+            return data;
+        },
+        async getPartUrls(fileName, dataset, uploadId, partNumbers) {
+            const { data } = await this.axios.post(
+                `/api/multipart-upload/${dataset}/${uploadId}/part-urls`,
+                JSON.stringify({ filename: fileName, part_numbers: partNumbers }),
+            );
+            return data.urls;
+        },
+        async listUploadedParts(fileName, dataset, uploadId) {
+            const { data } = await this.axios.get(
+                `/api/multipart-upload/${dataset}/${uploadId}/parts`,
+                { params: { filename: fileName } },
+            );
+            return data.parts;
+        },
+        async abortMultipartUpload(fileName, dataset, uploadId) {
+            await this.axios.delete(`/api/multipart-upload/${dataset}/${uploadId}`, {
+                params: { filename: fileName },
+            });
+        },
         async finalizeUpload(dataset) {
             console.log(JSON.stringify(dataset));
             await this.axios.post(
@@ -137,10 +163,28 @@ export const useUserStore = defineStore("UserStore", {
         async deleteDataset(dataset) {
             await this.axios.delete(`/api/delete-dataset/${dataset}`);
         },
+        async deleteDatasets(datasets) {
+            const { data } = await this.axios.post(
+                "/api/delete-datasets",
+                JSON.stringify({ datasets }),
+            );
+            return data;
+        },
         async getLogInfo(job_id) {
             const { data } = await this.axios.get(`/api/log-info/${job_id}`);
             return data;
         },
+        async getLog(job_id, params) {
+            const { data, headers } = await this.axios.get(`/api/log/${job_id}`, {
+                params,
+                responseType: "text",
+            });
+            return {
+                text: data,
+                firstLine: Number(headers["x-log-first-line"] ?? 0),
+                totalLines: Number(headers["x-log-lines"] ?? 0),
+            };
+        },
     },
 });
 
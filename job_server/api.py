@@ -1,37 +1,51 @@
 import asyncio
-import io
 import json
+import os
 import re
-from asyncio import Queue
-from functools import lru_cache
-from typing import Optional, Dict
+import uuid
+import zlib
+from typing import Optional
 
 import fastapi
-import pandas as pd
 from botocore.exceptions import ClientError
 from fastapi import Depends, HTTPException, Header, UploadFile, Query, BackgroundTasks
 from sse_starlette import EventSourceResponse
 from starlette.requests import Request
-from starlette.responses import Response, JSONResponse
-
-from job_server import s3, file_utils, batch, database_utils
-from job_server.auth_backend import AuthBackend
-from job_server.database import get_db
-from job_server.jwt_utils import create_access_token, get_decoded_jwt_data
-from job_server.model import UserCredentials, User, DatasetInfo, AnalysisRequest, AnalysisMethod
+from starlette.responses import Response, JSONResponse, StreamingResponse
+
+from job_server import s3, file_utils, database_utils, streaming, job_logs, metrics, deletion, scheduler, uploads
+from job_server.results_cache import results_cache, RESULTS_COLUMNS
+from job_server.results_query import ResultsQuery
+from job_server.status_hub import status_hub, is_terminal
+from job_server.auth_backend import AuthBackend, LoginSaturated, LoginTimedOut, get_auth_backend, password_verifier
+from job_server.database import engine, get_db, query_stats, run_db
+from job_server.jwt_utils import create_access_token, verify_token
+from job_server.model import UserCredentials, User, DatasetInfo, AnalysisRequest, \
+    MultipartUploadRequest, PartUrlsRequest, CompleteUploadRequest, BulkDeleteRequest, \
+    BulkAnalysisRequest
 
 router = fastapi.APIRouter()
 JOB_SERVER_AUTH_COOKIE = 'js_auth'
-
-def get_auth_backend() -> AuthBackend:
-    # Replace with logic to select the appropriate backend
-    from job_server.auth_mysql import MySQLAuthBackend
-    return MySQLAuthBackend(get_db())
+# presigned part urls handed out per request, a client asks again for the rest
+MAX_PART_URLS = 1000
+MAX_BULK_DELETE = 1000
+MAX_BULK_ANALYSES = 5000
+# users allowed to the /admin endpoints, nobody unless configured
+ADMIN_USERS = {name.strip() for name in os.getenv('JOB_SERVER_ADMIN_USERS', '').split(',') if name.strip()}
 
 
 @router.post("/login")
 async def login(credentials: UserCredentials, auth_backend: AuthBackend = Depends(get_auth_backend)):
-    if not auth_backend.authenticate_user(credentials.username, credentials.password):
+    try:
+        authenticated = await password_verifier.authenticate(auth_backend, credentials.username,
+                                                             credentials.password)
+    except LoginSaturated:
+        raise HTTPException(status_code=429, detail="Too many logins in progress, try again shortly",
+                            headers={"Retry-After": "1"})
+    except LoginTimedOut:
+        raise HTTPException(status_code=503, detail="Login is taking too long, try again shortly",
+                            headers={"Retry-After": "5"})
+    if not authenticated:
         raise HTTPException(status_code=403, detail="Incorrect username or password")
 
     access_token = create_access_token(data={"username": credentials.username})
@@ -39,22 +53,45 @@ async def login(credentials: UserCredentials, auth_backend: AuthBackend = Depend
 
 
 async def get_current_user(authorization: Optional[str] = Header(None), token: Optional[str] = Query(None)):
-
-    if authorization:
-        schema, _, token = authorization.partition(' ')
-        if schema.lower() == 'bearer' and token:
-            data = get_decoded_jwt_data(token)[0]
+    # FastAPI resolves this once per request however many times a route depends on it
+    with metrics.timer('auth').time():
+        if authorization:
+            schema, _, bearer = authorization.partition(' ')
+            if schema.lower() == 'bearer' and bearer:
+                data = verify_token(bearer)
+                if data:
+                    return User(**data)
+
+        if token:
+            data = verify_token(token)
             if data:
                 return User(**data)
 
-    if token:
-        data = get_decoded_jwt_data(token)[0]
-        if data:
-            return User(**data)
-
     raise fastapi.HTTPException(status_code=401, detail='Not logged in')
 
 
+@router.get('/metrics')
+def get_metrics():
+    return metrics.snapshot()
+
+
+def get_admin_user(user: User = Depends(get_current_user)) -> User:
+    if user.username not in ADMIN_USERS:
+        raise fastapi.HTTPException(status_code=403, detail='Not an admin')
+    return user
+
+
+@router.get('/admin/db-stats')
+def get_db_stats(user: User = Depends(get_admin_user)):
+    return query_stats.snapshot(engine.pool)
+
+
+@router.post('/admin/db-stats/reset')
+def reset_db_stats(user: User = Depends(get_admin_user)):
+    query_stats.reset()
+    return Response(status_code=200)
+
+
 @router.get('/is-logged-in')
 def is_logged_in(user: User = Depends(get_current_user)):
     if user:
@@ -66,67 +103,83 @@ def is_logged_in(user: User = Depends(get_current_user)):
 @router.get("/datasets")
 async def get_datasets(user: User = Depends(get_current_user),
                        orderBy: str = Query(None, description="Field to order by"),
-                       orderDir: str = Query(None, description="Sort direction (asc or desc)")):
-    data_set_folders = s3.get_datasets(user.username)
-    jobs_for_user = database_utils.get_jobs_for_user(get_db(), user.username)
-    data_set_metadata = database_utils.get_dataset_metadata(get_db(), user.username)
-
-    # Create the dataset list
-    datasets = [{'dataset': d,
-             'uploaded_at': data_set_metadata.get(d, {}).get('uploaded_at', ''),
-             'ancestry': data_set_metadata.get(d, {}).get('ancestry', ''),
-             'file_name': data_set_metadata.get(d, {}).get('file', ''),
-             'genome_build': data_set_metadata.get(d, {}).get('genome_build', ''),
-             'phenotype': data_set_metadata.get(d, {}).get('phenotype', ''),
-             'uploaded_by': user.username,
-             'status': jobs_for_user.get(database_utils.get_dataset_hash(d, user.username), {}).get('status'),
-             'id': database_utils.get_dataset_hash(d, user.username)
-             } for d in data_set_folders]
-
-    # Sort datasets only if orderBy parameter is provided
-    if orderBy and datasets:
-        try:
-            reverse = orderDir and orderDir.lower() == "desc"
-            datasets.sort(key=lambda x: x.get(orderBy, ""), reverse=reverse)
-        except Exception as e:
-            # Log the error but continue without sorting
-            print(f"Error sorting datasets: {str(e)}")
-
-    return datasets
+                       orderDir: str = Query(None, description="Sort direction (asc or desc)"),
+                       limit: Optional[int] = Query(None, ge=1, description="Maximum number of datasets to return"),
+                       offset: int = Query(0, ge=0, description="Number of datasets to skip")):
+    return await run_db(database_utils.get_catalog, get_db(), user.username, orderBy, orderDir, limit, offset)
 
 @router.get("/log-info/{job_id}")
 async def get_log_info(job_id: str, user: User = Depends(get_current_user)):
-    return database_utils.get_log_info(get_db(), user.username, job_id)
+    return await run_db(database_utils.get_log_info, get_db(), user.username, job_id)
+
+@router.get("/log/{job_id}")
+async def get_log(job_id: str, request: Request,
+                  tail: Optional[int] = Query(None, ge=0, description="Return only the last N lines"),
+                  start_line: Optional[int] = Query(None, ge=0, description="First line to return"),
+                  end_line: Optional[int] = Query(None, ge=0, description="Line to stop before"),
+                  user: User = Depends(get_current_user)):
+    job_log = await run_db(job_logs.load_job_log, get_db(), user.username, job_id)
+    if job_log is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    headers = {'Accept-Ranges': 'bytes', 'X-Log-Lines': str(job_log.total_lines)}
+    status_code = 200
+    range_header = request.headers.get('range')
+
+    if tail is not None or start_line is not None or end_line is not None:
+        if tail is not None:
+            start, end = max(job_log.total_lines - tail, 0), job_log.total_lines
+        else:
+            start, end = start_line or 0, min(end_line if end_line is not None else job_log.total_lines,
+                                              job_log.total_lines)
+        headers['X-Log-First-Line'] = str(start)
+        body = job_log.lines(start, end)
+    elif range_header:
+        try:
+            byte_range = streaming.parse_byte_range(range_header, job_log.total_bytes)
+        except streaming.RangeNotSatisfiable:
+            return Response(status_code=416, headers={'Content-Range': f'bytes */{job_log.total_bytes}'})
+        start, end = byte_range or (0, job_log.total_bytes - 1)
+        if byte_range:
+            headers['Content-Range'] = f'bytes {start}-{end}/{job_log.total_bytes}'
+            status_code = 206
+        headers['Content-Length'] = str(max(end - start + 1, 0))
+        body = job_log.byte_range(start, end)
+    else:
+        headers['Content-Length'] = str(job_log.total_bytes)
+        body = job_log.lines(0, job_log.total_lines)
+    return StreamingResponse(body, status_code=status_code, media_type='text/plain; charset=utf-8', headers=headers)
 
 @router.post("/preview-delimited-file")
 async def preview_file(file: UploadFile):
-    contents = await file.read(100)
-    await file.seek(0)
-
-    if contents.startswith(b'\x1f\x8b'):
-        sample_lines = await file_utils.get_compressed_sample(file)
-    else:
-        sample_lines = await file_utils.get_text_sample(file)
-
-    df = await file_utils.parse_file(io.StringIO('\n'.join(sample_lines)), file.filename)
-    dupes = file_utils.find_dupe_cols(sample_lines[0], ".csv" in file.filename, df.columns)
+    try:
+        sample_lines = await file_utils.read_sample_lines(file)
+    except zlib.error as e:
+        raise fastapi.HTTPException(detail=f"Could not decompress file: {str(e)}", status_code=400)
+    if not sample_lines:
+        raise fastapi.HTTPException(detail="File is empty", status_code=400)
+    delimiter = file_utils.detect_delimiter(sample_lines)
+
+    df = file_utils.parse_sample(sample_lines, delimiter)
+    dupes = file_utils.find_dupe_cols(sample_lines[0], delimiter, df.columns)
     if len(dupes) > 0:
         duped_col_str = ', '.join(set([re.sub(r"\.\d+$", '', dupe) for dupe in dupes]))
         raise fastapi.HTTPException(detail=f"{duped_col_str} specified more than once", status_code=400)
-    return {"columns": [column for column in df.columns], "delimiter": "\t" if ".tsv" in file.filename else ","}
+    return {"columns": [column for column in df.columns], "delimiter": delimiter,
+            "dtypes": file_utils.infer_column_types(df)}
 
 
 def get_s3_path(dataset: str, user: User, filename: str=None) -> str:
     if filename:
-        return f"userdata/{user.username}/genetic/{dataset}/raw/{filename}"
+        return f"{s3.get_upload_path(user.username, dataset)}/{filename}"
     else:
-        return f"userdata/{user.username}/genetic/{dataset}/raw"
+        return s3.get_upload_path(user.username, dataset)
 
 @router.get("/get-pre-signed-url/{dataset}")
 async def get_hermes_pre_signed_url(dataset: str, filename: str = Query(None), user: User = Depends(get_current_user)):
     s3_path = get_s3_path(dataset, user, filename)
     try:
-        presigned_url = s3.generate_presigned_url(
+        presigned_url = await s3.run_async(
+            s3.generate_presigned_url,
             'put_object',
             params={'Bucket': s3.BUCKET_NAME, 'Key': s3_path},
             expires_in=7200
@@ -135,108 +188,253 @@ async def get_hermes_pre_signed_url(dataset: str, filename: str = Query(None), u
         raise fastapi.HTTPException(status_code=500, detail="Failed to generate presigned URL") from e
     return {"presigned_url": presigned_url, "s3_path": s3_path}
 
+@router.post("/multipart-upload/{dataset}")
+async def create_multipart_upload(dataset: str, request: MultipartUploadRequest,
+                                  user: User = Depends(get_current_user)):
+    s3_path = get_s3_path(dataset, user, request.filename)
+    part_size = s3.multipart_part_size(request.size)
+    try:
+        upload_id = await s3.run_async(s3.create_multipart_upload, s3_path)
+    except ClientError as e:
+        raise fastapi.HTTPException(status_code=500, detail="Failed to create multipart upload") from e
+    return {"upload_id": upload_id, "s3_path": s3_path, "part_size": part_size,
+            "part_count": -(-request.size // part_size) if request.size else None}
+
+@router.post("/multipart-upload/{dataset}/{upload_id}/part-urls")
+async def get_part_urls(dataset: str, upload_id: str, request: PartUrlsRequest,
+                        user: User = Depends(get_current_user)):
+    if len(request.part_numbers) > MAX_PART_URLS:
+        raise fastapi.HTTPException(status_code=400, detail=f"At most {MAX_PART_URLS} part urls per request")
+    if any(not 1 <= part_number <= s3.MULTIPART_MAX_PARTS for part_number in request.part_numbers):
+        raise fastapi.HTTPException(status_code=400, detail="Part numbers must be from 1 to 10000")
+    s3_path = get_s3_path(dataset, user, request.filename)
+    try:
+        urls = await s3.run_async(s3.presign_upload_parts, s3_path, upload_id, request.part_numbers, 7200)
+    except ClientError as e:
+        raise fastapi.HTTPException(status_code=500, detail="Failed to generate presigned URLs") from e
+    return {"urls": urls}
+
+@router.get("/multipart-upload/{dataset}/{upload_id}/parts")
+async def list_uploaded_parts(dataset: str, upload_id: str, filename: str = Query(...),
+                              user: User = Depends(get_current_user)):
+    try:
+        parts = await s3.run_async(s3.list_uploaded_parts, get_s3_path(dataset, user, filename), upload_id)
+    except ClientError as e:
+        raise fastapi.HTTPException(status_code=404, detail="Upload not found") from e
+    return {"parts": parts}
+
+@router.post("/multipart-upload/{dataset}/{upload_id}/complete")
+async def complete_multipart_upload(dataset: str, upload_id: str, request: CompleteUploadRequest,
+                                    user: User = Depends(get_current_user)):
+    parts = [part.model_dump() for part in request.parts] if request.parts is not None else None
+    try:
+        await s3.run_async(s3.complete_multipart_upload, get_s3_path(dataset, user, request.filename), upload_id,
+                           parts)
+    except ClientError as e:
+        raise fastapi.HTTPException(status_code=400, detail="Failed to complete multipart upload") from e
+    return Response(status_code=200)
+
+@router.delete("/multipart-upload/{dataset}/{upload_id}")
+async def abort_multipart_upload(dataset: str, upload_id: str, filename: str = Query(...),
+                                 user: User = Depends(get_current_user)):
+    try:
+        await s3.run_async(s3.abort_multipart_upload, get_s3_path(dataset, user, filename), upload_id)
+    except ClientError as e:
+        raise fastapi.HTTPException(status_code=404, detail="Upload not found") from e
+    return Response(status_code=200)
+
 @router.post("/finalize-upload")
 async def finalize_upload(request: DatasetInfo, background_tasks: BackgroundTasks, user: User = Depends(get_current_user)):
     s3_path = get_s3_path(request.name, user)
-    s3.upload_metadata(request, s3_path)
-    if not database_utils.insert_dataset(get_db(), user.username, request):
+    if request.upload_id:
+        parts = [part.model_dump() for part in request.parts] if request.parts is not None else None
+        try:
+            await s3.run_async(s3.complete_multipart_upload, f"{s3_path}/{request.file}", request.upload_id, parts)
+        except ClientError as e:
+            raise fastapi.HTTPException(status_code=400, detail="Failed to complete multipart upload") from e
+        request.upload_id, request.parts = None, None
+    if not await run_db(database_utils.insert_dataset, get_db(), user.username, request):
         raise fastapi.HTTPException(status_code=409, detail="Failed to insert dataset")
-    await start_job(user, request.name, AnalysisMethod.sumstats.value, background_tasks)
-    return Response(status_code=200)
+    # checking a large file takes minutes, the outcome is the status of the dataset's validation job
+    await run_db(database_utils.log_job_start, get_db(), user.username, request.name,
+                 database_utils.VALIDATING_STATUS, database_utils.VALIDATION_METHOD)
+    background_tasks.add_task(uploads.process_upload, user.username, request)
+    return Response(status_code=202)
 
 @router.delete("/delete-dataset/{dataset}")
-async def delete_dataset(dataset: str, user: User = Depends(get_current_user)):
-    s3_path = get_s3_path(dataset, user).replace('/raw', '')
-    s3.clear_dir(s3_path)
-    database_utils.delete_dataset(get_db(), user.username, dataset)
+async def delete_dataset(dataset: str, background_tasks: BackgroundTasks, user: User = Depends(get_current_user)):
+    await run_db(database_utils.mark_datasets_deleting, get_db(), user.username, [dataset])
+    background_tasks.add_task(deletion.delete_datasets, user.username, [dataset], uuid.uuid4().hex)
     return Response(status_code=200)
 
-job_queues: Dict[str, Queue] = {}
+@router.post("/delete-datasets")
+async def delete_datasets(request: BulkDeleteRequest, background_tasks: BackgroundTasks,
+                          user: User = Depends(get_current_user)):
+    """
+    Hides the datasets straight away and purges their files in the background.  Progress is published for each
+    dataset's job id, and for the returned delete_id as a whole, on /job-status and /job-events.
+    """
+    datasets = list(dict.fromkeys(request.datasets))
+    if not datasets or len(datasets) > MAX_BULK_DELETE:
+        raise fastapi.HTTPException(status_code=400, detail=f"Between 1 and {MAX_BULK_DELETE} datasets")
+    await run_db(database_utils.mark_datasets_deleting, get_db(), user.username, datasets)
+    delete_id = uuid.uuid4().hex
+    background_tasks.add_task(deletion.delete_datasets, user.username, datasets, delete_id)
+    return JSONResponse(status_code=202, content={"delete_id": delete_id, "datasets": datasets})
 
 @router.get("/job-status/{job_id}")
-async def job_status(job_id: str):
-    if job_id not in job_queues:
-        job_queues[job_id] = Queue()
+async def job_status(job_id: str, last_event_id: Optional[int] = Header(None)):
 
     async def event_generator():
-        try:
-            while True:
-                try:
-                    if job_id not in job_queues:
-                        status = database_utils.get_job_status(get_db(), job_id)
-                        yield {
-                            "event": "message",
-                            "data": json.dumps({
-                                "status": status,
-                                "dataset": job_id,
-                            })
-                        }
-                        break
-                    data = await asyncio.wait_for(job_queues[job_id].get(), timeout=30.0)
-                    yield {
-                        "event": "message",
-                        "data": json.dumps(data)
-                    }
-                    if data["status"].endswith("SUCCEEDED") or data["status"].endswith("FAILED"):
-                        break
-                except asyncio.TimeoutError:
-                    yield {
-                        "event": "keepalive",
-                        "data": ""
-                    }
-        finally:
-            if job_queues.get(job_id) and job_queues[job_id].empty():
-                del job_queues[job_id]
-
-    return EventSourceResponse(event_generator())
-
-async def start_job(user: User, dataset: str, method: str, background_tasks: BackgroundTasks):
-    database_utils.log_job_start(get_db(), user.username, dataset, f"RUNNING {method}")
-    background_tasks.add_task(batch.submit_and_await_job, {
-        'jobName': 'dig-ldsc-methods',
-        'jobQueue': 'ldsc-methods-job-queue',
-        'jobDefinition': 'dig-ldsc-methods',
-        'parameters': {
-            'username': user.username,
-            'dataset': dataset,
-            'method': method
-        }}, user.username, dataset, method, job_queues)
+        # subscribe before reading the current status so nothing published in between is lost
+        async with status_hub.subscribe(f"job:{job_id}", last_event_id) as subscription:
+            # ids without a job row, like a bulk delete's, only have events to send.  The stored status is read on
+            # reconnects too, the replay may not reach back far enough or the hub may have restarted, and it
+            # supersedes the replayed events
+            status = await run_db(database_utils.get_job_status, get_db(), job_id)
+            if status is not None:
+                subscription.skip_replayed()
+                yield {
+                    "event": "message",
+                    "data": json.dumps({
+                        "status": status,
+                        "dataset": job_id,
+                    })
+                }
+                if is_terminal(status):
+                    return
+            async for event_id, data in subscription:
+                yield {
+                    "event": "message",
+                    "id": str(event_id),
+                    "data": json.dumps(data)
+                }
+                if is_terminal(data["status"]):
+                    break
+
+    return EventSourceResponse(event_generator(), ping=30)
+
+@router.get("/job-events")
+async def job_events(user: User = Depends(get_current_user)):
+    """
+    One stream per user carrying status changes for all of their jobs, starting with a snapshot of every job.
+    A reconnecting client gets a new snapshot rather than a replay from its Last-Event-ID: the replay window is
+    short and shared with queue positions, and the in-process hub's ids start over when the server restarts.
+    """
+
+    async def event_generator():
+        async with status_hub.subscribe(f"user:{user.username}") as subscription:
+            jobs = await run_db(database_utils.get_jobs_for_user, get_db(), user.username)
+            yield {
+                "event": "snapshot",
+                "data": json.dumps(jobs, default=str)
+            }
+            async for event_id, data in subscription:
+                yield {
+                    "event": "message",
+                    "id": str(event_id),
+                    "data": json.dumps(data)
+                }
+
+    return EventSourceResponse(event_generator(), ping=30)
+
+async def start_job(user: User, dataset: str, method: str):
+    await start_jobs(user, [(dataset, method)], scheduler.SINGLE_PRIORITY)
+
+async def start_jobs(user: User, jobs: list, priority: int = scheduler.BULK_PRIORITY, bulk: bool = False):
+    unvalidated = await run_db(database_utils.get_unvalidated_datasets, get_db(), user.username,
+                               [dataset for dataset, _ in jobs])
+    if unvalidated:
+        raise fastapi.HTTPException(status_code=409,
+                                    detail=f"Not validated yet, or rejected: {', '.join(sorted(unvalidated))}")
+    for dataset, _ in jobs:
+        results_cache.invalidate(get_s3_results_path(dataset, user))
+    # queued, the scheduler hands them to Batch as the user's and the server's limits allow
+    await scheduler.scheduler.enqueue(user.username, jobs, priority, bulk)
 
 @router.post("/start-analysis")
-async def start_analysis(request: AnalysisRequest, background_tasks: BackgroundTasks,
-                         user: User = Depends(get_current_user)):
+async def start_analysis(request: AnalysisRequest, user: User = Depends(get_current_user)):
     job_id = database_utils.get_dataset_hash(request.dataset, user.username)
-    if job_id not in job_queues:
-        job_queues[job_id] = Queue()
-    await start_job(user, request.dataset, request.method.value, background_tasks)
+    await start_job(user, request.dataset, request.method.value)
     return {"job_id": job_id}
 
+@router.post("/start-analyses")
+async def start_analyses(request: BulkAnalysisRequest, user: User = Depends(get_current_user)):
+    """
+    Queues many analyses with one request, released to Batch as array jobs when an array job
+    definition is configured.  Returns the job id of each dataset.
+    """
+    jobs = [(job.dataset, job.method.value) for job in request.jobs]
+    datasets = [dataset for dataset, _ in jobs]
+    if not jobs or len(jobs) > MAX_BULK_ANALYSES:
+        raise fastapi.HTTPException(status_code=400, detail=f"Between 1 and {MAX_BULK_ANALYSES} analyses")
+    if len(set(datasets)) < len(datasets):
+        raise fastapi.HTTPException(status_code=400, detail="Each dataset can only be analysed once per request")
+    await start_jobs(user, jobs, bulk=True)
+    return {"job_ids": {dataset: database_utils.get_dataset_hash(dataset, user.username) for dataset in datasets}}
+
 
 def get_s3_results_path(dataset: str, user: User) -> str:
-    return f"userdata/{user.username}/genetic/{dataset}/sldsc/sldsc"
+    return s3.get_results_path(user.username, dataset)
 
 @router.get("/download/{dataset}")
-async def download_hermes_file(dataset: str, user: User = Depends(get_current_user)):
+async def download_hermes_file(dataset: str, request: Request, user: User = Depends(get_current_user)):
     s3_path = get_s3_results_path(dataset, user)
-    df = get_cached_results(s3_path)
-    return Response(content=df.to_csv(sep='\t', index=False),
-                       media_type='text/tab-separated-values',
-                       headers={
-                           'Content-Disposition': f'attachment; filename="{dataset}_results.tsv"'
-                       })
-
-
-@lru_cache(maxsize=16)
-def get_cached_results(s3_path: str) -> pd.DataFrame:
+    headers = {
+        'Content-Disposition': f'attachment; filename="{dataset}_results.tsv"',
+        'Accept-Ranges': 'bytes',
+        'Vary': 'Accept-Encoding'
+    }
+    range_header = request.headers.get('range')
+    gzip = streaming.accepts_gzip(request.headers.get('accept-encoding')) and not range_header
+
+    # stream the stored object through, the only thing it lacks is the header row, so every response for the
+    # same object has the same bytes, ETag and length whether or not the results are cached in memory
+    header = ('\t'.join(RESULTS_COLUMNS) + '\n').encode('utf-8')
     try:
-        wrapped_text = io.TextIOWrapper(s3.get_results(s3_path)['Body'])
-        df = pd.read_csv(wrapped_text, sep='\t',
-                         names=['annotation', 'tissue', 'biosample', 'enrichment', 'pValue'])
-        df['pValue'] = pd.to_numeric(df['pValue'])
-        return df
+        s3_head = await s3.run_async(s3.get_results_head, s3_path)
+    except ClientError as e:
+        raise fastapi.HTTPException(status_code=500, detail="Failed to fetch tissue results") from e
+    size = len(header) + s3_head['ContentLength']
+    try:
+        byte_range = streaming.parse_byte_range(range_header, size)
+    except streaming.RangeNotSatisfiable:
+        return Response(status_code=416, headers={'Content-Range': f'bytes */{size}'})
+    start, end = byte_range or (0, size - 1)
+    headers['ETag'] = s3_head['ETag']
+    if byte_range:
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    if not gzip:
+        headers['Content-Length'] = str(end - start + 1)
+    body = stream_results_object(s3_path, header, start, end)
+    status_code = 206 if byte_range else 200
+
+    if gzip:
+        headers['Content-Encoding'] = 'gzip'
+        body = streaming.gzip_stream(body)
+    return StreamingResponse(body, status_code=status_code, media_type='text/tab-separated-values',
+                             headers=headers)
+
+
+def stream_results_object(s3_path: str, header: bytes, start: int, end: int):
+    if start < len(header):
+        yield header[start:end + 1]
+    body_start, body_end = max(start - len(header), 0), end - len(header)
+    if body_end >= body_start:
+        yield from streaming.iter_body(s3.get_results(s3_path, f'bytes={body_start}-{body_end}')['Body'])
+
+
+def get_cached_results(s3_path: str) -> ResultsQuery:
+    try:
+        return results_cache.get(s3_path)
     except ClientError as e:
         raise fastapi.HTTPException(status_code=500, detail="Failed to fetch tissue results") from e
 
+
+@router.get("/admin/results-cache")
+async def get_results_cache_stats(user: User = Depends(get_admin_user)):
+    return results_cache.stats()
+
 @router.get("/results/{dataset}")
 async def get_results(
         dataset: str,
@@ -250,7 +448,7 @@ async def get_results(
     s3_path = get_s3_results_path(dataset, user)
 
     try:
-        df = get_cached_results(s3_path)
+        query = await s3.run_async(get_cached_results, s3_path)
 
         filter_params = {}
         for param, value in request.query_params.items():
@@ -258,50 +456,7 @@ async def get_results(
                 column_name = param.replace("filter_", "")
                 filter_params[column_name] = value
 
-        for column, value in filter_params.items():
-            if column in df.columns:
-                if df[column].dtype.kind in 'ifc':
-                    try:
-                        if value.startswith(">="):
-                            df = df[df[column] >= float(value[2:])]
-                        elif value.startswith("<="):
-                            df = df[df[column] <= float(value[2:])]
-                        elif value.startswith(">"):
-                            df = df[df[column] > float(value[1:])]
-                        elif value.startswith("<"):
-                            df = df[df[column] < float(value[1:])]
-                        else:
-                            df = df[df[column] == float(value)]
-                    except ValueError:
-                        pass
-                else:
-                    if value.startswith("eq:"):
-                        df = df[df[column].astype(str).str.lower() == value[3:].lower()]
-                    elif value.startswith("contains:"):
-                        df = df[df[column].astype(str).str.contains(value[9:], case=False, na=False)]
-                    else:
-                        df = df[df[column].astype(str).str.contains(value, case=False, na=False)]
-
-        if sort_field:
-            ascending = sort_order == 1
-            df = df.sort_values(by=sort_field, ascending=ascending)
-        else:
-            df = df.sort_values(by='pValue')
-
-        total_records = len(df)
-        tissues = df['tissue'].unique().tolist()
-        biosamples = df['biosample'].unique().tolist()
-        annotations = df['annotation'].unique().tolist()
-        df = df.iloc[first:first + rows]
-        results = df.to_dict('records')
-
-        return JSONResponse({
-            "items": results,
-            "totalRecords": total_records,
-            "tissues": tissues,
-            "biosamples": biosamples,
-            "annotations": annotations
-        })
+        return JSONResponse(query.page(filter_params, first, rows, sort_field, sort_order == 1))
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,7 +1,217 @@
 # job_server/auth_backend.py
+import asyncio
+import os
+import threading
+import time
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from job_server import metrics
+
+# password hashing is CPU bound, so one worker per core; bcrypt and pbkdf2 both release the GIL while hashing
+LOGIN_WORKERS = int(os.getenv('JOB_SERVER_LOGIN_WORKERS', os.cpu_count() or 2))
+# logins allowed to wait for a worker before more are turned away
+LOGIN_QUEUE_LIMIT = int(os.getenv('JOB_SERVER_LOGIN_QUEUE_LIMIT', 32))
+LOGIN_TIMEOUT = float(os.getenv('JOB_SERVER_LOGIN_TIMEOUT', 30))
+# how long a looked up user, or the absence of one, is trusted before the database is asked again.  Users are
+# added outside the server (scripts/db_ops.py), so an unknown username is only trusted briefly: long enough to
+# absorb a burst against made up names, short enough that someone just added can log in straight away
+USER_CACHE_SECONDS = float(os.getenv('JOB_SERVER_AUTH_USER_CACHE_SECONDS', 60))
+UNKNOWN_USER_CACHE_SECONDS = float(os.getenv('JOB_SERVER_AUTH_UNKNOWN_USER_CACHE_SECONDS', 5))
+USER_CACHE_SIZE = int(os.getenv('JOB_SERVER_AUTH_USER_CACHE_SIZE', 10000))
+# successful logins are written to users.last_login together, at most this long after they happen
+LAST_LOGIN_FLUSH_SECONDS = float(os.getenv('JOB_SERVER_LAST_LOGIN_FLUSH_SECONDS', 5))
+
+
+class UserCache:
+    """
+    Bounded LRU of password hashes by username, with None recorded for usernames that don't exist so a burst of
+    attempts against made up names is answered without the database.
+    """
+    __slots__ = ('max_size', 'known_seconds', 'unknown_seconds', 'entries', 'lock')
+
+    def __init__(self, max_size: int = USER_CACHE_SIZE, known_seconds: float = USER_CACHE_SECONDS,
+                 unknown_seconds: float = UNKNOWN_USER_CACHE_SECONDS):
+        self.max_size = max_size
+        self.known_seconds = known_seconds
+        self.unknown_seconds = unknown_seconds
+        self.entries: OrderedDict[str, tuple] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, username: str) -> tuple[bool, Optional[str]]:
+        with self.lock:
+            entry = self.entries.get(username)
+            if entry is None or entry[1] <= time.monotonic():
+                self.entries.pop(username, None)
+                return False, None
+            self.entries.move_to_end(username)
+            return True, entry[0]
+
+    def put(self, username: str, password_hash: Optional[str]):
+        ttl = self.known_seconds if password_hash is not None else min(self.unknown_seconds, self.known_seconds)
+        with self.lock:
+            self.entries[username] = (password_hash, time.monotonic() + ttl)
+            self.entries.move_to_end(username)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class LastLoginWriter:
+    """
+    Collects usernames that logged in and hands them to write in one batch, flush_seconds after the first.
+    """
+    __slots__ = ('write', 'flush_seconds', 'pending', 'timer', 'lock')
+
+    def __init__(self, write, flush_seconds: float = LAST_LOGIN_FLUSH_SECONDS):
+        self.write = write
+        self.flush_seconds = flush_seconds
+        self.pending = set()
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def record(self, username: str):
+        with self.lock:
+            self.pending.add(username)
+            if self.timer is None:
+                self.timer = threading.Timer(self.flush_seconds, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            usernames, self.pending = self.pending, set()
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        if not usernames:
+            return
+        try:
+            self.write(sorted(usernames))
+        except Exception as e:
+            print(f"Error recording last login: {str(e)}")
+
 
 class AuthBackend(ABC):
-    @abstractmethod
+    """
+    Checks passwords against hashes a subclass looks up, caching lookups and batching last_login writes.
+    Backends are built once by get_auth_backend and shared by every login.
+    """
+
+    def __init__(self):
+        self.users = UserCache()
+        self.last_logins = LastLoginWriter(self.write_last_logins)
+
     def authenticate_user(self, username: str, password: str) -> bool:
+        found, password_hash = self.users.get(username)
+        if found:
+            metrics.increment('auth.user_cache.hits')
+        else:
+            metrics.increment('auth.user_cache.misses')
+            password_hash = self.get_password_hash(username)
+            self.users.put(username, password_hash)
+        if not password_hash or not self.check_password(password, password_hash):
+            return False
+        self.last_logins.record(username)
+        return True
+
+    @abstractmethod
+    def get_password_hash(self, username: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    def check_password(self, password: str, password_hash: str) -> bool:
         pass
+
+    def write_last_logins(self, usernames: list):
+        pass
+
+    def close(self):
+        self.last_logins.flush()
+
+
+def create_auth_backend(backend: str = os.getenv('JOB_SERVER_AUTH_BACKEND', 'mysql')) -> AuthBackend:
+    if backend == 'mysql':
+        from job_server.auth_mysql import MySQLAuthBackend
+        return MySQLAuthBackend()
+    if backend == 'sqlite':
+        from job_server.auth_sql_lite import SQLiteAuthBackend
+        return SQLiteAuthBackend(os.getenv('JOB_SERVER_AUTH_SQLITE_PATH', 'users.db'))
+    raise ValueError(f"Unknown auth backend {backend}")
+
+
+_auth_backend = None
+_auth_backend_lock = threading.Lock()
+
+
+def get_auth_backend() -> AuthBackend:
+    global _auth_backend
+    with _auth_backend_lock:
+        if _auth_backend is None:
+            _auth_backend = create_auth_backend()
+        return _auth_backend
+
+
+def close_auth_backend():
+    with _auth_backend_lock:
+        if _auth_backend is not None:
+            _auth_backend.close()
+
+
+class LoginSaturated(Exception):
+    pass
+
+
+class LoginTimedOut(Exception):
+    pass
+
+
+class PasswordVerifier:
+    """
+    Runs AuthBackend.authenticate_user, lookup and hash check both, on a bounded pool off the event loop.
+    Once workers + queue_limit logins are in flight further ones fail fast with LoginSaturated instead of
+    queueing behind seconds of hashing.  A login still unanswered after timeout fails with LoginTimedOut, but
+    keeps its place in flight until its check has actually finished.
+    """
+
+    def __init__(self, workers: int = LOGIN_WORKERS, queue_limit: int = LOGIN_QUEUE_LIMIT,
+                 timeout: float = LOGIN_TIMEOUT):
+        self.limit = workers + queue_limit
+        self.timeout = timeout
+        self.in_flight = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='login')
+
+    async def authenticate(self, backend: AuthBackend, username: str, password: str) -> bool:
+        # checked and counted without awaiting in between, so the event loop makes this atomic
+        if self.in_flight >= self.limit:
+            metrics.increment('login.rejected')
+            raise LoginSaturated()
+        self.in_flight += 1
+        try:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, backend.authenticate_user,
+                                                                username, password)
+        except Exception:
+            self.in_flight -= 1
+            raise
+        # released when the check finishes, not when we stop waiting for it, since a worker is busy until then
+        future.add_done_callback(self._finished)
+        with metrics.timer('login').time():
+            try:
+                return bool(await asyncio.wait_for(asyncio.shield(future), self.timeout))
+            except asyncio.TimeoutError:
+                metrics.increment('login.timed_out')
+                raise LoginTimedOut()
+
+    def _finished(self, future: asyncio.Future):
+        self.in_flight -= 1
+        if not future.cancelled():
+            # retrieved so a check nobody waited for doesn't log an unhandled exception
+            future.exception()
+
+
+password_verifier = PasswordVerifier()
@@ -1,13 +1,30 @@
-from sqlalchemy import text
+from typing import Optional
+
+from sqlalchemy import text, bindparam
 from job_server.auth_backend import AuthBackend
+from job_server.database import get_db
 import bcrypt
 
 class MySQLAuthBackend(AuthBackend):
-    def __init__(self, db):
-        self.db = db
+    """
+    Users in the job server's own users table, reached through the shared SQLAlchemy connection pool.
+    """
+    def __init__(self, db_factory=get_db):
+        super().__init__()
+        self.db_factory = db_factory
 
-    def authenticate_user(self, username: str, password: str) -> bool:
-        with self.db as connection:
+    def get_password_hash(self, username: str) -> Optional[str]:
+        with self.db_factory() as connection:
             query = text("SELECT password FROM users WHERE user_name = :username")
-            db_password = connection.execute(query, {"username": username}).fetchone()
-            return db_password and bcrypt.checkpw(password.encode('utf-8'), db_password[0].encode('utf-8'))
+            row = connection.execute(query, {"username": username}).fetchone()
+            return row[0] if row else None
+
+    def check_password(self, password: str, password_hash: str) -> bool:
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+    def write_last_logins(self, usernames: list):
+        with self.db_factory() as connection:
+            query = text("UPDATE users SET last_login = NOW() WHERE user_name IN :usernames") \
+                .bindparams(bindparam('usernames', expanding=True))
+            connection.execute(query, {"usernames": usernames})
+            connection.commit()
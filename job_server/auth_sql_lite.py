@@ -1,19 +1,35 @@
+import queue
 import sqlite3
+from typing import Optional
+
 from job_server.auth_backend import AuthBackend
 from werkzeug.security import check_password_hash
 
 class SQLiteAuthBackend(AuthBackend):
-    def __init__(self, db_path):
+    """
+    Users in a standalone sqlite file with werkzeug password hashes.  Connections are kept for reuse, up to
+    pool_size of them; the file has no last_login column, so logins aren't recorded.
+    """
+    def __init__(self, db_path, pool_size: int = 4):
+        super().__init__()
         self.db_path = db_path
+        self.connections = queue.LifoQueue(maxsize=pool_size)
 
-    def authenticate_user(self, username, password):
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT password_hash FROM users WHERE username = ?", (username,))
-        result = cursor.fetchone()
-        conn.close()
+    def get_password_hash(self, username) -> Optional[str]:
+        try:
+            conn = self.connections.get_nowait()
+        except queue.Empty:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        try:
+            result = conn.execute("SELECT password_hash FROM users WHERE username = ?", (username,)).fetchone()
+        except sqlite3.Error:
+            conn.close()
+            raise
+        try:
+            self.connections.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+        return result[0] if result else None
 
-        if result:
-            stored_password_hash = result[0]
-            return check_password_hash(stored_password_hash, password)
-        return False
+    def check_password(self, password, password_hash) -> bool:
+        return check_password_hash(password_hash, password)
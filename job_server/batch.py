@@ -1,41 +1,367 @@
 import asyncio
+import json
+import os
+import threading
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 
 import boto3
+from botocore.config import Config
 
-from job_server import database_utils
-from job_server.database import get_db
+from job_server import database_utils, s3
+from job_server.job_logs import LogChunkWriter
+from job_server.database import get_db, run_db
+from job_server.results_cache import results_cache
+from job_server.status_hub import publish_job_status
+from job_server.utils import run_in_executor
 
 S3_REGION = 'us-east-1'
+JOB_NAME = 'dig-ldsc-methods'
+JOB_QUEUE = 'ldsc-methods-job-queue'
+JOB_DEFINITION = 'dig-ldsc-methods'
+LOG_GROUP_NAME = '/aws/batch/job'
+TERMINAL_STATUSES = {'SUCCEEDED', 'FAILED'}
+# describe_jobs accepts at most 100 job ids per call
+DESCRIBE_BATCH_SIZE = 100
+MIN_POLL_SECONDS = float(os.getenv('JOB_SERVER_BATCH_MIN_POLL_SECONDS', 5))
+MAX_POLL_SECONDS = float(os.getenv('JOB_SERVER_BATCH_MAX_POLL_SECONDS', 60))
+# job definition whose command reads its entry of a manifest; jobs are submitted one by one unless it is set,
+# since JOB_DEFINITION expects a dataset and method of its own
+ARRAY_JOB_DEFINITION = os.getenv('JOB_SERVER_BATCH_ARRAY_JOB_DEFINITION', '')
+# children per array job; Batch allows 2 to 10000, smaller arrays keep one bad submission from failing them all
+ARRAY_SIZE = min(int(os.getenv('JOB_SERVER_BATCH_ARRAY_SIZE', 1000)), 10000)
+# starts the batch_job_id of jobs execution.LocalBackend runs on the server instead
+LOCAL_JOB_PREFIX = 'local-'
+# consecutive describe_jobs calls that don't return a job before we stop waiting on it
+MAX_MISSING_POLLS = 3
+# also store the log of running jobs each time they are polled, not just once they finish
+CAPTURE_RUNNING_LOGS = os.getenv('JOB_SERVER_CAPTURE_RUNNING_LOGS', 'false').lower() == 'true'
 
-async def submit_and_await_job(job_config, user, dataset, method, job_queues):
-    batch_client = boto3.client('batch', region_name=S3_REGION)
-
-    response = batch_client.submit_job(**job_config)
-    job_id = response['jobId']
-    logs_client = boto3.client('logs', region_name=S3_REGION)
-    while True:
-        response = batch_client.describe_jobs(jobs=[job_id])
-        job_status = response['jobs'][0]['status']
-        if job_status in ['SUCCEEDED', 'FAILED']:
-            log_stream_name = response['jobs'][0]['container']['logStreamName']
-            log_group_name = '/aws/batch/job'
-            log_events = logs_client.get_log_events(
-                logGroupName=log_group_name,
-                logStreamName=log_stream_name
-            )
-            log_messages = [event['message'] for event in log_events['events']]
-            complete_log = '\n'.join(log_messages)
-            status = f"{method} {job_status}"
-            database_utils.log_job_end(get_db(), user, dataset, status, complete_log)
-            job_id = database_utils.get_dataset_hash(dataset, user)
-            if job_id in job_queues:
-                await job_queues[job_id].put({
-                    "status": status,
-                    "dataset": dataset,
-                    "method": method
-                })
+_clients = {}
+_clients_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='batch')
+
+
+def get_client(service: str):
+    with _clients_lock:
+        if service not in _clients:
+            _clients[service] = boto3.client(service, region_name=S3_REGION,
+                                             config=Config(retries={'max_attempts': 5, 'mode': 'adaptive'}))
+        return _clients[service]
+
+
+class LogCapture:
+    """
+    Follows a CloudWatch log stream page by page to its end, writing each page into the job's log chunks as it
+    arrives so memory stays flat however long the log is.  Calling capture again carries on from where the
+    last call stopped.
+    """
+    __slots__ = ('log_stream_name', 'next_token', 'writer')
+
+    def __init__(self, job_id: str, log_stream_name: str):
+        self.log_stream_name = log_stream_name
+        self.next_token = None
+        self.writer = LogChunkWriter(job_id)
+
+    def capture(self, logs_client) -> int:
+        captured = 0
+        while True:
+            params = {'logGroupName': LOG_GROUP_NAME, 'logStreamName': self.log_stream_name, 'startFromHead': True}
+            if self.next_token:
+                params['nextToken'] = self.next_token
+            response = logs_client.get_log_events(**params)
+            self.writer.write([event['message'] for event in response['events']])
+            captured += len(response['events'])
+            # CloudWatch hands back the token it was given once there is nothing further
+            at_end = response['nextForwardToken'] == self.next_token
+            self.next_token = response['nextForwardToken']
+            if at_end:
+                break
+        self.writer.flush()
+        return captured
+
+
+class TrackedJob:
+    __slots__ = ('batch_job_id', 'user', 'dataset', 'method', 'status', 'submitted_at',
+                 'next_poll', 'missing_polls', 'done', 'log_capture')
+
+    def __init__(self, batch_job_id, user, dataset, method, done, age_seconds=0):
+        self.batch_job_id = batch_job_id
+        self.user = user
+        self.dataset = dataset
+        self.method = method
+        self.status = 'SUBMITTED'
+        self.submitted_at = time.monotonic() - age_seconds
+        self.next_poll = self.submitted_at + MIN_POLL_SECONDS
+        self.missing_polls = 0
+        self.done = done
+        self.log_capture = None
+
+
+class BatchMonitor:
+    """
+    Watches every in-flight Batch job from a single task, describing them in batches of up to 100.
+    Jobs are polled often right after submission and less often the longer they run.
+    """
+
+    def __init__(self, batch_client=None, logs_client=None, min_poll_seconds=MIN_POLL_SECONDS,
+                 max_poll_seconds=MAX_POLL_SECONDS, autostart=True, capture_running_logs=CAPTURE_RUNNING_LOGS):
+        self._batch_client = batch_client
+        self._logs_client = logs_client
+        self.min_poll_seconds = min_poll_seconds
+        self.max_poll_seconds = max_poll_seconds
+        self.jobs: dict[str, TrackedJob] = {}
+        self.describe_calls = 0
+        self.autostart = autostart
+        self.capture_running_logs = capture_running_logs
+        self._task = None
+
+    @property
+    def batch_client(self):
+        return self._batch_client or get_client('batch')
+
+    @property
+    def logs_client(self):
+        return self._logs_client or get_client('logs')
+
+    def track(self, batch_job_id: str, user: str, dataset: str, method: str,
+              age_seconds: float = 0) -> asyncio.Future:
+        job = TrackedJob(batch_job_id, user, dataset, method, asyncio.get_running_loop().create_future(),
+                         age_seconds)
+        job.next_poll = time.monotonic() + self.min_poll_seconds
+        self.jobs[batch_job_id] = job
+        if self.autostart and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self.run())
+        return job.done
+
+    def poll_interval(self, job: TrackedJob, now: float) -> float:
+        return min(self.max_poll_seconds, max(self.min_poll_seconds, (now - job.submitted_at) / 10))
+
+    async def run(self):
+        while self.jobs:
+            try:
+                await self.poll_once()
+            except Exception as e:
+                print(f"Error polling batch jobs: {str(e)}")
+            await asyncio.sleep(self.min_poll_seconds)
+
+    async def poll_once(self):
+        now = time.monotonic()
+        # anything coming due before the next tick rides along, so calls carry as many ids as possible
+        due = [job for job in self.jobs.values() if job.next_poll <= now + self.min_poll_seconds]
+        finished = []
+        running = []
+        for start in range(0, len(due), DESCRIBE_BATCH_SIZE):
+            chunk = due[start:start + DESCRIBE_BATCH_SIZE]
+            response = await run_in_executor(_executor, None, self.batch_client.describe_jobs,
+                                             jobs=[job.batch_job_id for job in chunk])
+            self.describe_calls += 1
+            described = {detail['jobId']: detail for detail in response['jobs']}
+            polled = {}
+            for job in chunk:
+                detail = described.get(job.batch_job_id)
+                job.next_poll = now + self.poll_interval(job, now)
+                if detail is None:
+                    job.missing_polls += 1
+                    if job.missing_polls >= MAX_MISSING_POLLS:
+                        job.status = 'FAILED'
+                        finished.append((job, {'statusReason': 'Job is no longer known to AWS Batch'}))
+                    continue
+                job.missing_polls = 0
+                job.status = detail['status']
+                if job.status in TERMINAL_STATUSES:
+                    finished.append((job, detail))
+                else:
+                    polled[job.batch_job_id] = job.status
+                    if job.status == 'RUNNING':
+                        running.append((job, detail))
+            await run_db(database_utils.record_job_polls, get_db(), polled)
+        if self.capture_running_logs:
+            await asyncio.gather(*[self._capture_partial_log(job, detail) for job, detail in running])
+        await asyncio.gather(*[self._finish(job, detail) for job, detail in finished])
+
+    async def _capture_partial_log(self, job: TrackedJob, detail: dict):
+        log_stream_name = detail.get('container', {}).get('logStreamName')
+        if not log_stream_name:
             return
+        try:
+            await run_in_executor(_executor, None, self._capture_log, job, log_stream_name)
+        except Exception as e:
+            print(f"Error capturing log for batch job {job.batch_job_id}: {str(e)}")
+
+    async def _finish(self, job: TrackedJob, detail: dict):
+        log_stream_name = detail.get('container', {}).get('logStreamName')
+        # Batch's own reason is the log when there is no stream to read, or reading it fails
+        job_log = detail.get('statusReason', '')
+        if log_stream_name:
+            try:
+                await run_in_executor(_executor, None, self._capture_log, job, log_stream_name)
+                job_log = None
+            except Exception as e:
+                print(f"Error capturing log for batch job {job.batch_job_id}: {str(e)}")
+        status = f"{job.method} {job.status}"
+        try:
+            await run_db(database_utils.log_job_end, get_db(), job.user, job.dataset, status, job_log, job.status)
+        except Exception as e:
+            # still tracked, so the next poll finds it finished again and retries
+            print(f"Error recording the end of batch job {job.batch_job_id}: {str(e)}")
+            return
+        self.jobs.pop(job.batch_job_id, None)
+        try:
+            results_cache.invalidate(s3.get_results_path(job.user, job.dataset))
+            await publish_job_status(job.user, database_utils.get_dataset_hash(job.dataset, job.user), {
+                "status": status,
+                "dataset": job.dataset,
+                "method": job.method
+            })
+        except Exception as e:
+            print(f"Error publishing the end of batch job {job.batch_job_id}: {str(e)}")
+        job.done.set_result(status)
+
+    def _capture_log(self, job: TrackedJob, log_stream_name: str):
+        # a retried attempt logs to a new stream, which replaces what was captured of the old one
+        if job.log_capture is None or job.log_capture.log_stream_name != log_stream_name:
+            job.log_capture = LogCapture(database_utils.get_dataset_hash(job.dataset, job.user), log_stream_name)
+        job.log_capture.capture(self.logs_client)
+
+
+monitor = BatchMonitor()
+
+
+def as_datetime(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _log_failure(done: asyncio.Future):
+    if not done.cancelled() and done.exception():
+        print(f"Error finishing resumed batch job: {str(done.exception())}")
+
+
+def job_config(user: str, dataset: str, method: str) -> dict:
+    return {
+        'jobName': JOB_NAME,
+        'jobQueue': JOB_QUEUE,
+        'jobDefinition': JOB_DEFINITION,
+        'parameters': {
+            'username': user,
+            'dataset': dataset,
+            'method': method
+        }}
+
+
+def submit_array(user: str, jobs: list) -> dict:
+    """
+    Submits (dataset, method) pairs as one Batch array job and returns the child job id of each dataset.  The
+    pairs are written to a manifest in S3, which each child reads its own entry of by AWS_BATCH_JOB_ARRAY_INDEX;
+    children are addressed as parent:index.  A single pair goes out as an ordinary job since arrays need two.
+    """
+    if len(jobs) == 1:
+        dataset, method = jobs[0]
+        return {dataset: get_client('batch').submit_job(**job_config(user, dataset, method))['jobId']}
+    manifest = s3.get_batch_manifest_path(user, uuid.uuid4().hex)
+    s3.put_object(manifest, json.dumps([{'dataset': dataset, 'method': method}
+                                        for dataset, method in jobs]).encode('utf-8'))
+    response = get_client('batch').submit_job(
+        jobName=JOB_NAME, jobQueue=JOB_QUEUE, jobDefinition=ARRAY_JOB_DEFINITION,
+        arrayProperties={'size': len(jobs)},
+        parameters={'username': user, 'manifest': manifest})
+    return {dataset: f"{response['jobId']}:{index}" for index, (dataset, _) in enumerate(jobs)}
+
+
+async def fail_submission(user: str, dataset: str, method: str, reason: str):
+    # nothing will ever poll a job Batch didn't accept, so it is finished here
+    status = f"{method} FAILED"
+    await run_db(database_utils.log_job_end, get_db(), user, dataset, status,
+                 f"The job could not be submitted to AWS Batch: {reason}", 'FAILED')
+    await publish_job_status(user, database_utils.get_dataset_hash(dataset, user),
+                             {"status": status, "dataset": dataset, "method": method})
+
+
+async def submit_and_await_jobs(user: str, jobs: list):
+    """
+    Submits jobs with one submit_job call per ARRAY_SIZE of them when ARRAY_JOB_DEFINITION is set, or one call
+    per job otherwise, then waits while the monitor watches every child like any other job.
+    """
+    methods = dict(jobs)
+    size = ARRAY_SIZE if ARRAY_JOB_DEFINITION else 1
+    done = []
+    for start in range(0, len(jobs), size):
+        try:
+            children = await run_in_executor(_executor, None, submit_array, user, jobs[start:start + size])
+        except Exception as e:
+            print(f"Error submitting batch job for {user}: {str(e)}")
+            await asyncio.gather(*[fail_submission(user, dataset, method, str(e))
+                                   for dataset, method in jobs[start:start + size]])
+            continue
+        await run_db(database_utils.record_job_submissions, get_db(), user, children)
+        done.extend(monitor.track(batch_job_id, user, dataset, methods[dataset])
+                    for dataset, batch_job_id in children.items())
+    await asyncio.gather(*done)
+
+
+def find_batch_jobs(batch_client) -> dict:
+    """
+    Latest Batch job for each dataset job id, found by listing our job name and reading the job parameters.
+    """
+    paginator = batch_client.get_paginator('list_jobs')
+    job_ids = []
+    for page in paginator.paginate(jobQueue=JOB_QUEUE, filters=[{'name': 'JOB_NAME', 'values': [JOB_NAME]}]):
+        job_ids.extend(summary['jobId'] for summary in page['jobSummaryList'])
+    found = {}
+    for start in range(0, len(job_ids), DESCRIBE_BATCH_SIZE):
+        for detail in batch_client.describe_jobs(jobs=job_ids[start:start + DESCRIBE_BATCH_SIZE])['jobs']:
+            parameters = detail.get('parameters', {})
+            if 'username' not in parameters or 'dataset' not in parameters:
+                continue
+            job_id = database_utils.get_dataset_hash(parameters['dataset'], parameters['username'])
+            if job_id not in found or detail.get('createdAt', 0) > found[job_id].get('createdAt', 0):
+                found[job_id] = detail
+    return found
+
 
-        await asyncio.sleep(60)
+async def resume_jobs() -> int:
+    """
+    Picks monitoring back up for every job a previous server process left running.  Rows from before Batch
+    job ids were stored are matched to Batch by their parameters, and marked failed if no match is found.
+    """
+    try:
+        jobs = await run_db(database_utils.get_unfinished_jobs, get_db())
+        for job in jobs:
+            job['method'] = job['method'] or job['status'].replace('RUNNING', '').strip()
+        # a job run on a server that since went away is simply run again
+        local = [job for job in jobs if (job['batch_job_id'] or '').startswith(LOCAL_JOB_PREFIX)]
+        for job in local:
+            await run_db(database_utils.log_jobs_start, get_db(), job['user'], [(job['dataset'], job['method'])],
+                         'QUEUED')
+        jobs = [job for job in jobs if job not in local]
+        orphans = [job for job in jobs if not job['batch_job_id']]
+        if orphans:
+            batch_jobs = await run_in_executor(_executor, None, find_batch_jobs, monitor.batch_client)
+            for job in orphans:
+                detail = batch_jobs.get(job['id'])
+                if detail is None:
+                    await run_db(database_utils.mark_job_lost, get_db(), job['id'], job['method'])
+                    continue
+                parameters = detail['parameters']
+                job.update({'user': parameters['username'], 'dataset': parameters['dataset'],
+                            'batch_job_id': detail['jobId'], 'submitted_at': None})
+                await run_db(database_utils.record_job_submission, get_db(), job['user'], job['dataset'],
+                             detail['jobId'])
+    except Exception as e:
+        print(f"Error resuming batch jobs: {str(e)}")
+        return 0
 
+    resumed = 0
+    for job in jobs:
+        if not job['batch_job_id']:
+            continue
+        submitted_at = as_datetime(job['submitted_at'])
+        age = (as_datetime(job['now']) - submitted_at).total_seconds() if submitted_at else 0
+        done = monitor.track(job['batch_job_id'], job['user'], job['dataset'], job['method'], age)
+        done.add_done_callback(_log_failure)
+        resumed += 1
+    if jobs:
+        print(f"Resumed monitoring {resumed} of {len(jobs)} unfinished batch jobs")
+    return resumed
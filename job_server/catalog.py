@@ -0,0 +1,35 @@
+import asyncio
+import os
+
+from job_server import s3, database_utils
+from job_server.database import get_db, run_db
+
+RECONCILE_SECONDS = float(os.getenv('JOB_SERVER_CATALOG_RECONCILE_SECONDS', 600))
+
+
+async def reconcile_user(username: str) -> tuple[list[str], list[str]]:
+    folders = set(await s3.run_async(s3.get_datasets, username))
+    cataloged = await run_db(database_utils.get_catalog_datasets, get_db(), username)
+    added, removed = sorted(folders - cataloged), sorted(cataloged - folders)
+    if added or removed:
+        metadata = await run_db(database_utils.get_dataset_metadata, get_db(), username)
+        jobs = await run_db(database_utils.get_jobs_for_user, get_db(), username)
+        await run_db(database_utils.reconcile_catalog, get_db(), username, added, removed, metadata, jobs)
+    return added, removed
+
+
+async def reconcile_all():
+    users = set(await s3.run_async(s3.get_users)) | set(await run_db(database_utils.get_catalog_users, get_db()))
+    for username in sorted(users):
+        added, removed = await reconcile_user(username)
+        if added or removed:
+            print(f"Catalog for {username}: added {len(added)}, removed {len(removed)} datasets")
+
+
+async def run_reconciler():
+    while RECONCILE_SECONDS > 0:
+        try:
+            await reconcile_all()
+        except Exception as e:
+            print(f"Error reconciling dataset catalog: {str(e)}")
+        await asyncio.sleep(RECONCILE_SECONDS)
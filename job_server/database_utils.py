@@ -1,23 +1,14 @@
 import hashlib
 import json
-import zlib
+from datetime import datetime, timedelta
 
-import bcrypt
-from sqlalchemy import text
+from sqlalchemy import text, bindparam
 from sqlalchemy.exc import IntegrityError
 
 from job_server.compress import LogCompressor
 from job_server.model import DatasetInfo
 
 
-def authenticate_user(db, username, password):
-    with db as connection:
-        query = text("SELECT password FROM users WHERE user_name = :username")
-        db_password = connection.execute(query, {"username": username}).fetchone()
-        if db_password and bcrypt.checkpw(password.encode('utf-8'), db_password[0].encode('utf-8')):
-            return True
-        return False
-
 def insert_dataset(db, username: str, dataset: DatasetInfo) -> bool:
     try:
         with db as connection:
@@ -26,24 +17,235 @@ def insert_dataset(db, username: str, dataset: DatasetInfo) -> bool:
             connection.execute(query, {"id": get_dataset_hash(dataset.name, username),
                                        "username": username,
                                        "metadata": dataset.model_dump_json()})
+            upsert_catalog_entry(connection, username, dataset.name, dataset.model_dump(), uploaded=True)
             connection.commit()
             return True
     except IntegrityError:
         return False
 
-def log_job_start(db, username, dataset, status):
+def update_dataset_metadata(db, username: str, dataset: DatasetInfo):
+    with db as connection:
+        query = text("UPDATE datasets SET metadata=:metadata WHERE id=:id")
+        connection.execute(query, {"id": get_dataset_hash(dataset.name, username),
+                                   "metadata": dataset.model_dump_json()})
+        connection.commit()
+
+def get_unvalidated_datasets(db, username: str, datasets: list) -> list:
+    """
+    Those of the user's datasets whose upload is still being checked, was rejected or could not be checked.  Their
+    job stays the validation job until validation succeeds and the sumstats job is queued.
+    """
+    ids = {get_dataset_hash(dataset, username): dataset for dataset in datasets}
+    with db as connection:
+        query = text("SELECT id FROM dataset_jobs WHERE id IN :ids AND method=:method").bindparams(
+            bindparam('ids', expanding=True))
+        rows = connection.execute(query, {"ids": list(ids), "method": VALIDATION_METHOD}).fetchall()
+        return [ids[row[0]] for row in rows]
+
+
+def get_validating_uploads(db) -> list:
+    with db as connection:
+        query = text("SELECT d.uploaded_by, d.metadata FROM dataset_jobs dj JOIN datasets d ON dj.id = d.id "
+                     "WHERE dj.status = :status")
+        rows = connection.execute(query, {"status": VALIDATING_STATUS}).fetchall()
+        return [(row[0], DatasetInfo.model_validate_json(row[1])) for row in rows]
+
+def upsert_clause(connection, key: str) -> str:
+    if connection.dialect.name == 'sqlite':
+        return f"ON CONFLICT({key}) DO UPDATE SET"
+    return "ON DUPLICATE KEY UPDATE"
+
+def inserted(connection, column: str) -> str:
+    # the value a multi-row upsert tried to insert, for use in its update clause
+    if connection.dialect.name == 'sqlite':
+        return f"excluded.{column}"
+    return f"VALUES({column})"
+
+
+def log_job_start(db, username, dataset, status, method=None):
     with db as connection:
-        query = text("INSERT INTO dataset_jobs (id, user, status, updated_at) VALUES (:id, :username, :status, NOW()) "
-                     "ON DUPLICATE KEY UPDATE user=:username, status=:status, updated_at=NOW(), job_log=NULL")
-        connection.execute(query, {"id": get_dataset_hash(dataset, username), "username": username, "status": status})
+        query = text("INSERT INTO dataset_jobs (id, user, status, updated_at, dataset, method) "
+                     "VALUES (:id, :username, :status, NOW(), :dataset, :method) "
+                     f"{upsert_clause(connection, 'id')} user=:username, status=:status, updated_at=NOW(), job_log=NULL, "
+                     "dataset=:dataset, method=:method, batch_job_id=NULL, batch_status=NULL, submitted_at=NULL, "
+                     "last_polled_at=NULL, priority=0, queued_at=NULL, bulk=0")
+        connection.execute(query, {"id": get_dataset_hash(dataset, username), "username": username, "status": status,
+                                   "dataset": dataset, "method": method})
+        connection.execute(text("DELETE FROM job_log_chunks WHERE job_id=:id"), {"id": get_dataset_hash(dataset, username)})
+        update_catalog_status(connection, get_dataset_hash(dataset, username), status)
         connection.commit()
 
-def log_job_end(db, username, dataset, status, job_log):
+# rows per multi-row insert, well inside MySQL's placeholder and packet limits
+JOB_UPSERT_ROWS = 500
+
+def log_jobs_start(db, username, jobs: list, state: str = 'RUNNING', priority: int = 0, bulk: bool = False):
+    """
+    log_job_start for many (dataset, method) pairs at once, as one multi-row upsert.  A state of QUEUED leaves
+    the jobs for the scheduler to release in order of priority, then queued_at; bulk ones are submitted together.
+    """
+    # a microsecond apart so jobs sent together are still released in the order they were listed
+    queued_at = datetime.now()
+    rows = [{"id": get_dataset_hash(dataset, username), "status": f"{state} {method}", "dataset": dataset,
+             "method": method, "queued_at": queued_at + timedelta(microseconds=i)}
+            for i, (dataset, method) in enumerate(jobs)]
     with db as connection:
-        query = text("UPDATE dataset_jobs SET status=:status, job_log=:job_log, updated_at=NOW() WHERE id=:id")
-        connection.execute(query, {"id": get_dataset_hash(dataset, username), "status": status, "job_log": LogCompressor.compress(job_log)})
+        for start in range(0, len(rows), JOB_UPSERT_ROWS):
+            chunk = rows[start:start + JOB_UPSERT_ROWS]
+            values = ", ".join(f"(:id{i}, :username, :status{i}, NOW(), :dataset{i}, :method{i}, :priority, "
+                               f":queued_at{i}, :bulk)" for i in range(len(chunk)))
+            params = {"username": username, "priority": priority, "bulk": int(bulk)}
+            for i, row in enumerate(chunk):
+                params.update({f"{key}{i}": value for key, value in row.items()})
+            query = text("INSERT INTO dataset_jobs (id, user, status, updated_at, dataset, method, priority, queued_at, "
+                         f"bulk) VALUES {values} {upsert_clause(connection, 'id')} user={inserted(connection, 'user')}, "
+                         f"status={inserted(connection, 'status')}, updated_at=NOW(), job_log=NULL, "
+                         f"dataset={inserted(connection, 'dataset')}, method={inserted(connection, 'method')}, "
+                         "batch_job_id=NULL, batch_status=NULL, submitted_at=NULL, last_polled_at=NULL, "
+                         f"priority={inserted(connection, 'priority')}, queued_at={inserted(connection, 'queued_at')}, "
+                         f"bulk={inserted(connection, 'bulk')}")
+            connection.execute(query, params)
+            connection.execute(text("DELETE FROM job_log_chunks WHERE job_id IN :ids").bindparams(
+                bindparam('ids', expanding=True)), {"ids": [row["id"] for row in chunk]})
+        connection.execute(text(CATALOG_STATUS_UPDATE),
+                           [{"id": row["id"], "status": row["status"], **DELETING_PARAMS} for row in rows])
         connection.commit()
 
+RUNNING_COUNTS = "SELECT user, COUNT(*) FROM dataset_jobs WHERE status LIKE 'RUNNING%' GROUP BY user"
+# held while jobs are claimed, so scheduler passes in different server processes take turns
+CLAIM_LOCK = 'job_server.claim_queued_jobs'
+CLAIM_LOCK_SECONDS = 10
+
+def get_job_queue(db, limit: int) -> tuple[dict, list]:
+    """
+    Running job counts by user, and up to limit queued jobs in priority then arrival order.  Nothing is locked:
+    the counts are for choosing which jobs to try, claim_queued_jobs enforces the limits.
+    """
+    with db as connection:
+        running = {row[0]: row[1] for row in connection.execute(text(RUNNING_COUNTS))}
+        query = text("SELECT id, user, dataset, method, priority, bulk FROM dataset_jobs WHERE status LIKE 'QUEUED%' "
+                     f"AND id NOT IN ({DELETING_IDS}) ORDER BY priority DESC, queued_at, id LIMIT :limit")
+        queued = [dict(row._mapping) for row in connection.execute(query, {"limit": limit, **DELETING_PARAMS})]
+        return running, queued
+
+def claim_queued_jobs(db, jobs: list, max_running: int, max_running_per_user: int) -> list:
+    """
+    Moves queued jobs to RUNNING while the running counts, overall and for the job's user, are under the limits,
+    returning those claimed; another process, or a delete, may have got to some of them first.  Claims are taken
+    one process at a time, under a named lock on MySQL and sqlite's write lock, with the counts read after the
+    lock is held, so processes claiming at once can't together go over the limits.  A process that can't get the
+    lock claims nothing and tries again on its next pass.
+    """
+    claimed = []
+    with db as connection:
+        mysql = connection.dialect.name == 'mysql'
+        if mysql:
+            # read what the last holder of the lock committed, not a snapshot from before it
+            connection.execution_options(isolation_level='READ COMMITTED')
+            query = text("SELECT GET_LOCK(:name, :seconds)")
+            if connection.execute(query, {"name": CLAIM_LOCK, "seconds": CLAIM_LOCK_SECONDS}).scalar() != 1:
+                return claimed
+        else:
+            # a write that changes nothing, to hold the write lock before the counts are read
+            connection.execute(text("UPDATE dataset_jobs SET status=status WHERE 0"))
+        try:
+            running = {row[0]: row[1] for row in connection.execute(text(RUNNING_COUNTS))}
+            query = text("UPDATE dataset_jobs SET status=:status, updated_at=NOW() WHERE id=:id "
+                         f"AND status LIKE 'QUEUED%' AND id NOT IN ({DELETING_IDS})")
+            for job in jobs:
+                if sum(running.values()) >= max_running:
+                    break
+                if running.get(job["user"], 0) >= max_running_per_user:
+                    continue
+                status = f"RUNNING {job['method']}"
+                if connection.execute(query, {"id": job["id"], "status": status, **DELETING_PARAMS}).rowcount:
+                    update_catalog_status(connection, job["id"], status)
+                    running[job["user"]] = running.get(job["user"], 0) + 1
+                    claimed.append(job)
+            connection.commit()
+        finally:
+            if mysql:
+                # the lock belongs to the session, not the transaction, and must not go back to the pool with it
+                connection.rollback()
+                connection.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": CLAIM_LOCK})
+    return claimed
+
+def log_job_end(db, username, dataset, status, job_log, batch_status=None):
+    # a job_log of None keeps the log already captured in job_log_chunks
+    with db as connection:
+        query = text("UPDATE dataset_jobs SET status=:status, updated_at=NOW(), "
+                     "batch_status=COALESCE(:batch_status, batch_status) WHERE id=:id")
+        connection.execute(query, {"id": get_dataset_hash(dataset, username), "status": status,
+                                   "batch_status": batch_status})
+        if job_log is not None:
+            replace_job_log(connection, get_dataset_hash(dataset, username), job_log)
+        update_catalog_status(connection, get_dataset_hash(dataset, username), status)
+        connection.commit()
+
+def insert_log_chunk(connection, job_id, seq, first_line, line_count, byte_offset, byte_length, data: bytes):
+    query = text("INSERT INTO job_log_chunks (job_id, seq, first_line, line_count, byte_offset, byte_length, data) "
+                 "VALUES (:job_id, :seq, :first_line, :line_count, :byte_offset, :byte_length, :data)")
+    connection.execute(query, {"job_id": job_id, "seq": seq, "first_line": first_line, "line_count": line_count,
+                               "byte_offset": byte_offset, "byte_length": byte_length, "data": data})
+
+def append_log_chunk(db, job_id, seq, first_line, line_count, byte_offset, byte_length, data: bytes):
+    with db as connection:
+        if seq == 0:
+            # the first chunk of a capture replaces anything stored by an earlier run or attempt
+            connection.execute(text("DELETE FROM job_log_chunks WHERE job_id=:id"), {"id": job_id})
+        insert_log_chunk(connection, job_id, seq, first_line, line_count, byte_offset, byte_length, data)
+        connection.commit()
+
+def replace_job_log(connection, job_id, job_log: str):
+    body = job_log if job_log.endswith('\n') else job_log + '\n'
+    connection.execute(text("DELETE FROM job_log_chunks WHERE job_id=:id"), {"id": job_id})
+    insert_log_chunk(connection, job_id, 0, 0, body.count('\n'), 0, len(body.encode('utf-8')),
+                     LogCompressor.compress(body))
+
+def record_job_submission(db, username, dataset, batch_job_id):
+    with db as connection:
+        query = text("UPDATE dataset_jobs SET batch_job_id=:batch_job_id, batch_status='SUBMITTED', "
+                     "submitted_at=NOW(), last_polled_at=NULL WHERE id=:id")
+        connection.execute(query, {"id": get_dataset_hash(dataset, username), "batch_job_id": batch_job_id})
+        connection.commit()
+
+def record_job_submissions(db, username, batch_job_ids: dict):
+    if not batch_job_ids:
+        return
+    with db as connection:
+        query = text("UPDATE dataset_jobs SET batch_job_id=:batch_job_id, batch_status='SUBMITTED', "
+                     "submitted_at=NOW(), last_polled_at=NULL WHERE id=:id")
+        connection.execute(query, [{"id": get_dataset_hash(dataset, username), "batch_job_id": batch_job_id}
+                                   for dataset, batch_job_id in batch_job_ids.items()])
+        connection.commit()
+
+def record_job_polls(db, batch_statuses: dict):
+    if not batch_statuses:
+        return
+    with db as connection:
+        query = text("UPDATE dataset_jobs SET batch_status=:batch_status, last_polled_at=NOW() "
+                     "WHERE batch_job_id=:batch_job_id")
+        connection.execute(query, [{"batch_job_id": batch_job_id, "batch_status": batch_status}
+                                   for batch_job_id, batch_status in batch_statuses.items()])
+        connection.commit()
+
+def mark_job_lost(db, job_id, method):
+    status = f"{method} FAILED"
+    with db as connection:
+        query = text("UPDATE dataset_jobs SET status=:status, batch_status='FAILED', updated_at=NOW() WHERE id=:id")
+        connection.execute(query, {"id": job_id, "status": status})
+        replace_job_log(connection, job_id,
+                        "The server restarted while this job was running and it could not be found in AWS Batch")
+        update_catalog_status(connection, job_id, status)
+        connection.commit()
+
+def get_unfinished_jobs(db) -> list:
+    # batch_status is only ever set to a terminal state by log_job_end, after the final status and log are stored
+    with db as connection:
+        query = text("SELECT id, user, dataset, method, status, batch_job_id, submitted_at, NOW() AS now "
+                     "FROM dataset_jobs WHERE status LIKE 'RUNNING%' "
+                     "AND (batch_status IS NULL OR batch_status NOT IN ('SUCCEEDED', 'FAILED'))")
+        return [dict(row._mapping) for row in connection.execute(query).fetchall()]
+
 def get_jobs_for_user(db, username):
     with db as connection:
         query = text("SELECT id, status, updated_at FROM dataset_jobs WHERE user = :username")
@@ -61,21 +263,52 @@ def delete_dataset(db, username, dataset):
         connection.execute(query, {"id": dataset_hash})
         query = text("DELETE FROM datasets WHERE id=:id")
         connection.execute(query, {"id": dataset_hash})
+        query = text("DELETE FROM dataset_catalog WHERE id=:id")
+        connection.execute(query, {"id": dataset_hash})
+        query = text("DELETE FROM job_log_chunks WHERE job_id=:id")
+        connection.execute(query, {"id": dataset_hash})
         connection.commit()
 
 
 def get_log_info(db, username, job_id):
+    # the log itself is read from /log/{job_id}, in whole or in part
     with db as connection:
-        query = text("SELECT job_log, metadata->>'$.name' as ds_name FROM dataset_jobs dj join datasets d "
-                     "on dj.id = d.id WHERE dj.id=:id and dj.user=:username")
+        query = text("SELECT COALESCE(dj.dataset, d.name), "
+                     "(SELECT SUM(line_count) FROM job_log_chunks WHERE job_id = dj.id), "
+                     "(SELECT SUM(byte_length) FROM job_log_chunks WHERE job_id = dj.id) "
+                     "FROM dataset_jobs dj LEFT JOIN datasets d ON dj.id = d.id WHERE dj.id=:id and dj.user=:username")
         row = connection.execute(query, {"id": job_id, "username": username}).fetchone()
-        log_content, dataset = row if row else (None, None)
-        return {'log': log_content.decode('latin1') if log_content else None, 'dataset': dataset}
+        dataset, lines, size = row if row else (None, None, None)
+        return {'dataset': dataset, 'lines': lines or 0, 'bytes': size or 0}
+
+
+def get_job_log_index(db, username, job_id):
+    """
+    The offsets of each stored chunk of a job's log, without the chunks themselves, or None if the user has no
+    such job.  Logs stored before chunking are returned whole as legacy_log.
+    """
+    with db as connection:
+        query = text("SELECT job_log FROM dataset_jobs WHERE id=:id AND user=:username")
+        row = connection.execute(query, {"id": job_id, "username": username}).fetchone()
+        if row is None:
+            return None
+        query = text("SELECT seq, first_line, line_count, byte_offset, byte_length FROM job_log_chunks "
+                     "WHERE job_id=:id ORDER BY seq")
+        chunks = [tuple(chunk) for chunk in connection.execute(query, {"id": job_id}).fetchall()]
+        return {'chunks': chunks, 'legacy_log': row[0] if not chunks else None}
+
+
+def get_log_chunks(db, job_id, seqs: list) -> dict:
+    with db as connection:
+        query = text("SELECT seq, data FROM job_log_chunks WHERE job_id=:id AND seq IN :seqs").bindparams(
+            bindparam('seqs', expanding=True))
+        return {row[0]: row[1] for row in connection.execute(query, {"id": job_id, "seqs": seqs}).fetchall()}
 
 
 def get_dataset_metadata(db, username) -> dict:
     with db as connection:
-        query = text("SELECT metadata, metadata->>'$.name', uploaded_at as ds_name FROM datasets WHERE uploaded_by = :username")
+        # served from idx_datasets_uploaded_by_name, with the name from its generated column
+        query = text("SELECT metadata, name, uploaded_at FROM datasets WHERE uploaded_by = :username")
         results = connection.execute(query, {"username": username}).fetchall()
         return {row[1]: {**json.loads(row[0]), "uploaded_at": row[2]} for row in results}
 
@@ -83,4 +316,121 @@ def get_dataset_metadata(db, username) -> dict:
 def get_job_status(db, job_id):
     with db as connection:
         query = text("SELECT status FROM dataset_jobs WHERE id=:id")
-        return connection.execute(query, {"id": job_id}).fetchone()[0]
+        row = connection.execute(query, {"id": job_id}).fetchone()
+        return row[0] if row else None
+
+
+# job status of an upload from finalizing until its file has been checked and ingested
+VALIDATING_STATUS = 'VALIDATING'
+VALIDATION_METHOD = 'validation'
+
+# catalog status of datasets whose files are being purged, they are hidden from listings until the rows go
+DELETING_STATUS = 'DELETING'
+DELETE_FAILED_STATUS = 'DELETE FAILED'
+
+# datasets being deleted, or whose delete failed part way, whose queued jobs are never started
+DELETING_IDS = "SELECT id FROM dataset_catalog WHERE status IN (:deleting_status, :delete_failed_status)"
+DELETING_PARAMS = {"deleting_status": DELETING_STATUS, "delete_failed_status": DELETE_FAILED_STATUS}
+# a job's status never replaces a delete's, so a job queued or finishing mid-delete can't bring a dataset back
+CATALOG_STATUS_UPDATE = ("UPDATE dataset_catalog SET status=:status, updated_at=NOW() WHERE id=:id AND "
+                         "(status IS NULL OR status NOT IN (:deleting_status, :delete_failed_status) OR "
+                         ":status IN (:deleting_status, :delete_failed_status))")
+
+CATALOG_ORDER_COLUMNS = {'dataset', 'uploaded_at', 'ancestry', 'file_name', 'genome_build', 'phenotype', 'status'}
+
+
+def upsert_catalog_entry(connection, username: str, dataset: str, metadata: dict, uploaded: bool = False):
+    # uploaded_at is only stamped by an actual upload, reconciled rows for folders found in S3 keep what they have
+    uploaded_at = "NOW()" if uploaded else "NULL"
+    query = text("INSERT INTO dataset_catalog (id, user, dataset, file_name, ancestry, genome_build, phenotype, "
+                 "status, uploaded_at, updated_at) VALUES (:id, :username, :dataset, :file_name, :ancestry, "
+                 f":genome_build, :phenotype, :status, {uploaded_at}, NOW()) "
+                 f"{upsert_clause(connection, 'id')} file_name=:file_name, ancestry=:ancestry, "
+                 "genome_build=:genome_build, phenotype=:phenotype, "
+                 f"uploaded_at=COALESCE({uploaded_at}, uploaded_at), updated_at=NOW()")
+    connection.execute(query, {"id": get_dataset_hash(dataset, username), "username": username, "dataset": dataset,
+                               "file_name": metadata.get('file'), "ancestry": metadata.get('ancestry'),
+                               "genome_build": metadata.get('genome_build'), "phenotype": metadata.get('phenotype'),
+                               "status": metadata.get('status')})
+
+
+def update_catalog_status(connection, dataset_id: str, status: str) -> int:
+    return connection.execute(text(CATALOG_STATUS_UPDATE),
+                              {"id": dataset_id, "status": status, **DELETING_PARAMS}).rowcount
+
+
+def get_catalog(db, username: str, order_by: str = None, order_dir: str = None, limit: int = None,
+                offset: int = 0) -> list:
+    column = order_by if order_by in CATALOG_ORDER_COLUMNS else 'dataset'
+    direction = 'DESC' if order_dir and order_dir.lower() == 'desc' else 'ASC'
+    with db as connection:
+        query = ("SELECT id, dataset, uploaded_at, ancestry, file_name, genome_build, phenotype, status "
+                 "FROM dataset_catalog WHERE user = :username AND (status IS NULL OR status <> :deleting) "
+                 f"ORDER BY {column} {direction}, id {direction}")
+        params = {"username": username, "deleting": DELETING_STATUS}
+        if limit is not None:
+            query += " LIMIT :limit OFFSET :offset"
+            params.update({"limit": limit, "offset": offset})
+        results = connection.execute(text(query), params).fetchall()
+        return [{'dataset': row.dataset,
+                 'uploaded_at': row.uploaded_at or '',
+                 'ancestry': row.ancestry or '',
+                 'file_name': row.file_name or '',
+                 'genome_build': row.genome_build or '',
+                 'phenotype': row.phenotype or '',
+                 'uploaded_by': username,
+                 'status': row.status,
+                 'id': row.id} for row in results]
+
+
+def get_catalog_users(db) -> list[str]:
+    with db as connection:
+        return [row[0] for row in connection.execute(text("SELECT DISTINCT user FROM dataset_catalog")).fetchall()]
+
+
+def get_catalog_datasets(db, username: str) -> set[str]:
+    with db as connection:
+        query = text("SELECT dataset FROM dataset_catalog WHERE user = :username")
+        return {row[0] for row in connection.execute(query, {"username": username}).fetchall()}
+
+
+def reconcile_catalog(db, username: str, added: list[str], removed: list[str], metadata: dict, jobs: dict):
+    with db as connection:
+        for dataset in added:
+            status = jobs.get(get_dataset_hash(dataset, username), {}).get('status')
+            upsert_catalog_entry(connection, username, dataset, {**metadata.get(dataset, {}), 'status': status})
+            if dataset in metadata:
+                query = text("UPDATE dataset_catalog SET uploaded_at=:uploaded_at WHERE id=:id")
+                connection.execute(query, {"id": get_dataset_hash(dataset, username),
+                                           "uploaded_at": metadata[dataset]['uploaded_at']})
+        for dataset in removed:
+            query = text("DELETE FROM dataset_catalog WHERE id=:id")
+            connection.execute(query, {"id": get_dataset_hash(dataset, username)})
+        connection.commit()
+
+
+def mark_datasets_deleting(db, username: str, datasets: list):
+    with db as connection:
+        for dataset in datasets:
+            # jobs still waiting to start never will, the purge removes their rows along with the rest
+            connection.execute(text("DELETE FROM dataset_jobs WHERE id=:id AND status LIKE 'QUEUED%'"),
+                               {"id": get_dataset_hash(dataset, username)})
+            if not update_catalog_status(connection, get_dataset_hash(dataset, username), DELETING_STATUS):
+                # still needs a row, so the reconciler doesn't add the folder back while it is purged
+                upsert_catalog_entry(connection, username, dataset, {'status': DELETING_STATUS})
+        connection.commit()
+
+
+def set_catalog_status(db, dataset_id: str, status: str):
+    with db as connection:
+        update_catalog_status(connection, dataset_id, status)
+        connection.commit()
+
+
+def get_deleting_datasets(db) -> dict:
+    with db as connection:
+        query = text("SELECT user, dataset FROM dataset_catalog WHERE status = :status ORDER BY user, dataset")
+        deleting = {}
+        for row in connection.execute(query, {"status": DELETING_STATUS}).fetchall():
+            deleting.setdefault(row[0], []).append(row[1])
+        return deleting
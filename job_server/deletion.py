@@ -0,0 +1,132 @@
+import asyncio
+import os
+import uuid
+
+from job_server import s3, database_utils
+from job_server.database import get_db, run_db
+from job_server.results_cache import results_cache
+from job_server.status_hub import publish_job_status
+
+# S3 calls, listing and deleting together, a bulk delete makes at once
+DELETE_CONCURRENCY = int(os.getenv('JOB_SERVER_DELETE_CONCURRENCY', 4))
+MAX_DELETE_ATTEMPTS = 5
+RETRY_SECONDS = float(os.getenv('JOB_SERVER_DELETE_RETRY_SECONDS', 1))
+
+
+class PrefixPurge:
+    """
+    Deletes everything under a prefix.  Each folder is listed on its own task so a deep tree is walked in
+    parallel, and every listed page, at most 1000 keys, goes straight out as one delete_objects call.  Keys S3
+    reports as failed are retried with backoff before they are given up on.
+    """
+
+    def __init__(self, semaphore: asyncio.Semaphore, on_progress=None):
+        self.semaphore = semaphore
+        self.on_progress = on_progress
+        self.deleted = 0
+        self.failed = []
+
+    async def run(self, prefix: str):
+        await self._walk(prefix)
+
+    async def _walk(self, prefix: str):
+        tasks = []
+        token = None
+        try:
+            while True:
+                async with self.semaphore:
+                    keys, prefixes, token = await s3.run_async(s3.list_page, prefix, token, '/')
+                tasks.extend(asyncio.create_task(self._walk(sub_prefix)) for sub_prefix in prefixes)
+                if keys:
+                    tasks.append(asyncio.create_task(self._delete(keys)))
+                if not token:
+                    break
+        finally:
+            # a failed listing still waits for what it started, so nothing is left running unowned
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+    async def _delete(self, keys: list):
+        for attempt in range(MAX_DELETE_ATTEMPTS):
+            try:
+                async with self.semaphore:
+                    failed = await s3.run_async(s3.delete_keys, keys)
+            except Exception as e:
+                print(f"Error deleting {len(keys)} objects: {str(e)}")
+                failed = keys
+            self.deleted += len(keys) - len(failed)
+            if self.on_progress and len(failed) < len(keys):
+                await self.on_progress(self)
+            if not failed:
+                return
+            keys = failed
+            if attempt + 1 < MAX_DELETE_ATTEMPTS:
+                await asyncio.sleep(RETRY_SECONDS * 2 ** attempt)
+        self.failed.extend(keys)
+
+
+async def purge_dataset(username: str, dataset: str, semaphore: asyncio.Semaphore) -> bool:
+    job_id = database_utils.get_dataset_hash(dataset, username)
+
+    async def progress(purge: PrefixPurge):
+        await publish_job_status(username, job_id, {"status": database_utils.DELETING_STATUS, "dataset": dataset,
+                                                    "deleted_objects": purge.deleted})
+
+    purge = PrefixPurge(semaphore, progress)
+    try:
+        # the trailing slash keeps a dataset from matching others whose names start with its name
+        await purge.run(f"userdata/{username}/genetic/{dataset}/")
+        succeeded = not purge.failed
+    except Exception as e:
+        print(f"Error deleting dataset {dataset} for {username}: {str(e)}")
+        succeeded = False
+    if succeeded:
+        await run_db(database_utils.delete_dataset, get_db(), username, dataset)
+        results_cache.invalidate(s3.get_results_path(username, dataset))
+    else:
+        await run_db(database_utils.set_catalog_status, get_db(), job_id, database_utils.DELETE_FAILED_STATUS)
+    await publish_job_status(username, job_id, {
+        "status": "DELETE SUCCEEDED" if succeeded else database_utils.DELETE_FAILED_STATUS,
+        "dataset": dataset, "deleted_objects": purge.deleted})
+    return succeeded
+
+
+async def delete_datasets(username: str, datasets: list, delete_id: str) -> list:
+    """
+    Purges datasets already marked as deleting, reporting each one on its own job id and the whole request on
+    delete_id.  Returns the datasets that could not be deleted.
+    """
+    semaphore = asyncio.Semaphore(DELETE_CONCURRENCY)
+    failed = []
+    completed = 0
+
+    async def purge(dataset):
+        nonlocal completed
+        if not await purge_dataset(username, dataset, semaphore):
+            failed.append(dataset)
+        completed += 1
+        if completed < len(datasets):
+            await publish_job_status(username, delete_id, {"status": database_utils.DELETING_STATUS,
+                                                           "datasets": len(datasets), "completed": completed})
+
+    await asyncio.gather(*[purge(dataset) for dataset in datasets])
+    await publish_job_status(username, delete_id, {
+        "status": database_utils.DELETE_FAILED_STATUS if failed else "DELETE SUCCEEDED",
+        "datasets": len(datasets), "completed": completed, "failed": sorted(failed)})
+    return failed
+
+
+async def resume_deletes() -> int:
+    """
+    Finishes deletes a previous server process accepted but didn't get to the end of.
+    """
+    try:
+        deleting = await run_db(database_utils.get_deleting_datasets, get_db())
+        for username, datasets in deleting.items():
+            await delete_datasets(username, datasets, uuid.uuid4().hex)
+    except Exception as e:
+        print(f"Error resuming dataset deletes: {str(e)}")
+        return 0
+    return sum(len(datasets) for datasets in deleting.values())
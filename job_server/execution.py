@@ -0,0 +1,181 @@
+import asyncio
+import os
+import random
+import shlex
+import uuid
+from abc import ABC, abstractmethod
+
+from job_server import batch, database_utils, metrics, s3
+from job_server.database import get_db, run_db
+from job_server.job_logs import LogChunkWriter
+from job_server.results_cache import results_cache
+from job_server.status_hub import publish_job_status
+
+# what the local backend runs for a job, each argument formatted with the job's username, dataset and method,
+# e.g. "python -m ldsc_methods --username {username} --dataset {dataset} --method {method}"
+LOCAL_COMMAND = os.getenv('JOB_SERVER_LOCAL_COMMAND', '')
+LOCAL_WORKERS = int(os.getenv('JOB_SERVER_LOCAL_WORKERS', 2))
+LOCAL_TIMEOUT = float(os.getenv('JOB_SERVER_LOCAL_TIMEOUT', 900))
+# jobs the routing backend keeps on the server: these methods, for uploads of at most this many rows
+LOCAL_METHODS = set(filter(None, os.getenv('JOB_SERVER_LOCAL_METHODS', 'sumstats').split(',')))
+LOCAL_MAX_ROWS = int(os.getenv('JOB_SERVER_LOCAL_MAX_ROWS', 2000000))
+# output lines handed to the log writer at a time
+LOG_LINES_PER_WRITE = 1000
+
+
+async def finish_job(user: str, dataset: str, method: str, outcome: str, job_log: str = None) -> str:
+    # a job_log of None keeps what was already written to the job's log chunks
+    status = f"{method} {outcome}"
+    await run_db(database_utils.log_job_end, get_db(), user, dataset, status, job_log, outcome)
+    results_cache.invalidate(s3.get_results_path(user, dataset))
+    await publish_job_status(user, database_utils.get_dataset_hash(dataset, user),
+                             {"status": status, "dataset": dataset, "method": method})
+    return status
+
+
+class ExecutionBackend(ABC):
+    """
+    Runs jobs the scheduler has released, (dataset, method) pairs of one user, returning once every one of them
+    has its final status and log stored.
+    """
+    name = None
+
+    @abstractmethod
+    async def run(self, user: str, jobs: list):
+        pass
+
+
+class BatchBackend(ExecutionBackend):
+    name = 'batch'
+
+    async def run(self, user: str, jobs: list):
+        await batch.submit_and_await_jobs(user, jobs)
+
+
+class LocalBackend(ExecutionBackend):
+    """
+    Runs each job as a command on the server, at most workers at a time, streaming its output into the job log.
+    There is no container to start or poll interval to wait out, so a small job is done in the time it computes.
+    """
+    name = 'local'
+
+    def __init__(self, command: str = LOCAL_COMMAND, workers: int = LOCAL_WORKERS, timeout: float = LOCAL_TIMEOUT):
+        if not command:
+            raise ValueError("The local backend needs JOB_SERVER_LOCAL_COMMAND")
+        self.command = shlex.split(command)
+        self.timeout = timeout
+        self.slots = asyncio.Semaphore(workers)
+
+    async def run(self, user: str, jobs: list):
+        await asyncio.gather(*[self.run_job(user, dataset, method) for dataset, method in jobs])
+
+    async def run_job(self, user: str, dataset: str, method: str) -> str:
+        async with self.slots:
+            await run_db(database_utils.record_job_submissions, get_db(), user,
+                         {dataset: f"{batch.LOCAL_JOB_PREFIX}{uuid.uuid4().hex}"})
+            writer = LogChunkWriter(database_utils.get_dataset_hash(dataset, user))
+            try:
+                returncode = await self.execute(writer, user, dataset, method)
+                outcome, job_log = ('SUCCEEDED' if returncode == 0 else 'FAILED'), None
+            except Exception as e:
+                print(f"Error running {method} for {dataset} locally: {str(e)}")
+                outcome, job_log = 'FAILED', f"The job could not be run: {str(e)}"
+        return await finish_job(user, dataset, method, outcome, job_log)
+
+    async def execute(self, writer: LogChunkWriter, user: str, dataset: str, method: str) -> int:
+        args = [arg.format(username=user, dataset=dataset, method=method) for arg in self.command]
+        process = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE,
+                                                       stderr=asyncio.subprocess.STDOUT)
+        try:
+            await asyncio.wait_for(self.capture(process, writer), self.timeout)
+        except asyncio.TimeoutError:
+            await self.stop(process)
+            await run_db(writer.write, [f"Stopped after running for {self.timeout:g} seconds"])
+        finally:
+            # a failed log write or a cancelled job would otherwise leave the command running
+            await self.stop(process)
+            await run_db(writer.flush)
+        return process.returncode
+
+    @staticmethod
+    async def stop(process):
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            await process.wait()
+
+    async def capture(self, process, writer: LogChunkWriter):
+        lines = []
+        async for line in process.stdout:
+            lines.append(line.decode('utf-8', 'replace').rstrip('\n'))
+            if len(lines) >= LOG_LINES_PER_WRITE:
+                await run_db(writer.write, lines)
+                lines = []
+        await run_db(writer.write, lines)
+        await process.wait()
+
+
+class FakeBackend(ExecutionBackend):
+    """
+    Stands in for a real backend in tests and benchmarks: each job runs for a random time between min_seconds
+    and max_seconds and then succeeds.
+    """
+    name = 'fake'
+
+    def __init__(self, min_seconds: float = 1, max_seconds: float = 5):
+        self.min_seconds = min_seconds
+        self.max_seconds = max_seconds
+        self.started = []
+
+    async def run(self, user: str, jobs: list):
+        self.started.extend((user, dataset) for dataset, _ in jobs)
+        await asyncio.gather(*[self.run_job(user, dataset, method) for dataset, method in jobs])
+
+    async def run_job(self, user: str, dataset: str, method: str):
+        await asyncio.sleep(random.uniform(self.min_seconds, self.max_seconds))
+        await finish_job(user, dataset, method, 'SUCCEEDED', "Run by the fake backend")
+
+
+class RoutingBackend(ExecutionBackend):
+    """
+    Keeps jobs of the given methods on small uploads, going by the row count upload validation stored, on the
+    local backend and sends everything else, including uploads of unknown size, to the remote one.
+    """
+    name = 'routed'
+
+    def __init__(self, local: ExecutionBackend, remote: ExecutionBackend, methods: set = None,
+                 max_rows: int = LOCAL_MAX_ROWS):
+        self.local = local
+        self.remote = remote
+        self.methods = LOCAL_METHODS if methods is None else methods
+        self.max_rows = max_rows
+
+    def choose(self, method: str, row_count) -> ExecutionBackend:
+        if method in self.methods and row_count is not None and row_count <= self.max_rows:
+            return self.local
+        return self.remote
+
+    async def run(self, user: str, jobs: list):
+        metadata = await run_db(database_utils.get_dataset_metadata, get_db(), user)
+        routes = {}
+        for dataset, method in jobs:
+            backend = self.choose(method, metadata.get(dataset, {}).get('row_count'))
+            routes.setdefault(backend, []).append((dataset, method))
+        for backend, routed in routes.items():
+            metrics.increment(f'execution.{backend.name}', len(routed))
+        await asyncio.gather(*[backend.run(user, routed) for backend, routed in routes.items()])
+
+
+def create_execution_backend(backend: str = os.getenv('JOB_SERVER_EXECUTOR',
+                                                      'routed' if LOCAL_COMMAND else 'batch')) -> ExecutionBackend:
+    if backend == 'batch':
+        return BatchBackend()
+    if backend == 'local':
+        return LocalBackend()
+    if backend == 'routed':
+        return RoutingBackend(LocalBackend(), BatchBackend())
+    if backend == 'fake':
+        return FakeBackend()
+    raise ValueError(f"Unknown execution backend {backend}")
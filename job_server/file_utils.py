@@ -1,11 +1,21 @@
+import csv
 import gzip
 import io
+import os
+import zlib
 from typing import Tuple
 
 import pandas as pd
 import numpy as np
 from fastapi import UploadFile
 
+# a preview only looks at the header and the first rows, however large the file
+SAMPLE_BYTES = int(os.getenv('JOB_SERVER_PREVIEW_SAMPLE_BYTES', 256 * 1024))
+SAMPLE_LINES = 100
+READ_SIZE = 16 * 1024
+# zlib window bits for reading gzip framing
+GZIP_WBITS = zlib.MAX_WBITS | 16
+DELIMITERS = ['\t', ',', ';', '|', ' ']
 
 def infer_data_type(val):
     if isinstance(val, np.int64):
@@ -15,23 +25,29 @@ def infer_data_type(val):
     else:
         return 'TEXT'
 
-def find_dupe_cols(header, is_csv, panda_header):
-    if is_csv:
-        header_list = header.split(',')
-    else:
-        header_list = header.split('\t')
-
+def find_dupe_cols(header, delimiter, panda_header):
+    header_list = header.split(delimiter)
     header_list = [col.replace('"', '').rstrip() for col in header_list]
     renamed_columns = [col for col in panda_header if col not in header_list]
     return renamed_columns
 
-async def parse_file(file_content, file_name) -> pd.DataFrame:
-    if '.csv' in file_name:
-        return pd.read_csv(file_content)
-    elif '.tsv' in file_name:
-        return pd.read_csv(file_content, sep='\t')
-    else:
-        raise ValueError("Unsupported file format")
+def detect_delimiter(lines: list) -> str:
+    # the first candidate that splits every sampled line into the same number of fields (more than one)
+    for delimiter in DELIMITERS:
+        field_counts = {len(row) for row in csv.reader(lines, delimiter=delimiter) if row}
+        if len(field_counts) == 1 and field_counts.pop() > 1:
+            return delimiter
+    return ','
+
+def parse_sample(lines: list, delimiter: str) -> pd.DataFrame:
+    return pd.read_csv(io.StringIO('\n'.join(lines)), sep=delimiter)
+
+def infer_column_types(df: pd.DataFrame) -> dict:
+    types = {}
+    for column in df.columns:
+        values = df[column].dropna()
+        types[column] = infer_data_type(values.iloc[0]) if len(values) else 'TEXT'
+    return types
 
 
 async def is_gzip(stream: bytes) -> bool:
@@ -55,43 +71,39 @@ async def sample_file(lines: list) -> Tuple[io.StringIO, str]:
     return io.StringIO(sample), file_name
 
 
-async def get_text_sample(file: UploadFile) -> list:
-    text_bytes = b""
-    while True:
-        chunk = await file.read(2048)
-        if not chunk:
-            break
-        text_bytes += chunk
-
-    lines = []
-    text_stream = io.StringIO(text_bytes.decode('utf-8'))
-    try:
-        line = text_stream.readline()
-        while line:
-            lines.append(line.rstrip('\n'))
-            line = text_stream.readline()
-    except EOFError:
-        pass
-
-    return lines[:-1]
-
-
-async def get_compressed_sample(file: UploadFile) -> list:
-    compressed_bytes = b""
-    while True:
-        chunk = await file.read(2048)
-        if not chunk:
-            break
-        compressed_bytes += chunk
-
-    lines = []
-    with gzip.open(io.BytesIO(compressed_bytes), 'rt') as f:
-        try:
-            line = f.readline()
-            while line:
-                lines.append(line.rstrip('\n'))
-                line = f.readline()
-        except EOFError:
-            pass
-    # last line might not be a full line
-    return lines[:-1]
+async def read_sample_lines(file: UploadFile, max_bytes: int = SAMPLE_BYTES, max_lines: int = SAMPLE_LINES) -> list:
+    """
+    The first lines of an upload, gzipped or not, reading and inflating only as much of it as they need.
+    """
+    pending = await file.read(READ_SIZE)
+    decompressor = zlib.decompressobj(GZIP_WBITS) if pending.startswith(b'\x1f\x8b') else None
+    sample = bytearray()
+    newlines = 0
+    exhausted = False
+    while len(sample) < max_bytes and newlines <= max_lines:
+        if not pending:
+            pending = await file.read(READ_SIZE)
+            if not pending:
+                exhausted = True
+                break
+        if decompressor is None:
+            data, pending = pending, b''
+        else:
+            data = decompressor.decompress(pending, max_bytes - len(sample))
+            pending = decompressor.unconsumed_tail
+            if decompressor.eof:
+                # gzip files can be several members back to back, bgzip writes one per block
+                pending = decompressor.unused_data + pending
+                decompressor = zlib.decompressobj(GZIP_WBITS)
+        sample += data
+        newlines += data.count(b'\n')
+
+    truncated = len(sample) > max_bytes
+    lines = bytes(sample[:max_bytes]).decode('utf-8', errors='replace').split('\n')
+    if not exhausted or truncated:
+        # last line might not be a full line
+        lines = lines[:-1]
+    lines = [line.rstrip('\r') for line in lines]
+    while lines and not lines[-1]:
+        lines.pop()
+    return lines[:max_lines + 1]
@@ -0,0 +1,186 @@
+import io
+import itertools
+import json
+import os
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from job_server import s3
+from job_server.model import DatasetInfo
+from job_server.utils import run_in_executor
+from job_server.validation import (CHROMOSOMES, READ_SIZE, chromosome_sort_key, iter_blocks, normalize_chromosome,
+                                   normalized_codes, read_header)
+
+# canonical columns and their stored types, p-values stay double since GWAS p-values go far below float range.
+# The chromosome is the partition each file belongs to rather than a column in it.
+COLUMN_TYPES = {
+    'position': pa.uint32(),
+    'reference': pa.string(),
+    'alt': pa.string(),
+    'pValue': pa.float64(),
+    'beta': pa.float32(),
+    'oddsRatio': pa.float32(),
+    'se': pa.float32(),
+    'n': pa.float32(),
+}
+# rows buffered per chromosome before they are written out as a row group
+ROW_GROUP_ROWS = int(os.getenv('JOB_SERVER_INGEST_ROW_GROUP_ROWS', 128 * 1024))
+INGEST_TIMEOUT = float(os.getenv('JOB_SERVER_INGEST_TIMEOUT', 3600))
+# the normalized copy is written here for the analysis methods run in Batch (dig-ldsc-methods) to read, nothing in
+# this server reads it back
+MANIFEST = '_manifest.json'
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='ingest')
+
+
+def check_deadline(deadline: float = None):
+    if deadline is not None and time.monotonic() > deadline:
+        raise TimeoutError("The ingest ran out of time")
+
+
+def partition_key(prefix: str, chromosome: str) -> str:
+    return f"{prefix}/chromosome={chromosome}/part-0.parquet"
+
+
+def normalize_block(block: bytes, delimiter: str, header: list, col_map: dict) -> Iterator[tuple]:
+    """
+    One block of validated rows as (chromosome, table) pairs with canonical names and types.
+    """
+    fields = {field: column for field, column in col_map.items()
+              if column and column in header and (field in COLUMN_TYPES or field == 'chromosome')}
+    df = pd.read_csv(io.BytesIO(block), sep=delimiter, header=None, names=header,
+                     usecols=list(dict.fromkeys(fields.values())), keep_default_na=False, na_values=[''],
+                     dtype={column: 'category' if field in ('chromosome', 'reference', 'alt') else float
+                            for field, column in fields.items()})
+    columns = {}
+    for field in COLUMN_TYPES:
+        column = fields.get(field)
+        if column is None:
+            continue
+        if field in ('reference', 'alt'):
+            codes, distinct = normalized_codes(df[column], str.upper)
+            columns[field] = pa.array(distinct, pa.string()).take(pa.array(codes, mask=codes < 0))
+        else:
+            columns[field] = pa.array(df[column].to_numpy(), COLUMN_TYPES[field], from_pandas=True)
+    table = pa.table(columns)
+    chromosome_codes, chromosomes = normalized_codes(df[fields['chromosome']], normalize_chromosome)
+    # one stable sort groups the rows of each chromosome, keeping file order within it
+    order = np.argsort(chromosome_codes, kind='stable')
+    sorted_codes = chromosome_codes[order]
+    bounds = np.flatnonzero(np.diff(sorted_codes)) + 1
+    for start, end in zip(itertools.chain([0], bounds), itertools.chain(bounds, [len(order)])):
+        # rows on contigs validation skipped are left out here too
+        if sorted_codes[start] >= 0 and chromosomes[sorted_codes[start]] in CHROMOSOMES:
+            yield chromosomes[sorted_codes[start]], table.take(pa.array(order[start:end]))
+
+
+class PartitionedWriter:
+    """
+    Writes one parquet file per chromosome into a local directory, buffering each chromosome's rows until there
+    are enough for a row group so memory stays bounded by about ROW_GROUP_ROWS rows per chromosome.
+    """
+    __slots__ = ('directory', 'schema', 'row_group_rows', 'writers', 'pending', 'rows')
+
+    def __init__(self, directory: str, schema: pa.Schema, row_group_rows: int = None):
+        self.directory = directory
+        self.schema = schema
+        self.row_group_rows = row_group_rows or ROW_GROUP_ROWS
+        self.writers = {}
+        self.pending = {}
+        self.rows = {}
+
+    def path(self, chromosome: str) -> str:
+        return partition_key(self.directory, chromosome)
+
+    def write(self, chromosome: str, table: pa.Table):
+        pending = self.pending.setdefault(chromosome, [])
+        pending.append(table.cast(self.schema))
+        self.rows[chromosome] = self.rows.get(chromosome, 0) + len(table)
+        if sum(len(table) for table in pending) >= self.row_group_rows:
+            self._flush(chromosome)
+
+    def _flush(self, chromosome: str):
+        pending = self.pending.pop(chromosome, [])
+        if not pending:
+            return
+        writer = self.writers.get(chromosome)
+        if writer is None:
+            os.makedirs(os.path.dirname(self.path(chromosome)), exist_ok=True)
+            writer = self.writers[chromosome] = pq.ParquetWriter(self.path(chromosome), self.schema,
+                                                                 compression='zstd')
+        writer.write_table(pa.concat_tables(pending), row_group_size=self.row_group_rows)
+
+    def close(self) -> dict:
+        for chromosome in list(self.pending):
+            self._flush(chromosome)
+        for writer in self.writers.values():
+            writer.close()
+        return self.rows
+
+
+def ingest_stream(chunks: Iterator[bytes], dataset: DatasetInfo, directory: str, deadline: float = None) -> dict:
+    """
+    Writes a validated upload, read as a stream of byte chunks, as chromosome partitioned parquet under
+    directory.  Returns the manifest describing what was written, or raises TimeoutError once past deadline.
+    """
+    blocks = iter_blocks(chunks)
+    header, delimiter, first_block = read_header(next(blocks, b''), dataset.separator)
+    fields = [field for field in COLUMN_TYPES if dataset.col_map.get(field) in header]
+    writer = PartitionedWriter(directory, pa.schema([(field, COLUMN_TYPES[field]) for field in fields]))
+    try:
+        for block in itertools.chain([first_block] if first_block else [], blocks):
+            check_deadline(deadline)
+            for chromosome, table in normalize_block(block, delimiter, header, dataset.col_map):
+                writer.write(chromosome, table)
+    finally:
+        rows = writer.close()
+    return {"columns": ['chromosome'] + fields, "row_count": sum(rows.values()),
+            "chromosomes": {chromosome: rows[chromosome] for chromosome in sorted(rows, key=chromosome_sort_key)}}
+
+
+def ingest_upload(s3_key: str, user_name: str, dataset: DatasetInfo, timeout: float = None) -> dict:
+    """
+    Ingests into a staging prefix first, so a failed or interrupted ingest leaves any earlier copy as it was, then
+    swaps the staged partitions in with server-side copies.  The timeout is checked by the ingest itself, only
+    up to the swap, so one that runs out of time has stopped and left the earlier copy in place when it raises.
+    """
+    deadline = time.monotonic() + timeout if timeout else None
+    prefix = s3.get_normalized_path(user_name, dataset.name)
+    staging = f"{prefix}-staging-{uuid.uuid4().hex}"
+    try:
+        body = s3.get_object_body(s3_key)
+        with tempfile.TemporaryDirectory(prefix='ingest-') as directory:
+            try:
+                manifest = ingest_stream(body.iter_chunks(READ_SIZE), dataset, directory, deadline)
+            finally:
+                body.close()
+            for chromosome in manifest["chromosomes"]:
+                check_deadline(deadline)
+                s3.upload_file(partition_key(directory, chromosome), partition_key(staging, chromosome))
+        check_deadline(deadline)
+        # the old manifest goes first so readers stop trusting the partitions while they are replaced
+        s3.delete_keys([f"{prefix}/{MANIFEST}"])
+        s3.clear_dir(f"{prefix}/")
+        for chromosome in manifest["chromosomes"]:
+            s3.copy_object(partition_key(staging, chromosome), partition_key(prefix, chromosome))
+    finally:
+        s3.clear_dir(f"{staging}/")
+    # written last, readers only trust partitions once the manifest exists
+    s3.put_object(f"{prefix}/{MANIFEST}", json.dumps({**manifest, "source": s3_key}).encode('utf-8'))
+    return manifest
+
+
+async def ingest_upload_async(s3_key: str, user_name: str, dataset: DatasetInfo):
+    # waited for to the end, abandoning the thread would leave it writing while the next job reads
+    try:
+        await run_in_executor(_executor, None, ingest_upload, s3_key, user_name, dataset, INGEST_TIMEOUT)
+    except Exception as e:
+        print(f"Error ingesting {s3_key}: {str(e)}")
@@ -0,0 +1,114 @@
+import os
+import zlib
+from typing import Iterator, Optional
+
+from job_server import database_utils
+from job_server.database import get_db
+
+# uncompressed size a chunk is closed at, reading any part of a log costs at most two chunks more than the part
+CHUNK_BYTES = int(os.getenv('JOB_SERVER_LOG_CHUNK_BYTES', 64 * 1024))
+# chunks fetched per query when streaming a long range
+READ_BATCH = 8
+
+
+class LogChunkWriter:
+    """
+    Splits a log into independently compressed chunks, stored in job_log_chunks with the line and byte offsets
+    each one starts at.  Memory is bounded by one chunk however long the log is.
+    """
+    __slots__ = ('job_id', 'seq', 'first_line', 'byte_offset', 'pending', 'pending_bytes')
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.seq = 0
+        self.first_line = 0
+        self.byte_offset = 0
+        self.pending = []
+        self.pending_bytes = 0
+
+    def write(self, lines: list):
+        for line in lines:
+            data = (line + '\n').encode('utf-8')
+            self.pending.append(data)
+            self.pending_bytes += len(data)
+            if self.pending_bytes >= CHUNK_BYTES:
+                self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        body = b''.join(self.pending)
+        line_count = body.count(b'\n')
+        database_utils.append_log_chunk(get_db(), self.job_id, self.seq, self.first_line, line_count,
+                                        self.byte_offset, len(body), zlib.compress(body))
+        self.seq += 1
+        self.first_line += line_count
+        self.byte_offset += len(body)
+        self.pending = []
+        self.pending_bytes = 0
+
+
+class _Chunk:
+    # data is only set for a log already held in memory, and is uncompressed
+    __slots__ = ('seq', 'first_line', 'line_count', 'byte_offset', 'byte_length', 'data')
+
+    def __init__(self, seq, first_line, line_count, byte_offset, byte_length, data=None):
+        self.seq = seq
+        self.first_line = first_line
+        self.line_count = line_count
+        self.byte_offset = byte_offset
+        self.byte_length = byte_length
+        self.data = data
+
+
+class JobLog:
+    """
+    A job's stored log, read a few chunks at a time so only the requested lines or bytes are decompressed.
+    """
+
+    def __init__(self, job_id: str, chunks: list):
+        self.job_id = job_id
+        self.chunks = chunks
+        self.total_lines = sum(chunk.line_count for chunk in chunks)
+        self.total_bytes = sum(chunk.byte_length for chunk in chunks)
+
+    def lines(self, start: int, end: int) -> Iterator[bytes]:
+        selected = [chunk for chunk in self.chunks
+                    if chunk.first_line < end and chunk.first_line + chunk.line_count > start]
+        for chunk, body in self._read(selected):
+            lines = body.split(b'\n')[:-1]
+            lines = lines[max(start - chunk.first_line, 0):end - chunk.first_line]
+            if lines:
+                yield b'\n'.join(lines) + b'\n'
+
+    def byte_range(self, start: int, end: int) -> Iterator[bytes]:
+        # end is inclusive, as in an HTTP Range
+        selected = [chunk for chunk in self.chunks
+                    if chunk.byte_offset <= end and chunk.byte_offset + chunk.byte_length > start]
+        for chunk, body in self._read(selected):
+            yield body[max(start - chunk.byte_offset, 0):end - chunk.byte_offset + 1]
+
+    def _read(self, chunks: list) -> Iterator[tuple]:
+        for i in range(0, len(chunks), READ_BATCH):
+            batch = chunks[i:i + READ_BATCH]
+            missing = [chunk.seq for chunk in batch if chunk.data is None]
+            data = database_utils.get_log_chunks(get_db(), self.job_id, missing) if missing else {}
+            for chunk in batch:
+                yield chunk, chunk.data if chunk.data is not None else zlib.decompress(data[chunk.seq])
+
+
+def load_job_log(db, username: str, job_id: str) -> Optional[JobLog]:
+    index = database_utils.get_job_log_index(db, username, job_id)
+    if index is None:
+        return None
+    if index['legacy_log']:
+        # stored whole before logs were chunked, serve it as a single chunk
+        try:
+            body = zlib.decompressobj().decompress(index['legacy_log'])
+        except zlib.error as e:
+            print(f"Error reading log for job {job_id}: {str(e)}")
+            return JobLog(job_id, [])
+        if body and not body.endswith(b'\n'):
+            body += b'\n'
+        return JobLog(job_id, [_Chunk(0, 0, body.count(b'\n'), 0, len(body), body)])
+    return JobLog(job_id, [_Chunk(*chunk) for chunk in index['chunks']])
@@ -1,13 +1,23 @@
+import hashlib
 import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from typing import Optional
 from zoneinfo import ZoneInfo
 
 import jwt
 from jwt import ExpiredSignatureError, InvalidSignatureError, DecodeError
 
+from job_server import metrics
+
 ALGORITHM = "HS256"
 # one week
 ACCESS_TOKEN_EXPIRE_MINUTES = 60*24*7
+# verified tokens are remembered so repeat requests skip the signature check, for at most this long
+TOKEN_CACHE_SIZE = int(os.getenv('JOB_SERVER_TOKEN_CACHE_SIZE', 10000))
+TOKEN_CACHE_SECONDS = float(os.getenv('JOB_SERVER_TOKEN_CACHE_SECONDS', 3600))
 
 _jwt_secret = None
 
@@ -37,3 +47,57 @@ def get_decoded_jwt_data(cookie_data: str) -> tuple[dict, str]:
         return None, "Malformed token"
     except Exception as e:
         return None, f"Token error: {str(e)}"
+
+
+class TokenCache:
+    """
+    LRU of verified token payloads keyed by a digest of the token, each dropped once its token expires.
+    Only tokens that verified are stored, so garbage tokens can't push out real ones.
+    """
+    __slots__ = ('max_size', 'max_age', 'entries', 'lock')
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE, max_age: float = TOKEN_CACHE_SECONDS):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.entries: OrderedDict[bytes, tuple] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = hashlib.sha256(token.encode('utf-8')).digest()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, token: str, data: dict):
+        expires_at = min(data.get('exp', float('inf')), time.time() + self.max_age)
+        key = hashlib.sha256(token.encode('utf-8')).digest()
+        with self.lock:
+            self.entries[key] = (data, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache()
+
+
+def verify_token(token: str) -> Optional[dict]:
+    data = token_cache.get(token)
+    if data is not None:
+        metrics.increment('auth.token_cache.hits')
+        return data
+    metrics.increment('auth.token_cache.misses')
+    data = get_decoded_jwt_data(token)[0]
+    if data:
+        token_cache.put(token, data)
+    return data
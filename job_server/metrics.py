@@ -0,0 +1,68 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# upper bounds, in milliseconds, of the latency histogram buckets
+LATENCY_BUCKETS_MS = [0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, 5000]
+
+_lock = threading.Lock()
+_timers = {}
+_counters = {}
+
+
+class Timer:
+    __slots__ = ('count', 'total_ms', 'max_ms', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def observe(self, ms: float):
+        with _lock:
+            self.count += 1
+            self.total_ms += ms
+            self.max_ms = max(self.max_ms, ms)
+            self.buckets[bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe((time.perf_counter() - start) * 1000)
+
+    def snapshot(self) -> dict:
+        with _lock:
+            bounds = [str(bound) for bound in LATENCY_BUCKETS_MS] + ['+Inf']
+            return {"count": self.count, "total_ms": self.total_ms, "max_ms": self.max_ms,
+                    "mean_ms": self.total_ms / self.count if self.count else None,
+                    "buckets": dict(zip(bounds, self.buckets))}
+
+
+def timer(name: str) -> Timer:
+    with _lock:
+        if name not in _timers:
+            _timers[name] = Timer()
+        return _timers[name]
+
+
+def increment(name: str, amount: int = 1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def snapshot() -> dict:
+    with _lock:
+        timers = dict(_timers)
+        counters = dict(_counters)
+    return {"timers": {name: value.snapshot() for name, value in timers.items()}, "counters": counters}
+
+
+def reset():
+    with _lock:
+        _timers.clear()
+        _counters.clear()
@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import Union
+from typing import List, Union
 
 from pydantic import BaseModel
 
@@ -11,6 +11,10 @@ class UserCredentials(BaseModel):
 class User(BaseModel):
     username: str
 
+class UploadedPart(BaseModel):
+    part_number: int
+    etag: str
+
 class DatasetInfo(BaseModel):
     name: str
     file: str
@@ -20,6 +24,29 @@ class DatasetInfo(BaseModel):
     phenotype: Union[str, None]
     effective_n: Union[float, None]
     col_map: dict
+    # set when the file was sent as a multipart upload, which finalizing completes
+    upload_id: Union[str, None] = None
+    parts: Union[List[UploadedPart], None] = None
+    # filled in by upload validation
+    row_count: Union[int, None] = None
+    stats: Union[dict, None] = None
+    # the report of an upload that failed validation
+    validation: Union[dict, None] = None
+
+class MultipartUploadRequest(BaseModel):
+    filename: str
+    size: Union[int, None] = None
+
+class PartUrlsRequest(BaseModel):
+    filename: str
+    part_numbers: List[int]
+
+class CompleteUploadRequest(BaseModel):
+    filename: str
+    parts: Union[List[UploadedPart], None] = None
+
+class BulkDeleteRequest(BaseModel):
+    datasets: List[str]
 
 class AnalysisMethod(str, Enum):
     sumstats = "sumstats"
@@ -30,3 +57,7 @@ class AnalysisRequest(BaseModel):
     dataset: str
     method: AnalysisMethod
 
+
+class BulkAnalysisRequest(BaseModel):
+    jobs: List[AnalysisRequest]
+
@@ -0,0 +1,204 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from job_server import s3
+from job_server.results_query import ResultsQuery
+
+RESULTS_COLUMNS = ['annotation', 'tissue', 'biosample', 'enrichment', 'pValue']
+VERSION_METADATA_KEY = b'dig_job_server_version'
+
+MAX_MEMORY_BYTES = int(os.getenv('JOB_SERVER_RESULTS_CACHE_BYTES', 512 * 1024 * 1024))
+MAX_DISK_BYTES = int(os.getenv('JOB_SERVER_RESULTS_DISK_CACHE_BYTES', 4 * 1024 * 1024 * 1024))
+CACHE_DIR = os.getenv('JOB_SERVER_RESULTS_CACHE_DIR',
+                      os.path.join(tempfile.gettempdir(), 'dig-job-server-results'))
+# how long a memory entry is trusted before its ETag/LastModified is checked against S3 again
+REVALIDATE_SECONDS = float(os.getenv('JOB_SERVER_RESULTS_REVALIDATE_SECONDS', 30))
+# loads of different paths that hash to the same stripe wait on each other, which only costs an occasional stall
+LOCK_STRIPES = 64
+
+
+def read_results(body) -> pd.DataFrame:
+    df = pd.read_csv(io.TextIOWrapper(body), sep='\t', names=RESULTS_COLUMNS)
+    df['pValue'] = pd.to_numeric(df['pValue'])
+    return df
+
+
+def object_version(s3_object: dict) -> str:
+    return f"{s3_object['ETag']}:{s3_object['LastModified'].isoformat()}"
+
+
+class _Entry:
+    __slots__ = ('value', 'version', 'size', 'checked_at')
+
+    def __init__(self, value, version, size):
+        self.value = value
+        self.version = version
+        self.size = size
+        self.checked_at = time.monotonic()
+
+
+class ResultsCache:
+    """
+    Two tier cache of sldsc results keyed on their S3 path.  Entries live in memory as indexed ResultsQuery
+    objects (bounded by bytes) and in parquet files on local disk, and are only served while they match the
+    ETag/LastModified of the S3 object they were read from.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_memory_bytes=MAX_MEMORY_BYTES, max_disk_bytes=MAX_DISK_BYTES,
+                 revalidate_seconds=REVALIDATE_SECONDS):
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.revalidate_seconds = revalidate_seconds
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.RLock()
+        self._path_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'stale': 0, 'evictions': 0,
+                       'disk_evictions': 0, 'invalidations': 0}
+
+    def get(self, s3_path: str) -> ResultsQuery:
+        query = self.peek(s3_path)
+        if query is not None:
+            return query
+        path_lock = self._path_locks[hash(s3_path) % LOCK_STRIPES]
+
+        # only one thread per path talks to S3, the others wait and then read what it cached
+        with path_lock:
+            with self._lock:
+                entry = self._entries.get(s3_path)
+                if entry and time.monotonic() - entry.checked_at < self.revalidate_seconds:
+                    self._stats['hits'] += 1
+                    return entry.value
+            return self._load(s3_path, entry)
+
+    def peek(self, s3_path: str):
+        """
+        Returns the in-memory entry if it is still within its revalidation window, without touching S3 or disk.
+        """
+        with self._lock:
+            entry = self._entries.get(s3_path)
+            if entry and time.monotonic() - entry.checked_at < self.revalidate_seconds:
+                self._entries.move_to_end(s3_path)
+                self._stats['hits'] += 1
+                return entry.value
+            return None
+
+    def _load(self, s3_path: str, entry: _Entry) -> ResultsQuery:
+        version = object_version(s3.get_results_head(s3_path))
+        with self._lock:
+            if entry and entry.version == version and self._entries.get(s3_path) is entry:
+                entry.checked_at = time.monotonic()
+                self._entries.move_to_end(s3_path)
+                self._stats['hits'] += 1
+                return entry.value
+            if entry:
+                self._stats['stale'] += 1
+                self._remove(s3_path)
+
+        df = self._read_disk(s3_path, version)
+        if df is not None:
+            with self._lock:
+                self._stats['disk_hits'] += 1
+        else:
+            s3_object = s3.get_results(s3_path)
+            version = object_version(s3_object)
+            df = read_results(s3_object['Body'])
+            self._write_disk(s3_path, version, df)
+            with self._lock:
+                self._stats['misses'] += 1
+        return self._put(s3_path, version, ResultsQuery(df))
+
+    def invalidate(self, s3_path: str):
+        with self._lock:
+            self._remove(s3_path)
+            self._stats['invalidations'] += 1
+        try:
+            os.remove(self._disk_path(s3_path))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        with self._lock:
+            for s3_path in list(self._entries):
+                self._remove(s3_path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, 'entries': len(self._entries), 'memory_bytes': self._memory_bytes,
+                    'max_memory_bytes': self.max_memory_bytes}
+
+    def _put(self, s3_path: str, version: str, query: ResultsQuery) -> ResultsQuery:
+        size = query.nbytes
+        with self._lock:
+            self._remove(s3_path)
+            if size > self.max_memory_bytes:
+                return query
+            self._entries[s3_path] = _Entry(query, version, size)
+            self._memory_bytes += size
+            while self._memory_bytes > self.max_memory_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats['evictions'] += 1
+        return query
+
+    def _remove(self, s3_path: str):
+        entry = self._entries.pop(s3_path, None)
+        if entry:
+            self._memory_bytes -= entry.size
+
+    def _disk_path(self, s3_path: str) -> str:
+        return os.path.join(self.cache_dir, f"{hashlib.sha256(s3_path.encode('utf-8')).hexdigest()}.parquet")
+
+    def _read_disk(self, s3_path: str, version: str):
+        file_path = self._disk_path(s3_path)
+        try:
+            metadata = pq.read_schema(file_path).metadata or {}
+            if metadata.get(VERSION_METADATA_KEY, b'').decode('utf-8') != version:
+                os.remove(file_path)
+                return None
+            os.utime(file_path)
+            return pq.read_table(file_path).to_pandas()
+        except (FileNotFoundError, pa.ArrowException):
+            return None
+
+    def _write_disk(self, s3_path: str, version: str, df: pd.DataFrame):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                               VERSION_METADATA_KEY: version.encode('utf-8')})
+        file_path = self._disk_path(s3_path)
+        tmp_path = f"{file_path}.{threading.get_ident()}.tmp"
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, file_path)
+        self._trim_disk()
+
+    def _trim_disk(self):
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.parquet'):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                files.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+            with self._lock:
+                self._stats['disk_evictions'] += 1
+
+
+results_cache = ResultsCache()
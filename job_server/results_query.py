@@ -0,0 +1,159 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+FACET_COLUMNS = {'tissue': 'tissues', 'biosample': 'biosamples', 'annotation': 'annotations'}
+DEFAULT_SORT_FIELD = 'pValue'
+MAX_CACHED_PAGES = 8
+
+
+def parse_numeric_filter(value: str):
+    for op in ('>=', '<=', '>', '<'):
+        if value.startswith(op):
+            return op, float(value[len(op):])
+    return '==', float(value)
+
+
+class ResultsQuery:
+    """
+    Read-only index over a results DataFrame for the /results endpoint.  Text columns are dictionary
+    encoded so filters are evaluated once per distinct value and then applied with a single lookup,
+    sort orders are computed once per column, and the rows matching recent filters are kept for paging.
+    Facet values are listed in the order they first appear in the sorted rows, as pandas unique() gives.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df.reset_index(drop=True)
+        self.numeric = {}
+        self.codes = {}
+        self.categories = {}
+        for column in self.df.columns:
+            if self.df[column].dtype.kind in 'ifc':
+                self.numeric[column] = self.df[column].to_numpy(dtype=np.float64)
+            else:
+                codes, uniques = pd.factorize(self.df[column])
+                self.codes[column] = codes
+                self.categories[column] = pd.Series(uniques, dtype=object)
+        self._orders = {}
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+        for column in ('pValue', 'enrichment'):
+            if column in self.df.columns:
+                self._order(column)
+
+    def __len__(self):
+        return len(self.df)
+
+    @property
+    def nbytes(self) -> int:
+        # the kept pages fill in after the cache has sized the entry, so they count at their most: one
+        # int32 row order per page
+        return int(self.df.memory_usage(deep=True).sum() +
+                   sum(values.nbytes for values in self.numeric.values()) +
+                   sum(codes.nbytes for codes in self.codes.values()) +
+                   sum(order.nbytes for order in self._orders.values()) +
+                   MAX_CACHED_PAGES * len(self.df) * np.dtype(np.int32).itemsize)
+
+    def page(self, filters: dict, first: int, rows: int, sort_field: str = None, ascending: bool = True) -> dict:
+        if not sort_field:
+            sort_field, ascending = DEFAULT_SORT_FIELD, True
+        if sort_field not in self.df.columns:
+            raise KeyError(sort_field)
+        filters = {column: value for column, value in filters.items() if column in self.df.columns}
+        order, facets = self._filtered(filters, sort_field, ascending)
+        return {
+            "items": self.df.iloc[order[first:first + rows]].to_dict('records'),
+            "totalRecords": len(order),
+            **facets
+        }
+
+    def _mask(self, filters: dict):
+        mask = None
+        for column, value in filters.items():
+            if column in self.numeric:
+                try:
+                    column_mask = self._numeric_mask(column, value)
+                except ValueError:
+                    continue
+            else:
+                column_mask = self._text_mask(column, value)
+            mask = column_mask if mask is None else mask & column_mask
+        return mask
+
+    def _numeric_mask(self, column: str, value: str) -> np.ndarray:
+        op, threshold = parse_numeric_filter(value)
+        values = self.numeric[column]
+        if op == '>=':
+            return values >= threshold
+        if op == '<=':
+            return values <= threshold
+        if op == '>':
+            return values > threshold
+        if op == '<':
+            return values < threshold
+        return values == threshold
+
+    def _text_mask(self, column: str, value: str) -> np.ndarray:
+        # evaluate against the distinct values (plus 'nan', which missing values stringify to), then
+        # expand to rows; missing values have code -1 which picks the last slot of the lookup table
+        values = pd.concat([self.categories[column].astype(str), pd.Series(['nan'])], ignore_index=True)
+        if value.startswith("eq:"):
+            matches = values.str.lower() == value[3:].lower()
+        elif value.startswith("contains:"):
+            matches = values.str.contains(value[9:], case=False, na=False)
+        else:
+            matches = values.str.contains(value, case=False, na=False)
+        return matches.to_numpy(dtype=bool)[self.codes[column]]
+
+    def _present(self, column: str, order: np.ndarray) -> list:
+        codes = pd.unique(self.codes[column][order])
+        return self.categories[column][codes[codes >= 0]].tolist()
+
+    def _order(self, column: str) -> np.ndarray:
+        if column not in self._orders:
+            if column in self.numeric:
+                keys = self.numeric[column]
+            else:
+                # rank each distinct value, missing values (code -1) sort last like pandas does
+                categories = self.categories[column].astype(str)
+                ranks = np.empty(len(categories) + 1, dtype=np.int64)
+                ranks[:-1] = np.argsort(np.argsort(categories.to_numpy(), kind='stable'), kind='stable')
+                ranks[-1] = len(categories)
+                keys = ranks[self.codes[column]]
+            self._orders[column] = np.argsort(keys, kind='stable').astype(np.int32)
+        return self._orders[column]
+
+    def _sorted(self, column: str, ascending: bool) -> np.ndarray:
+        order = self._order(column)
+        if ascending:
+            return order
+        if column in self.numeric:
+            missing = int(np.isnan(self.numeric[column]).sum())
+        else:
+            missing = int((self.codes[column] == -1).sum())
+        present = len(order) - missing
+        return np.concatenate([order[:present][::-1], order[present:]])
+
+    def _filtered(self, filters: dict, sort_field: str, ascending: bool):
+        key = (tuple(sorted(filters.items())), sort_field, ascending)
+        with self._lock:
+            cached = self._pages.get(key)
+            if cached is not None:
+                self._pages.move_to_end(key)
+                return cached
+
+        mask = self._mask(filters)
+        with self._lock:
+            order = self._sorted(sort_field, ascending)
+        if mask is not None:
+            order = order[mask[order]]
+        facets = {key: self._present(column, order) for column, key in FACET_COLUMNS.items()
+                  if column in self.codes}
+
+        with self._lock:
+            self._pages[key] = (order, facets)
+            while len(self._pages) > MAX_CACHED_PAGES:
+                self._pages.popitem(last=False)
+        return order, facets
@@ -1,47 +1,208 @@
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
 import os
+from botocore.config import Config
+
+from job_server.utils import run_in_executor
 
 BUCKET_NAME = os.getenv('JOB_SERVER_BUCKET', 'dig-ldsc-server')
+S3_CONCURRENCY = int(os.getenv('JOB_SERVER_S3_CONCURRENCY', 16))
+S3_CONNECT_TIMEOUT = float(os.getenv('JOB_SERVER_S3_CONNECT_TIMEOUT', 5))
+S3_READ_TIMEOUT = float(os.getenv('JOB_SERVER_S3_READ_TIMEOUT', 60))
+# upper bound on a whole offloaded call, including retries and time spent queued for a worker
+S3_CALL_TIMEOUT = float(os.getenv('JOB_SERVER_S3_CALL_TIMEOUT', 120))
+# S3 allows parts of 5 MB to 5 GB and at most 10,000 of them
+MULTIPART_PART_SIZE = int(os.getenv('JOB_SERVER_MULTIPART_PART_SIZE', 64 * 1024 * 1024))
+MULTIPART_MIN_PART_SIZE = 5 * 1024 * 1024
+MULTIPART_MAX_PARTS = 10000
+
+_client = None
+_client_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=S3_CONCURRENCY, thread_name_prefix='s3')
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                # one pool slot per worker thread plus headroom for streamed downloads
+                _client = boto3.client('s3', config=Config(max_pool_connections=S3_CONCURRENCY * 2,
+                                                           connect_timeout=S3_CONNECT_TIMEOUT,
+                                                           read_timeout=S3_READ_TIMEOUT,
+                                                           retries={'max_attempts': 3, 'mode': 'standard'}))
+    return _client
+
+
+def reset_client():
+    global _client
+    with _client_lock:
+        _client = None
+
+
+async def run_async(fn, *args, **kwargs):
+    """
+    Runs a blocking S3 call on the bounded S3 worker pool so it doesn't stall the event loop.
+    """
+    return await run_in_executor(_executor, S3_CALL_TIMEOUT, fn, *args, **kwargs)
 
 
 def get_bucket_path(path: str, file_name: str) -> str:
     return f"s3://{BUCKET_NAME}/{path}/{file_name}"
 
 
-def get_datasets(user_name: str) -> list[str]:
-    client = boto3.client('s3')
-
+def list_folders(prefix: str) -> list[str]:
+    paginator = get_client().get_paginator('list_objects_v2')
     folder_names = []
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix=prefix, Delimiter='/'):
+        for common_prefix in page.get('CommonPrefixes', []):
+            folder_names.append(common_prefix['Prefix'][len(prefix):-1])
+    return folder_names
 
-    response = client.list_objects_v2(Bucket=BUCKET_NAME, Prefix=f"userdata/{user_name}/genetic/", Delimiter='/')
 
-    if 'CommonPrefixes' in response:
-        for prefix in response['CommonPrefixes']:
-            folder = prefix['Prefix'][len(f"userdata/{user_name}/genetic/"):-1]
-            folder_names.append(folder)
+def get_datasets(user_name: str) -> list[str]:
+    return list_folders(f"userdata/{user_name}/genetic/")
 
-    return folder_names
+
+def get_users() -> list[str]:
+    return list_folders("userdata/")
 
 
 def generate_presigned_url(param, params, expires_in):
-    s3_client = boto3.client('s3')
+    s3_client = get_client()
     return s3_client.generate_presigned_url(param, Params=params, ExpiresIn=expires_in)
 
 
+def multipart_part_size(size: int = None) -> int:
+    if not size:
+        return MULTIPART_PART_SIZE
+    # grow parts in whole MB when a file is too big for the default size
+    needed = -(-size // MULTIPART_MAX_PARTS)
+    return max(MULTIPART_PART_SIZE, MULTIPART_MIN_PART_SIZE, -(-needed // 2 ** 20) * 2 ** 20)
+
+
+def create_multipart_upload(key: str) -> str:
+    s3_client = get_client()
+    return s3_client.create_multipart_upload(Bucket=BUCKET_NAME, Key=key)['UploadId']
+
+
+def presign_upload_parts(key: str, upload_id: str, part_numbers: list, expires_in: int) -> dict:
+    # presigning is local signing, no request is made per part
+    s3_client = get_client()
+    return {part_number: s3_client.generate_presigned_url(
+        'upload_part', Params={'Bucket': BUCKET_NAME, 'Key': key, 'UploadId': upload_id, 'PartNumber': part_number},
+        ExpiresIn=expires_in) for part_number in part_numbers}
+
+
+def list_uploaded_parts(key: str, upload_id: str) -> list:
+    s3_client = get_client()
+    paginator = s3_client.get_paginator('list_parts')
+    parts = []
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Key=key, UploadId=upload_id):
+        parts.extend({'part_number': part['PartNumber'], 'etag': part['ETag'], 'size': part['Size']}
+                     for part in page.get('Parts', []))
+    return parts
+
+
+def complete_multipart_upload(key: str, upload_id: str, parts: list = None):
+    """
+    parts are the {part_number, etag} the client uploaded, or None to complete with every part S3 has.
+    """
+    s3_client = get_client()
+    parts = parts if parts is not None else list_uploaded_parts(key, upload_id)
+    s3_client.complete_multipart_upload(
+        Bucket=BUCKET_NAME, Key=key, UploadId=upload_id,
+        MultipartUpload={'Parts': [{'PartNumber': part['part_number'], 'ETag': part['etag']}
+                                   for part in sorted(parts, key=lambda part: part['part_number'])]})
+
+
+def abort_multipart_upload(key: str, upload_id: str):
+    s3_client = get_client()
+    s3_client.abort_multipart_upload(Bucket=BUCKET_NAME, Key=key, UploadId=upload_id)
+
+
 def upload_metadata(metadata, path):
-    s3_client = boto3.client('s3')
+    s3_client = get_client()
     s3_client.put_object(Bucket=BUCKET_NAME, Key=f"{path}/metadata", Body=json.dumps(metadata.dict()).encode('utf-8'))
 
 
-def get_results(path):
-    s3_client = boto3.client('s3')
+def get_upload_path(user_name: str, dataset: str) -> str:
+    return f"userdata/{user_name}/genetic/{dataset}/raw"
+
+
+def get_results_path(user_name: str, dataset: str) -> str:
+    return f"userdata/{user_name}/genetic/{dataset}/sldsc/sldsc"
+
+
+def get_normalized_path(user_name: str, dataset: str) -> str:
+    return f"userdata/{user_name}/genetic/{dataset}/parquet"
+
+
+def get_batch_manifest_path(user_name: str, manifest_id: str) -> str:
+    # kept outside genetic/ so deleting a dataset never removes a manifest a running array job still reads
+    return f"userdata/{user_name}/batch/{manifest_id}.json"
+
+
+def get_results(path, byte_range: str = None):
+    s3_client = get_client()
+    if byte_range:
+        return s3_client.get_object(Bucket=BUCKET_NAME, Key=f"{path}/tissue.output.tsv", Range=byte_range)
     return s3_client.get_object(Bucket=BUCKET_NAME, Key=f"{path}/tissue.output.tsv")
 
 
+def get_object_body(key):
+    s3_client = get_client()
+    return s3_client.get_object(Bucket=BUCKET_NAME, Key=key)['Body']
+
+
+def put_object(key: str, body: bytes):
+    s3_client = get_client()
+    s3_client.put_object(Bucket=BUCKET_NAME, Key=key, Body=body)
+
+
+def upload_file(local_path: str, key: str):
+    s3_client = get_client()
+    s3_client.upload_file(local_path, BUCKET_NAME, key)
+
+
+def copy_object(source_key: str, key: str):
+    s3_client = get_client()
+    s3_client.copy({'Bucket': BUCKET_NAME, 'Key': source_key}, BUCKET_NAME, key)
+
+
+def get_results_head(path):
+    s3_client = get_client()
+    return s3_client.head_object(Bucket=BUCKET_NAME, Key=f"{path}/tissue.output.tsv")
+
+
+def list_page(prefix: str, continuation_token: str = None, delimiter: str = None) -> tuple:
+    """
+    One page of up to 1000 keys directly under prefix, the sub-prefixes when listing with a delimiter, and the
+    token for the next page or None.
+    """
+    params = {'Bucket': BUCKET_NAME, 'Prefix': prefix}
+    if continuation_token:
+        params['ContinuationToken'] = continuation_token
+    if delimiter:
+        params['Delimiter'] = delimiter
+    response = get_client().list_objects_v2(**params)
+    return ([obj['Key'] for obj in response.get('Contents', [])],
+            [common_prefix['Prefix'] for common_prefix in response.get('CommonPrefixes', [])],
+            response.get('NextContinuationToken'))
+
+
+def delete_keys(keys: list) -> list:
+    # at most 1000 keys, returns the ones S3 failed to delete
+    response = get_client().delete_objects(Bucket=BUCKET_NAME,
+                                           Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True})
+    return [error['Key'] for error in response.get('Errors', [])]
+
+
 def clear_dir(s3_path):
-    s3 = boto3.client('s3')
+    s3 = get_client()
     paginator = s3.get_paginator('list_objects_v2')
     page_iterator = paginator.paginate(Bucket=BUCKET_NAME, Prefix=s3_path)
 
@@ -0,0 +1,149 @@
+import asyncio
+import os
+from collections import deque
+from itertools import groupby
+
+from job_server import database_utils
+from job_server.execution import ExecutionBackend, create_execution_backend
+from job_server.database import get_db, run_db
+from job_server.status_hub import is_job_watched, publish_job_status, publish_job_statuses
+
+# jobs released to the execution backend and not yet finished, across everyone and for any one user
+MAX_RUNNING = int(os.getenv('JOB_SERVER_MAX_RUNNING_JOBS', 100))
+MAX_RUNNING_PER_USER = int(os.getenv('JOB_SERVER_MAX_RUNNING_JOBS_PER_USER', 10))
+# the queue is looked at again this often even when nothing has been queued or finished in this process
+SCHEDULE_SECONDS = float(os.getenv('JOB_SERVER_SCHEDULE_SECONDS', 10))
+# queued jobs read per pass; ones further back still run, they are just not given a position yet
+QUEUE_SCAN_LIMIT = int(os.getenv('JOB_SERVER_QUEUE_SCAN_LIMIT', 5000))
+# a single analysis someone is waiting on goes ahead of bulk submissions
+SINGLE_PRIORITY = 1
+BULK_PRIORITY = 0
+
+
+def fair_order(queued: list, after_user: str = None) -> list:
+    """
+    The order queued jobs, already sorted by priority then arrival, are released in: higher priorities first,
+    and within a priority users take turns one job at a time, starting with the user after after_user.
+    """
+    ordered = []
+    for _, jobs in groupby(queued, key=lambda job: job['priority']):
+        queues = {}
+        for job in jobs:
+            queues.setdefault(job['user'], deque()).append(job)
+        users = sorted(queues)
+        start = next((i for i, user in enumerate(users) if after_user is not None and user > after_user), 0)
+        turns = deque(users[start:] + users[:start])
+        while turns:
+            user = turns.popleft()
+            ordered.append(queues[user].popleft())
+            if queues[user]:
+                turns.append(user)
+    return ordered
+
+
+class Scheduler:
+    """
+    Admission control in front of the execution backend.  Analyses wait in dataset_jobs as QUEUED and are released, as slots
+    under the global and per-user limits free up, in fair_order.  The running counts come from the database,
+    so jobs started by other server processes, or before a restart, count against the limits too.
+    """
+
+    def __init__(self, backend: ExecutionBackend = None, max_running: int = MAX_RUNNING,
+                 max_running_per_user: int = MAX_RUNNING_PER_USER, interval: float = SCHEDULE_SECONDS):
+        self._backend = backend
+        self.max_running = max_running
+        self.max_running_per_user = max_running_per_user
+        self.interval = interval
+        self.last_user = None
+        self.positions = {}
+        self.tasks = set()
+        self._wakeup = asyncio.Event()
+
+    @property
+    def backend(self) -> ExecutionBackend:
+        if self._backend is None:
+            self._backend = create_execution_backend()
+        return self._backend
+
+    async def enqueue(self, user: str, jobs: list, priority: int = BULK_PRIORITY, bulk: bool = False):
+        # bulk jobs are handed to the backend together, as one array job per user, when they are released
+        await run_db(database_utils.log_jobs_start, get_db(), user, jobs, 'QUEUED', priority, bulk)
+        for dataset, method in jobs:
+            await publish_job_status(user, database_utils.get_dataset_hash(dataset, user),
+                                     {"status": f"QUEUED {method}", "dataset": dataset, "method": method})
+        self.wake()
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def run(self):
+        while True:
+            try:
+                await self.schedule_once()
+            except Exception as e:
+                print(f"Error scheduling jobs: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def schedule_once(self) -> int:
+        running, queued = await run_db(database_utils.get_job_queue, get_db(), QUEUE_SCAN_LIMIT)
+        total = sum(running.values())
+        released = []
+        waiting = []
+        for job in fair_order(queued, self.last_user):
+            if total < self.max_running and running.get(job['user'], 0) < self.max_running_per_user:
+                released.append(job)
+                running[job['user']] = running.get(job['user'], 0) + 1
+                total += 1
+                self.last_user = job['user']
+            else:
+                waiting.append(job)
+        claimed = await run_db(database_utils.claim_queued_jobs, get_db(), released, self.max_running,
+                               self.max_running_per_user) if released else []
+        # jobs other server processes filled the slots for first stay at the front of the queue
+        waiting = [job for job in released if job not in claimed] + waiting
+        bulk = {}
+        for job in claimed:
+            await publish_job_status(job['user'], job['id'], {
+                "status": f"RUNNING {job['method']}", "dataset": job['dataset'], "method": job['method']})
+            if job['bulk']:
+                bulk.setdefault(job['user'], []).append((job['dataset'], job['method']))
+            else:
+                self._start(job['user'], [(job['dataset'], job['method'])])
+        for user, jobs in bulk.items():
+            self._start(user, jobs)
+        await self.publish_positions(waiting)
+        return len(claimed)
+
+    async def publish_positions(self, waiting: list):
+        positions = {}
+        updates = []
+        for position, job in enumerate(waiting, 1):
+            # only jobs that moved hear about it, not the whole queue on every pass, and only once someone is
+            # listening; one nobody watches is left out of positions so it is sent when someone starts to
+            if self.positions.get(job['id']) == position:
+                positions[job['id']] = position
+            elif is_job_watched(job['user'], job['id']):
+                positions[job['id']] = position
+                updates.append((job['user'], job['id'], {
+                    "status": f"QUEUED {job['method']}", "dataset": job['dataset'], "method": job['method'],
+                    "queue_position": position}))
+        await publish_job_statuses(updates)
+        self.positions = positions
+
+    def _start(self, user: str, jobs: list):
+        task = asyncio.create_task(self.backend.run(user, jobs))
+        self.tasks.add(task)
+        task.add_done_callback(self._finished)
+
+    def _finished(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            print(f"Error running released jobs: {str(task.exception())}")
+        self.wake()
+
+
+scheduler = Scheduler()
@@ -1,3 +1,6 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 import fastapi
 import click
 from dotenv import load_dotenv
@@ -6,13 +9,29 @@ from fastapi.security import OAuth2PasswordBearer
 from fastapi.middleware.cors import CORSMiddleware
 
 
+from job_server import catalog, batch, deletion, scheduler, uploads
+from job_server.auth_backend import close_auth_backend
 from job_server.api import router
 from job_server.api import get_current_user
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+
+@asynccontextmanager
+async def lifespan(app: fastapi.FastAPI):
+    background = [asyncio.create_task(catalog.run_reconciler()),
+                  asyncio.create_task(batch.resume_jobs()),
+                  asyncio.create_task(deletion.resume_deletes()),
+                  asyncio.create_task(uploads.resume_uploads()),
+                  asyncio.create_task(scheduler.scheduler.run())]
+    yield
+    for task in background:
+        task.cancel()
+    close_auth_backend()
+
+
 def create_app():
-    app = fastapi.FastAPI(title='Dig Job Server', redoc_url=None)
+    app = fastapi.FastAPI(title='Dig Job Server', redoc_url=None, lifespan=lifespan)
 
     for route in router.routes:
         if route.name not in {'login', 'job_status'}:
@@ -48,6 +67,7 @@ def cli_serve(port):
         allow_credentials=True,
         allow_methods=['*'],
         allow_headers=['*'],
+        expose_headers=['X-Log-Lines', 'X-Log-First-Line', 'Content-Range'],
     )
 
     uvicorn.run(app, host="0.0.0.0", port=port)
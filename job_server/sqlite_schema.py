@@ -0,0 +1,93 @@
+# sqlite equivalent of the schema the alembic migrations build in MySQL, used for tests and benchmarks.
+# Keep in step with alembic/versions.
+from sqlalchemy import text
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS `users` (
+    `id` INTEGER PRIMARY KEY AUTOINCREMENT,
+    `user_name` varchar(50) NOT NULL UNIQUE,
+    `password` varchar(255),
+    `created_at` datetime NOT NULL,
+    `last_login` datetime
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS `dataset_jobs` (
+    `id` char(64) NOT NULL,
+    `user` varchar(50) NOT NULL,
+    `status` varchar(255) NOT NULL,
+    `job_log` longblob NULL,
+    `updated_at` datetime NOT NULL,
+    `dataset` varchar(255) NULL,
+    `method` varchar(20) NULL,
+    `batch_job_id` varchar(64) NULL,
+    `batch_status` varchar(20) NULL,
+    `submitted_at` datetime NULL,
+    `last_polled_at` datetime NULL,
+    `priority` int NOT NULL DEFAULT 0,
+    `queued_at` datetime(6) NULL,
+    `bulk` tinyint(1) NOT NULL DEFAULT 0,
+    PRIMARY KEY (`id`)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_dataset_jobs_batch_status ON dataset_jobs (batch_status)",
+    "CREATE INDEX IF NOT EXISTS idx_dataset_jobs_user_updated_at ON dataset_jobs (user, updated_at)",
+    "CREATE INDEX IF NOT EXISTS idx_dataset_jobs_status_priority ON dataset_jobs (status, priority, queued_at)",
+    """
+    CREATE TABLE IF NOT EXISTS `datasets` (
+    `id` char(64) NOT NULL,
+    `uploaded_by` varchar(50) NOT NULL,
+    `metadata` json NOT NULL,
+    `uploaded_at` datetime NOT NULL,
+    `name` varchar(255) GENERATED ALWAYS AS (json_extract(`metadata`, '$.name')) STORED,
+    PRIMARY KEY (`id`)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_datasets_uploaded_by_name ON datasets (uploaded_by, name)",
+    """
+    CREATE TABLE IF NOT EXISTS `dataset_catalog` (
+    `id` char(64) NOT NULL,
+    `user` varchar(50) NOT NULL,
+    `dataset` varchar(255) NOT NULL,
+    `file_name` varchar(255) NULL,
+    `ancestry` varchar(50) NULL,
+    `genome_build` varchar(50) NULL,
+    `phenotype` varchar(255) NULL,
+    `status` varchar(255) NULL,
+    `uploaded_at` datetime NULL,
+    `updated_at` datetime NOT NULL,
+    PRIMARY KEY (`id`)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_dataset_catalog_user_dataset ON dataset_catalog (user, dataset)",
+    "CREATE INDEX IF NOT EXISTS idx_dataset_catalog_user_uploaded_at ON dataset_catalog (user, uploaded_at)",
+    """
+    CREATE TABLE IF NOT EXISTS `job_events` (
+    `id` INTEGER PRIMARY KEY AUTOINCREMENT,
+    `channel` varchar(100) NOT NULL,
+    `payload` text NOT NULL,
+    `created_at` datetime NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_job_events_channel_id ON job_events (channel, id)",
+    "CREATE INDEX IF NOT EXISTS idx_job_events_created_at ON job_events (created_at)",
+    """
+    CREATE TABLE IF NOT EXISTS `job_log_chunks` (
+    `job_id` char(64) NOT NULL,
+    `seq` int NOT NULL,
+    `first_line` bigint NOT NULL,
+    `line_count` int NOT NULL,
+    `byte_offset` bigint NOT NULL,
+    `byte_length` int NOT NULL,
+    `data` mediumblob NOT NULL,
+    PRIMARY KEY (`job_id`, `seq`)
+    )
+    """,
+]
+
+
+def create_schema(connection):
+    for statement in SCHEMA:
+        connection.execute(text(statement))
+    connection.commit()
@@ -0,0 +1,325 @@
+import asyncio
+import itertools
+import json
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import text, bindparam
+
+from job_server.database import get_db, run_db
+
+# events kept per channel for clients reconnecting with Last-Event-ID
+REPLAY_EVENTS = int(os.getenv('JOB_SERVER_STATUS_REPLAY_EVENTS', 20))
+# channels nobody is subscribed to are dropped after this long, and beyond this many
+CHANNEL_TTL_SECONDS = float(os.getenv('JOB_SERVER_STATUS_CHANNEL_TTL_SECONDS', 3600))
+MAX_IDLE_CHANNELS = int(os.getenv('JOB_SERVER_STATUS_MAX_IDLE_CHANNELS', 10000))
+SUBSCRIBER_QUEUE_SIZE = 100
+DB_POLL_SECONDS = float(os.getenv('JOB_SERVER_STATUS_POLL_SECONDS', 1))
+# ids handed out by AUTO_INCREMENT can commit out of order, so every poll reads this far behind the newest id
+# it has seen and skips what it already delivered
+DB_REREAD_IDS = int(os.getenv('JOB_SERVER_STATUS_REREAD_IDS', 1000))
+
+
+def is_terminal(status: str) -> bool:
+    return status.endswith("SUCCEEDED") or status.endswith("FAILED")
+
+
+class _Channel:
+    __slots__ = ('events', 'subscribers', 'last_active')
+
+    def __init__(self):
+        self.events = deque(maxlen=REPLAY_EVENTS)
+        self.subscribers: set[asyncio.Queue] = set()
+        self.last_active = time.monotonic()
+
+
+class Subscription:
+    """
+    Registered as soon as it is entered, so callers can read a snapshot (e.g. from the db) and then iterate
+    without missing anything published in between.
+    """
+
+    def __init__(self, hub: 'StatusHub', channel: str, last_event_id: Optional[int]):
+        self.hub = hub
+        self.channel = channel
+        self.last_event_id = last_event_id
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.replayed = []
+        self._seen = deque(maxlen=SUBSCRIBER_QUEUE_SIZE + REPLAY_EVENTS)
+
+    async def __aenter__(self):
+        await self.hub.prepare()
+        self.replayed = await self.hub.replay(self.channel, self.last_event_id)
+        for event in self.replayed:
+            self.queue.put_nowait(event)
+        self.hub.attach(self.channel, self.queue)
+        return self
+
+    def skip_replayed(self):
+        # for callers that have read a state newer than anything published before they subscribed
+        self._seen.extend(event_id for event_id, _ in self.replayed)
+
+    async def __aexit__(self, *exc):
+        self.hub.detach(self.channel, self.queue)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> tuple[int, dict]:
+        while True:
+            event_id, data = await self.queue.get()
+            # replayed events can also arrive live if they were published while we were attaching, and ids are
+            # not always delivered in order, so duplicates are recognised by id rather than by being older
+            if event_id not in self._seen:
+                self._seen.append(event_id)
+                self.last_event_id = event_id
+                return event_id, data
+
+
+class StatusHub(ABC):
+    """
+    Broadcasts job status events to every subscriber of a channel, keeping the last few events of each
+    channel so reconnecting clients can catch up.
+    """
+
+    def __init__(self):
+        self._channels: OrderedDict[str, _Channel] = OrderedDict()
+        self._subscribed = 0
+
+    @abstractmethod
+    async def publish(self, channel: str, data: dict) -> int:
+        pass
+
+    @abstractmethod
+    async def replay(self, channel: str, last_event_id: Optional[int]) -> list:
+        pass
+
+    async def publish_many(self, events: list):
+        for channel, data in events:
+            await self.publish(channel, data)
+
+    def is_watched(self, channel: str) -> bool:
+        return self.subscriber_count(channel) > 0
+
+    async def prepare(self):
+        pass
+
+    def subscribe(self, channel: str, last_event_id: Optional[int] = None) -> Subscription:
+        return Subscription(self, channel, last_event_id)
+
+    def attach(self, channel: str, queue: asyncio.Queue):
+        state = self._channel(channel)
+        self._subscribed += not state.subscribers
+        state.subscribers.add(queue)
+
+    def detach(self, channel: str, queue: asyncio.Queue):
+        state = self._channels.get(channel)
+        if state and queue in state.subscribers:
+            state.subscribers.discard(queue)
+            self._subscribed -= not state.subscribers
+            self._channels.move_to_end(channel)
+            state.last_active = time.monotonic()
+
+    def subscriber_count(self, channel: str) -> int:
+        state = self._channels.get(channel)
+        return len(state.subscribers) if state else 0
+
+    def channel_count(self) -> int:
+        return len(self._channels)
+
+    def _channel(self, channel: str) -> _Channel:
+        state = self._channels.get(channel)
+        if state is None:
+            # channels are only added here, so this is where idle ones are let go
+            self._prune(room=1)
+            state = self._channels[channel] = _Channel()
+        self._channels.move_to_end(channel)
+        state.last_active = time.monotonic()
+        return state
+
+    def _deliver(self, channel: str, event_id: int, data: dict):
+        state = self._channel(channel)
+        state.events.append((event_id, data))
+        for queue in state.subscribers:
+            if queue.full():
+                # a stalled client loses its oldest event rather than holding memory for everyone
+                queue.get_nowait()
+            queue.put_nowait((event_id, data))
+
+    def _prune(self, room: int = 0):
+        # channels are kept in order of last activity, so only the stale or excess ones at the front are looked at
+        cutoff = time.monotonic() - CHANNEL_TTL_SECONDS
+        excess = len(self._channels) - self._subscribed - MAX_IDLE_CHANNELS + room
+        stale = []
+        for name, state in self._channels.items():
+            if len(stale) >= excess and state.last_active >= cutoff:
+                break
+            if not state.subscribers:
+                stale.append(name)
+        for name in stale:
+            del self._channels[name]
+
+
+class InProcessStatusHub(StatusHub):
+    """
+    For a single worker process, events only exist in memory.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._ids = itertools.count(1)
+
+    async def publish(self, channel: str, data: dict) -> int:
+        event_id = next(self._ids)
+        self._deliver(channel, event_id, data)
+        return event_id
+
+    async def replay(self, channel: str, last_event_id: Optional[int]) -> list:
+        state = self._channels.get(channel)
+        if last_event_id is None or state is None:
+            return []
+        return [event for event in state.events if event[0] > last_event_id]
+
+
+class DatabaseStatusHub(StatusHub):
+    """
+    For multiple worker processes, events are written to the job_events table and each process runs one poller
+    that fans new rows for its subscribed channels out locally.  Event ids are the table's ids, so a client can
+    reconnect to any worker with its Last-Event-ID.
+    """
+
+    def __init__(self, poll_seconds: float = DB_POLL_SECONDS, retention_seconds: float = CHANNEL_TTL_SECONDS):
+        super().__init__()
+        self.poll_seconds = poll_seconds
+        self.retention_seconds = retention_seconds
+        self._last_seen = None
+        self._first_id = 0
+        self._delivered = set()
+        self._poller = None
+
+    async def publish(self, channel: str, data: dict) -> int:
+        return await run_db(insert_event, get_db(), channel, data)
+
+    async def publish_many(self, events: list):
+        if events:
+            await run_db(insert_events, get_db(), events)
+
+    def is_watched(self, channel: str) -> bool:
+        # subscribers may be connected to any worker
+        return True
+
+    async def replay(self, channel: str, last_event_id: Optional[int]) -> list:
+        if last_event_id is None:
+            return []
+        events = await run_db(get_events, get_db(), [channel], last_event_id)
+        return [(event_id, data) for event_id, _, data in events[-REPLAY_EVENTS:]]
+
+    async def prepare(self):
+        # a poller (re)starts from whatever exists now, history is only sent to clients that ask for it by
+        # Last-Event-ID, and nothing published while no poller was running is fanned out late
+        if self._poller is None or self._poller.done():
+            self._last_seen = self._first_id = await run_db(get_last_event_id, get_db())
+            self._delivered = set()
+
+    def attach(self, channel: str, queue: asyncio.Queue):
+        super().attach(channel, queue)
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.create_task(self.poll())
+
+    async def poll(self):
+        last_pruned = time.monotonic()
+        while any(state.subscribers for state in self._channels.values()):
+            await self.poll_once()
+            if time.monotonic() - last_pruned > self.retention_seconds / 10:
+                await run_db(delete_events_before, get_db(), self.retention_seconds)
+                last_pruned = time.monotonic()
+            await asyncio.sleep(self.poll_seconds)
+
+    async def poll_once(self):
+        channels = [name for name, state in self._channels.items() if state.subscribers]
+        if not channels:
+            return
+        try:
+            events = await run_db(get_events, get_db(), channels,
+                                  max(self._last_seen - DB_REREAD_IDS, self._first_id))
+        except Exception as e:
+            print(f"Error polling job events: {str(e)}")
+            return
+        for event_id, channel, data in events:
+            if event_id not in self._delivered:
+                self._deliver(channel, event_id, data)
+                self._delivered.add(event_id)
+                self._last_seen = max(self._last_seen, event_id)
+        oldest = self._last_seen - DB_REREAD_IDS
+        self._delivered = {event_id for event_id in self._delivered if event_id > oldest}
+
+
+def insert_event(db, channel: str, data: dict) -> int:
+    with db as connection:
+        query = text("INSERT INTO job_events (channel, payload, created_at) VALUES (:channel, :payload, NOW())")
+        result = connection.execute(query, {"channel": channel, "payload": json.dumps(data)})
+        connection.commit()
+        return result.lastrowid
+
+
+def insert_events(db, events: list):
+    with db as connection:
+        query = text("INSERT INTO job_events (channel, payload, created_at) VALUES (:channel, :payload, NOW())")
+        connection.execute(query, [{"channel": channel, "payload": json.dumps(data)} for channel, data in events])
+        connection.commit()
+
+
+def get_events(db, channels: list, after_id: int) -> list:
+    with db as connection:
+        query = text("SELECT id, channel, payload FROM job_events WHERE id > :after_id AND channel IN :channels "
+                     "ORDER BY id").bindparams(bindparam('channels', expanding=True))
+        rows = connection.execute(query, {"after_id": after_id, "channels": channels}).fetchall()
+        return [(row[0], row[1], json.loads(row[2])) for row in rows]
+
+
+def get_last_event_id(db) -> int:
+    with db as connection:
+        return connection.execute(text("SELECT COALESCE(MAX(id), 0) FROM job_events")).scalar()
+
+
+def delete_events_before(db, age_seconds: float):
+    with db as connection:
+        now = connection.execute(text("SELECT NOW()")).scalar()
+        now = datetime.fromisoformat(now) if isinstance(now, str) else now
+        cutoff = (now - timedelta(seconds=age_seconds)).strftime('%Y-%m-%d %H:%M:%S')
+        connection.execute(text("DELETE FROM job_events WHERE created_at < :cutoff"), {"cutoff": cutoff})
+        connection.commit()
+
+
+def create_status_hub(backend: str = os.getenv('JOB_SERVER_STATUS_HUB', 'memory')) -> StatusHub:
+    if backend == 'database':
+        return DatabaseStatusHub()
+    if backend == 'memory':
+        return InProcessStatusHub()
+    raise ValueError(f"Unknown status hub backend {backend}")
+
+
+status_hub = create_status_hub()
+
+
+async def publish_job_status(username: str, job_id: str, data: dict):
+    # per job for /job-status, and per user for the multiplexed /job-events stream
+    data = {**data, "job_id": job_id}
+    await asyncio.gather(status_hub.publish(f"job:{job_id}", data), status_hub.publish(f"user:{username}", data))
+
+
+def is_job_watched(username: str, job_id: str) -> bool:
+    return status_hub.is_watched(f"job:{job_id}") or status_hub.is_watched(f"user:{username}")
+
+
+async def publish_job_statuses(statuses: list):
+    # publish_job_status for many (username, job_id, data) at once, written together where the hub can
+    events = []
+    for username, job_id, data in statuses:
+        data = {**data, "job_id": job_id}
+        events += [(f"job:{job_id}", data), (f"user:{username}", data)]
+    await status_hub.publish_many(events)
@@ -0,0 +1,57 @@
+import re
+import zlib
+from typing import Iterable, Iterator, Optional, Tuple
+
+CHUNK_BYTES = 1024 * 1024
+GZIP_WBITS = 31
+
+
+def iter_body(body, chunk_bytes: int = CHUNK_BYTES) -> Iterator[bytes]:
+    try:
+        yield from body.iter_chunks(chunk_bytes)
+    finally:
+        body.close()
+
+
+def gzip_stream(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, GZIP_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    for coding in (accept_encoding or '').split(','):
+        name, _, params = coding.strip().partition(';')
+        if name.strip().lower() == 'gzip':
+            return params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_byte_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Returns the inclusive (start, end) of a single bytes range, or None when the whole representation should
+    be sent (no header, or a form we don't serve, like multiple ranges).
+    """
+    if not range_header:
+        return None
+    match = re.fullmatch(r'\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*', range_header)
+    if not match or not any(match.groups()):
+        return None
+    start, end = match.groups()
+    if not start:
+        suffix = int(end)
+        if suffix == 0:
+            raise RangeNotSatisfiable()
+        return max(size - suffix, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable()
+    return start, end
@@ -0,0 +1,62 @@
+from botocore.exceptions import ClientError
+
+from job_server import s3, database_utils, ingest, scheduler, validation
+from job_server.database import get_db, run_db
+from job_server.execution import finish_job
+from job_server.model import DatasetInfo, AnalysisMethod
+
+
+async def process_upload(username: str, dataset: DatasetInfo):
+    """
+    Validates a finalized upload, then ingests it and queues its sumstats job, in that order so the job finds
+    the normalized copy complete.  A rejected upload ends its validation job FAILED with the report as its log.
+    """
+    s3_path = s3.get_upload_path(username, dataset.name)
+    s3_key = f"{s3_path}/{dataset.file}"
+    try:
+        try:
+            summary = await validation.validate_upload_async(s3_key, dataset)
+        except ClientError as e:
+            raise validation.ValidationError("The uploaded file was not found") from e
+    except validation.ValidationError as e:
+        await reject_upload(username, dataset, e)
+        return
+    except Exception as e:
+        # not the file's fault, so it is kept and can be checked again
+        print(f"Error validating {s3_key}: {str(e)}")
+        await finish_job(username, dataset.name, database_utils.VALIDATION_METHOD, 'FAILED',
+                         f"The upload could not be validated: {str(e)}")
+        return
+    dataset.row_count, dataset.stats = summary['row_count'], summary['stats']
+    await s3.run_async(s3.upload_metadata, dataset, s3_path)
+    await run_db(database_utils.update_dataset_metadata, get_db(), username, dataset)
+    # a failed ingest is logged and the job still runs against the raw upload
+    await ingest.ingest_upload_async(s3_key, username, dataset)
+    await scheduler.scheduler.enqueue(username, [(dataset.name, AnalysisMethod.sumstats.value)],
+                                      scheduler.SINGLE_PRIORITY)
+
+
+async def reject_upload(username: str, dataset: DatasetInfo, error: validation.ValidationError):
+    s3_path = s3.get_upload_path(username, dataset.name)
+    dataset.validation = error.report()
+    try:
+        # the file is kept until the dataset is deleted, the failed validation job is what stops it being analysed
+        await s3.run_async(s3.upload_metadata, dataset, s3_path)
+    except ClientError as e:
+        print(f"Error storing the validation report of {dataset.name} for {username}: {str(e)}")
+    await run_db(database_utils.update_dataset_metadata, get_db(), username, dataset)
+    await finish_job(username, dataset.name, database_utils.VALIDATION_METHOD, 'FAILED', error.log())
+
+
+async def resume_uploads() -> int:
+    """
+    Validates again the uploads a previous server process was still checking.
+    """
+    try:
+        uploads = await run_db(database_utils.get_validating_uploads, get_db())
+        for username, dataset in uploads:
+            await process_upload(username, dataset)
+    except Exception as e:
+        print(f"Error resuming upload validation: {str(e)}")
+        return 0
+    return len(uploads)
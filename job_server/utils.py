@@ -0,0 +1,12 @@
+import asyncio
+import functools
+from concurrent.futures import Executor
+from typing import Optional
+
+
+async def run_in_executor(executor: Executor, timeout: Optional[float], fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+    if timeout:
+        return await asyncio.wait_for(future, timeout)
+    return await future
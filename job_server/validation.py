@@ -0,0 +1,358 @@
+import csv
+import io
+import itertools
+import os
+import re
+import threading
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from job_server import s3
+from job_server.file_utils import GZIP_WBITS, detect_delimiter
+from job_server.model import DatasetInfo
+from job_server.utils import run_in_executor
+
+REQUIRED_COLUMNS = ['chromosome', 'position', 'reference', 'alt', 'pValue']
+EFFECT_COLUMNS = ['beta', 'oddsRatio']
+NUMERIC_COLUMNS = ['pValue', 'beta', 'oddsRatio', 'se', 'n']
+CHROMOSOMES = {str(i) for i in range(1, 23)} | {'X', 'Y', 'XY', 'M', 'MT'}
+# PLINK's numeric codes for the sex and mitochondrial chromosomes
+PLINK_CHROMOSOMES = {'23': 'X', '24': 'Y', '25': 'XY', '26': 'MT'}
+# uncompressed text handed to a worker at a time, and how many of those may be in flight
+BLOCK_BYTES = int(os.getenv('JOB_SERVER_VALIDATION_BLOCK_BYTES', 8 * 1024 * 1024))
+VALIDATION_WORKERS = int(os.getenv('JOB_SERVER_VALIDATION_WORKERS', 2))
+MAX_BLOCKS_IN_FLIGHT = VALIDATION_WORKERS * 2
+READ_SIZE = 1024 * 1024
+# reading stops once this many bad rows are found, the report only needs enough to show what is wrong
+MAX_ERRORS = 100
+
+VALIDATION_TIMEOUT = float(os.getenv('JOB_SERVER_VALIDATION_TIMEOUT', 1800))
+
+_executor = None
+_executor_lock = threading.Lock()
+# threads that stream uploads from S3 and feed the process pool
+_reader_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='validation')
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=VALIDATION_WORKERS)
+        return _executor
+
+
+class ValidationError(Exception):
+    def __init__(self, message: str, errors: Optional[list] = None, row_count: int = 0):
+        super().__init__(message)
+        self.message = message
+        self.errors = errors or []
+        self.row_count = row_count
+
+    def report(self) -> dict:
+        return {"message": self.message, "rowsChecked": self.row_count, "errors": self.errors}
+
+    def log(self) -> str:
+        lines = [self.message]
+        for error in self.errors:
+            column = f" ({error['column']})" if error['column'] else ''
+            value = f", saw {error['value']}" if error['value'] is not None else ''
+            lines.append(f"line {error['row']}{column}: {error['error']}{value}")
+        return '\n'.join(lines)
+
+
+def normalize_chromosome(chromosome: str) -> str:
+    chromosome = chromosome.upper().removeprefix('CHR')
+    return PLINK_CHROMOSOMES.get(chromosome, chromosome)
+
+
+def chromosome_sort_key(chromosome: str) -> tuple:
+    return not chromosome.isdigit(), int(chromosome) if chromosome.isdigit() else chromosome
+
+
+def iter_text(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    decompressor = None
+    first = True
+    for chunk in chunks:
+        if first:
+            first = False
+            if chunk.startswith(b'\x1f\x8b'):
+                decompressor = zlib.decompressobj(GZIP_WBITS)
+        while decompressor is not None and chunk:
+            yield decompressor.decompress(chunk)
+            chunk = b''
+            if decompressor.eof:
+                # gzip files can be several members back to back
+                chunk = decompressor.unused_data
+                decompressor = zlib.decompressobj(GZIP_WBITS)
+        if decompressor is None:
+            yield chunk
+
+
+def iter_blocks(chunks: Iterator[bytes], block_bytes: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Text cut into blocks of whole lines.
+    """
+    block_bytes = block_bytes or BLOCK_BYTES
+    pending = bytearray()
+    for data in iter_text(chunks):
+        pending += data
+        if len(pending) >= block_bytes:
+            cut = pending.rfind(b'\n') + 1
+            if cut:
+                yield bytes(pending[:cut])
+                del pending[:cut]
+    if pending.strip():
+        yield bytes(pending).rstrip(b'\r\n') + b'\n'
+
+
+def read_header(block: bytes, delimiter: Optional[str]) -> tuple:
+    end = block.find(b'\n')
+    header_line = block[:end if end >= 0 else len(block)].decode('utf-8', errors='replace').rstrip('\r')
+    delimiter = delimiter or detect_delimiter(block[:64 * 1024].decode('utf-8', errors='replace').splitlines()[:100])
+    header = next(csv.reader([header_line], delimiter=delimiter), [])
+    return [column.strip().strip('"') for column in header], delimiter, block[end + 1:] if end >= 0 else b''
+
+
+def check_columns(header: list, col_map: dict):
+    mapped = {field: column for field, column in col_map.items() if column}
+    missing = [field for field in REQUIRED_COLUMNS if field not in mapped]
+    if not any(field in mapped for field in EFFECT_COLUMNS):
+        missing.append('beta or oddsRatio')
+    if missing:
+        raise ValidationError(f"Required fields are not mapped: {', '.join(missing)}")
+    absent = [column for column in mapped.values() if column not in header]
+    if absent:
+        raise ValidationError(f"Mapped columns are not in the file: {', '.join(absent)}")
+
+
+def _row_errors(values: pd.Series, invalid: np.ndarray, column: str, message: str, first_row: int,
+                lines: Optional[np.ndarray]) -> list:
+    rows = np.flatnonzero(invalid)[:MAX_ERRORS]
+    line_numbers = lines[rows] if lines is not None else first_row + rows
+    return [{"row": int(line), "column": column, "value": None if pd.isna(value) else str(value),
+             "error": message} for line, value in zip(line_numbers, values.iloc[rows])]
+
+
+def _data_lines(block: bytes, first_row: int) -> Optional[np.ndarray]:
+    """
+    The file line numbers of a block's non-blank lines, or None if it has no blank lines and they simply count
+    up from first_row.
+    """
+    if b'\n\n' not in block and b'\n\r\n' not in block and not block.startswith((b'\n', b'\r\n')):
+        return None
+    data = np.frombuffer(block, dtype=np.uint8)
+    ends = np.flatnonzero(data == ord('\n'))
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    lengths = ends - starts
+    blank = (lengths == 0) | ((lengths == 1) & (data[starts] == ord('\r')))
+    return first_row + np.flatnonzero(~blank)
+
+
+def _bad_field_count(block: bytes, delimiter: str, width: int) -> Optional[tuple]:
+    """
+    The first non-blank line (0-based) without width fields and its field count.  Quoted files are left to the
+    csv parser, since a quoted field can contain the delimiter.
+    """
+    if b'"' in block or len(delimiter) != 1:
+        return None
+    data = np.frombuffer(block, dtype=np.uint8)
+    newlines = np.flatnonzero(data == ord('\n'))
+    fields = np.diff(np.searchsorted(np.flatnonzero(data == ord(delimiter)), newlines), prepend=0) + 1
+    lengths = np.diff(newlines, prepend=-1) - 1
+    blank = (lengths == 0) | ((lengths == 1) & (data[newlines - 1] == ord('\r')))
+    bad = np.flatnonzero((fields != width) & ~blank)
+    return (int(bad[0]), int(fields[bad[0]])) if len(bad) else None
+
+
+def _failed_block(first_row: int, row: int, message: str) -> dict:
+    return {"rows": 0, "skipped": 0, "errors": [{"row": row, "column": None, "value": None, "error": message}],
+            "first_row": first_row, "lines": None, "variants": np.array([], dtype=np.uint64), "stats": {},
+            "chromosomes": [], "significant": 0}
+
+
+def normalized_codes(values: pd.Series, normalize) -> tuple:
+    """
+    Codes into a list of distinct normalized values, with -1 for missing.
+    """
+    values = values.astype('category')
+    normalized = [normalize(str(category)) for category in values.cat.categories]
+    distinct = list(dict.fromkeys(normalized))
+    remap = np.array([distinct.index(value) for value in normalized] + [-1], dtype=np.int64)
+    return remap[values.cat.codes.to_numpy()], distinct
+
+
+def _code_hashes(codes: np.ndarray, distinct: list) -> np.ndarray:
+    hashes = np.append(pd.util.hash_array(np.array(distinct, dtype=object)), np.uint64(0))
+    return hashes[codes]
+
+
+def validate_block(block: bytes, delimiter: str, header: list, col_map: dict, first_row: int) -> dict:
+    """
+    Checks one block of rows, run in a worker process.  first_row is the file line number of its first row.
+    """
+    bad_line = _bad_field_count(block, delimiter, len(header))
+    if bad_line:
+        return _failed_block(first_row, first_row + bad_line[0],
+                             f"Expected {len(header)} fields, saw {bad_line[1]}")
+    # blank lines are skipped, rows are numbered by the line they are on
+    lines = _data_lines(block, first_row)
+    fields = {field: column for field, column in col_map.items() if column and column in header}
+    numeric = [field for field in fields if field in NUMERIC_COLUMNS or field == 'position']
+    def read(dtype):
+        return pd.read_csv(io.BytesIO(block), sep=delimiter, header=None, names=header, dtype=dtype,
+                           usecols=list(dict.fromkeys(fields.values())), keep_default_na=False, na_values=[''])
+
+    text = None
+    try:
+        # numbers parse straight to floats in the csv reader, only a block with a bad value is read as text
+        df = read(dtype={column: float if field in numeric else 'category' for field, column in fields.items()})
+    except pd.errors.ParserError as e:
+        line = re.search(r'line (\d+)', str(e))
+        return _failed_block(first_row, first_row + int(line.group(1)) - 1 if line else first_row, str(e).strip())
+    except ValueError:
+        text = read(dtype=str).rename(columns={column: field for field, column in fields.items()})
+        df = text.copy()
+        for field in numeric:
+            df[field] = pd.to_numeric(text[field], errors='coerce')
+    else:
+        df = df.rename(columns={column: field for field, column in fields.items()})
+    shown = text if text is not None else df
+    errors = []
+
+    def check(field, invalid, message):
+        if field in df and invalid.any():
+            errors.extend(_row_errors(shown[field], invalid, field, message, first_row, lines))
+
+    chromosome_codes, chromosomes = normalized_codes(df['chromosome'], normalize_chromosome)
+    # rows on other contigs (unplaced scaffolds, alt haplotypes, ...) are left out rather than failing the file
+    known = np.array([c in CHROMOSOMES for c in chromosomes] + [True])
+    skipped = ~known[chromosome_codes]
+    if skipped.any():
+        df, shown, chromosome_codes = df[~skipped], shown[~skipped], chromosome_codes[~skipped]
+        lines = (lines if lines is not None else first_row + np.arange(len(skipped)))[~skipped]
+    check('chromosome', chromosome_codes < 0, "missing chromosome")
+    position = df['position'].to_numpy(dtype=float)
+    check('position', ~(position > 0) | (position % 1 != 0), "not a positive integer")
+    for allele in ['reference', 'alt']:
+        check(allele, df[allele].isna().to_numpy(), "missing allele")
+
+    numbers = {field: df[field].to_numpy(dtype=float) for field in NUMERIC_COLUMNS if field in df}
+    if 'pValue' in numbers:
+        check('pValue', ~((numbers['pValue'] >= 0) & (numbers['pValue'] <= 1)), "not a p-value in [0, 1]")
+    if 'beta' in numbers:
+        check('beta', ~np.isfinite(numbers['beta']), "not a finite number")
+    for field in ['oddsRatio', 'se', 'n']:
+        if field in numbers:
+            check(field, ~(np.isfinite(numbers[field]) & (numbers[field] > 0)), "not a positive number")
+
+    # hashing each distinct value once and indexing by code is far cheaper than building a key string per row
+    key = {'chromosome': _code_hashes(chromosome_codes, chromosomes), 'position': position}
+    for allele in ['reference', 'alt']:
+        key[allele] = _code_hashes(*normalized_codes(df[allele], str.upper))
+    variants = pd.util.hash_pandas_object(pd.DataFrame(key), index=False).to_numpy()
+    stats = {}
+    for field, values in numbers.items():
+        finite = values[np.isfinite(values)]
+        stats[field] = {"min": float(finite.min()) if len(finite) else None,
+                        "max": float(finite.max()) if len(finite) else None,
+                        "sum": float(finite.sum()), "count": len(finite)}
+    significant = int((numbers['pValue'] < 5e-8).sum()) if 'pValue' in numbers else 0
+    return {"rows": len(df), "skipped": int(skipped.sum()), "errors": errors, "first_row": first_row,
+            "lines": lines, "variants": variants,
+            "stats": stats,
+            "chromosomes": sorted({chromosomes[code] for code in np.unique(chromosome_codes) if code >= 0}),
+            "significant": significant}
+
+
+def merge_stats(total: dict, stats: dict):
+    for field, values in stats.items():
+        merged = total.setdefault(field, {"min": None, "max": None, "sum": 0.0, "count": 0})
+        for key, pick in (("min", min), ("max", max)):
+            if values[key] is not None:
+                merged[key] = values[key] if merged[key] is None else pick(merged[key], values[key])
+        merged["sum"] += values["sum"]
+        merged["count"] += values["count"]
+
+
+def duplicate_errors(results: list) -> list:
+    if not results:
+        return []
+    variants = np.concatenate([result["variants"] for result in results])
+    lines = np.concatenate([result["lines"] if result["lines"] is not None
+                            else result["first_row"] + np.arange(len(result["variants"])) for result in results])
+    order = np.argsort(variants, kind='stable')
+    repeated = np.flatnonzero(variants[order][1:] == variants[order][:-1]) + 1
+    rows = np.sort(lines[order[repeated]])[:MAX_ERRORS]
+    return [{"row": int(row), "column": "variant", "value": None, "error": "duplicate variant"} for row in rows]
+
+
+def validate_stream(chunks: Iterator[bytes], dataset: DatasetInfo, executor=None) -> dict:
+    """
+    Validates an upload read as a stream of byte chunks, parsing blocks of rows in the process pool.  Returns the
+    row count and column statistics, or raises ValidationError with a row-level report.
+    """
+    executor = executor or get_executor()
+    blocks = iter_blocks(chunks)
+    header, delimiter, first_block = read_header(next(blocks, b''), dataset.separator)
+    check_columns(header, dataset.col_map)
+
+    pending, results = deque(), []
+    errors = 0
+    # line numbers are 1-based and the header is line 1
+    row = 2
+    for block in itertools.chain([first_block] if first_block else [], blocks):
+        pending.append(executor.submit(validate_block, block, delimiter, header, dataset.col_map, row))
+        row += block.count(b'\n')
+        if len(pending) >= MAX_BLOCKS_IN_FLIGHT:
+            results.append(pending.popleft().result())
+            errors += len(results[-1]["errors"])
+            if errors >= MAX_ERRORS:
+                break
+    for future in pending:
+        if errors >= MAX_ERRORS:
+            future.cancel()
+            continue
+        results.append(future.result())
+        errors += len(results[-1]["errors"])
+
+    row_count = sum(result["rows"] for result in results)
+    row_errors = [error for result in results for error in result["errors"]]
+    if errors < MAX_ERRORS:
+        row_errors += duplicate_errors(results)
+    if row_errors:
+        more = '+' if len(row_errors) >= MAX_ERRORS else ''
+        raise ValidationError(f"{len(row_errors[:MAX_ERRORS])}{more} invalid rows", row_errors[:MAX_ERRORS],
+                              row_count)
+    if row_count == 0:
+        raise ValidationError("The file has no data rows")
+
+    stats = {}
+    for result in results:
+        merge_stats(stats, result["stats"])
+    for values in stats.values():
+        values["mean"] = values.pop("sum") / values["count"] if values["count"] else None
+    chromosomes = {chromosome for result in results for chromosome in result["chromosomes"]}
+    return {"row_count": row_count, "stats": {
+        "columns": stats,
+        "chromosomes": sorted(chromosomes, key=chromosome_sort_key),
+        "genomeWideSignificant": sum(result["significant"] for result in results),
+        "skippedRows": sum(result["skipped"] for result in results)
+    }}
+
+
+def validate_upload(s3_key: str, dataset: DatasetInfo) -> dict:
+    body = s3.get_object_body(s3_key)
+    try:
+        return validate_stream(body.iter_chunks(READ_SIZE), dataset)
+    finally:
+        body.close()
+
+
+async def validate_upload_async(s3_key: str, dataset: DatasetInfo) -> dict:
+    return await run_in_executor(_reader_executor, VALIDATION_TIMEOUT, validate_upload, s3_key, dataset)
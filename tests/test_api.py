@@ -44,7 +44,8 @@ def test_preview_csv(api_client: TestClient, auth_token: str):
     assert response.status_code == 200
     assert response.json() == {
         "columns": ["col1", "col2", "col3"],
-        "delimiter": ","
+        "delimiter": ",",
+        "dtypes": {"col1": "INTEGER", "col2": "INTEGER", "col3": "INTEGER"}
     }
 
 def test_preview_tsv(api_client: TestClient, auth_token: str):
@@ -55,7 +56,8 @@ def test_preview_tsv(api_client: TestClient, auth_token: str):
     assert response.status_code == 200
     assert response.json() == {
         "columns": ["col1", "col2", "col3"],
-        "delimiter": "\t"
+        "delimiter": "\t",
+        "dtypes": {"col1": "INTEGER", "col2": "INTEGER", "col3": "INTEGER"}
     }
 
 def test_duplicate_columns(api_client: TestClient, auth_token: str):
@@ -76,7 +78,8 @@ def test_gzip_csv(api_client: TestClient, auth_token: str):
     assert response.status_code == 200
     assert response.json() == {
         "columns": ["col1", "col2", "col3"],
-        "delimiter": ","
+        "delimiter": ",",
+        "dtypes": {"col1": "INTEGER", "col2": "INTEGER", "col3": "INTEGER"}
     }
 
 @mock_aws
@@ -109,3 +112,51 @@ def test_generate_presigned_url_failure(api_client: TestClient, auth_token: str)
         response = api_client.get("/api/get-pre-signed-url/test-ds",
                                    headers={"Authorization": f"Bearer {auth_token}"})
         assert response.status_code == 500
+
+
+RESULTS_TSV = "ann1\ttissue1\tbio1\t1.5\t0.01\nann2\ttissue2\tbio2\t0.5\t0.2\n"
+RESULTS_HEADER = "annotation\ttissue\tbiosample\tenrichment\tpValue\n"
+
+
+def set_up_results(dataset: str):
+    set_up_moto_bucket()
+    boto3.client("s3", region_name="us-east-1").put_object(
+        Bucket=BUCKET, Key=f"userdata/{USER}/genetic/{dataset}/sldsc/sldsc/tissue.output.tsv",
+        Body=RESULTS_TSV.encode())
+
+
+@mock_aws
+def test_download_streams_results(api_client: TestClient, auth_token: str):
+    set_up_results("download-ds")
+    response = api_client.get("/api/download/download-ds",
+                              headers={"Authorization": f"Bearer {auth_token}", "Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.text == RESULTS_HEADER + RESULTS_TSV
+
+
+@mock_aws
+def test_download_is_the_same_when_results_are_cached(api_client: TestClient, auth_token: str):
+    set_up_results("cached-download-ds")
+    headers = {"Authorization": f"Bearer {auth_token}", "Accept-Encoding": "identity"}
+    first = api_client.get("/api/download/cached-download-ds", headers=headers)
+    assert api_client.get("/api/results/cached-download-ds", headers=headers).status_code == 200
+    second = api_client.get("/api/download/cached-download-ds", headers=headers)
+    assert second.content == first.content == (RESULTS_HEADER + RESULTS_TSV).encode()
+    assert second.headers["etag"] == first.headers["etag"]
+    assert second.headers["content-length"] == str(len(first.content))
+
+
+@mock_aws
+def test_download_range(api_client: TestClient, auth_token: str):
+    set_up_results("range-ds")
+    full = (RESULTS_HEADER + RESULTS_TSV).encode()
+    response = api_client.get("/api/download/range-ds",
+                              headers={"Authorization": f"Bearer {auth_token}", "Range": "bytes=40-70"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 40-70/{len(full)}"
+    assert response.content == full[40:71]
+
+    response = api_client.get("/api/download/range-ds",
+                              headers={"Authorization": f"Bearer {auth_token}", "Range": f"bytes={len(full)}-"})
+    assert response.status_code == 416
@@ -0,0 +1,191 @@
+import asyncio
+import sqlite3
+import time
+from typing import Optional
+
+import bcrypt
+import pytest
+from sqlalchemy import text
+from werkzeug.security import generate_password_hash
+
+from job_server import metrics
+from job_server.auth_backend import AuthBackend, LoginSaturated, LoginTimedOut, PasswordVerifier, \
+    create_auth_backend, get_auth_backend, password_verifier
+from job_server.auth_mysql import MySQLAuthBackend
+from job_server.database import get_db
+from job_server.jwt_utils import TokenCache, token_cache
+from tests.test_api import get_token
+
+
+def test_token_verified_once_and_cached(api_client):
+    token_cache.clear()
+    metrics.reset()
+    headers = {"Authorization": f"Bearer {get_token(api_client)}"}
+    for _ in range(3):
+        assert api_client.get("/api/is-logged-in", headers=headers).json() == {"username": "testuser"}
+
+    snapshot = api_client.get("/api/metrics", headers=headers).json()
+    # once per request even though the route and its handler both depend on the user
+    assert snapshot["timers"]["auth"]["count"] == 4
+    assert snapshot["counters"]["auth.token_cache.misses"] == 1
+    assert snapshot["counters"]["auth.token_cache.hits"] == 3
+
+
+def test_bad_token_is_not_cached(api_client):
+    token_cache.clear()
+    assert api_client.get("/api/is-logged-in", headers={"Authorization": "Bearer nonsense"}).status_code == 401
+    assert api_client.get("/api/is-logged-in", params={"token": "nonsense"}).status_code == 401
+    assert len(token_cache.entries) == 0
+
+
+def test_token_cache_bounds_and_expiry():
+    cache = TokenCache(max_size=2, max_age=60)
+    cache.put("a", {"username": "a"})
+    cache.put("b", {"username": "b"})
+    cache.get("a")
+    cache.put("c", {"username": "c"})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"username": "a"}
+
+    cache.put("expired", {"username": "d", "exp": time.time() - 1})
+    assert cache.get("expired") is None
+    # dropped rather than left to take up a slot
+    assert len(cache.entries) == 1
+
+
+class SlowBackend(AuthBackend):
+    def get_password_hash(self, username: str) -> Optional[str]:
+        return "right"
+
+    def check_password(self, password: str, password_hash: str) -> bool:
+        time.sleep(0.2)
+        return password == password_hash
+
+
+def test_login_burst_beyond_queue_is_rejected():
+    verifier = PasswordVerifier(workers=1, queue_limit=1)
+
+    async def burst():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        results = await asyncio.gather(*[verifier.authenticate(SlowBackend(), "u", password)
+                                         for password in ["right", "wrong", "right", "right"]],
+                                       return_exceptions=True)
+        task.cancel()
+        return results, ticks
+
+    results, ticks = asyncio.run(burst())
+    assert results[:2] == [True, False]
+    assert all(isinstance(result, LoginSaturated) for result in results[2:])
+    # the loop kept running while passwords were checked
+    assert ticks > 10
+    assert verifier.in_flight == 0
+
+
+def test_timed_out_login_keeps_its_slot_until_checked():
+    verifier = PasswordVerifier(workers=1, queue_limit=0, timeout=0.05)
+
+    async def scenario():
+        with pytest.raises(LoginTimedOut):
+            await verifier.authenticate(SlowBackend(), "u", "right")
+        # the hash check is still running on the only worker
+        assert verifier.in_flight == 1
+        with pytest.raises(LoginSaturated):
+            await verifier.authenticate(SlowBackend(), "u", "right")
+        await asyncio.sleep(0.3)
+        return verifier.in_flight
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_login_returns_503_when_timed_out(api_client, monkeypatch):
+    async def authenticate(backend, username, password):
+        raise LoginTimedOut()
+    monkeypatch.setattr(password_verifier, "authenticate", authenticate)
+    response = api_client.post("/api/login", json={"username": "testuser", "password": "change.me"})
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+
+
+def test_login_returns_429_when_saturated(api_client, monkeypatch):
+    monkeypatch.setattr(password_verifier, "in_flight", password_verifier.limit)
+    response = api_client.post("/api/login", json={"username": "testuser", "password": "change.me"})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_backend_is_built_once():
+    assert get_auth_backend() is get_auth_backend()
+    with pytest.raises(ValueError):
+        create_auth_backend("ldap")
+
+
+def test_unknown_usernames_answered_from_cache(monkeypatch):
+    backend = MySQLAuthBackend()
+    lookups = []
+    lookup = backend.get_password_hash
+    monkeypatch.setattr(backend, "get_password_hash", lambda username: lookups.append(username) or lookup(username))
+    for _ in range(50):
+        assert not backend.authenticate_user("nobody", "guess")
+    assert backend.authenticate_user("testuser", "change.me")
+    assert not backend.authenticate_user("testuser", "wrong")
+    assert lookups == ["nobody", "testuser"]
+
+
+def test_new_user_can_log_in_soon_after_a_failed_attempt(monkeypatch):
+    backend = MySQLAuthBackend()
+    monkeypatch.setattr(backend.users, "unknown_seconds", 0.05)
+    assert not backend.authenticate_user("newcomer", "secret")
+    with get_db() as connection:
+        connection.execute(text("INSERT INTO users (user_name, password, created_at) VALUES "
+                                "('newcomer', :password, NOW())"), {"password": bcrypt.hashpw(b"secret", bcrypt.gensalt(4)).decode()})
+        connection.commit()
+    time.sleep(0.1)
+    try:
+        assert backend.authenticate_user("newcomer", "secret")
+    finally:
+        backend.close()
+        with get_db() as connection:
+            connection.execute(text("DELETE FROM users WHERE user_name = 'newcomer'"))
+            connection.commit()
+
+
+def last_login():
+    with get_db() as connection:
+        return connection.execute(text("SELECT last_login FROM users WHERE user_name = 'testuser'")).scalar()
+
+
+def test_last_login_written_in_batches():
+    # logins by earlier tests would otherwise land part way through
+    get_auth_backend().last_logins.flush()
+    with get_db() as connection:
+        connection.execute(text("UPDATE users SET last_login = NULL"))
+        connection.commit()
+    backend = MySQLAuthBackend()
+    backend.last_logins.flush_seconds = 60
+    assert backend.authenticate_user("testuser", "change.me")
+    assert backend.authenticate_user("testuser", "change.me")
+    assert backend.last_logins.pending == {"testuser"}
+    assert last_login() is None
+    backend.close()
+    assert last_login() is not None
+    assert backend.last_logins.timer is None
+
+
+def test_sqlite_backend_reuses_connections(tmp_path):
+    db_path = str(tmp_path / "users.db")
+    with sqlite3.connect(db_path) as connection:
+        connection.execute("CREATE TABLE users (username text, password_hash text)")
+        connection.execute("INSERT INTO users VALUES ('someone', ?)", (generate_password_hash("secret"),))
+    backend = create_auth_backend("sqlite")
+    backend.db_path = db_path
+    assert backend.authenticate_user("someone", "secret")
+    assert not backend.authenticate_user("someone-else", "secret")
+    assert backend.connections.qsize() == 1
@@ -0,0 +1,334 @@
+import asyncio
+import json
+
+import boto3
+import pytest
+from moto import mock_aws
+from sqlalchemy import text
+
+from job_server import database_utils, batch, job_logs, s3
+from job_server.batch import BatchMonitor, TrackedJob
+from job_server.database import get_db
+from job_server.status_hub import status_hub
+from tests.test_api import get_token
+
+
+class FakeBatchClient:
+    def __init__(self):
+        self.statuses = {}
+        self.parameters = {}
+        self.reasons = {}
+        self.describe_calls = []
+        self.submissions = []
+
+    def describe_jobs(self, jobs):
+        self.describe_calls.append(list(jobs))
+        return {"jobs": [{"jobId": job_id, "status": self.statuses[job_id], "createdAt": 1,
+                          "parameters": self.parameters.get(job_id, {}),
+                          **({"statusReason": self.reasons[job_id]} if job_id in self.reasons else {}),
+                          "container": {"logStreamName": f"stream-{job_id}"}}
+                         for job_id in jobs if job_id in self.statuses]}
+
+    def submit_job(self, **kwargs):
+        self.submissions.append(kwargs)
+        return {"jobId": f"parent-{len(self.submissions)}"}
+
+    def get_paginator(self, operation):
+        client = self
+
+        class Paginator:
+            def paginate(self, **kwargs):
+                yield {"jobSummaryList": [{"jobId": job_id} for job_id in client.statuses]}
+
+        return Paginator()
+
+
+class FakeLogsClient:
+    """
+    Pages like CloudWatch: nextForwardToken comes back unchanged once the end of the stream is reached.
+    """
+
+    def __init__(self, page_size=2):
+        self.streams = {}
+        self.page_size = page_size
+        self.calls = 0
+
+    def get_log_events(self, logGroupName, logStreamName, startFromHead, nextToken=None):
+        self.calls += 1
+        messages = self.streams.get(logStreamName, [f"log for {logStreamName}"])
+        start = int(nextToken.split("/")[1]) if nextToken else 0
+        end = min(start + self.page_size, len(messages))
+        return {"events": [{"message": message} for message in messages[start:end]],
+                "nextForwardToken": f"f/{end}"}
+
+
+def test_monitor_batches_describe_calls():
+    batch_client = FakeBatchClient()
+    monitor = BatchMonitor(batch_client, FakeLogsClient(), min_poll_seconds=0, max_poll_seconds=60,
+                           autostart=False)
+
+    async def scenario():
+        dataset_job_id = database_utils.get_dataset_hash("ds-0", "testuser")
+        futures = []
+        for i in range(250):
+            batch_client.statuses[f"job-{i}"] = "RUNNING"
+            futures.append(monitor.track(f"job-{i}", "testuser", f"ds-{i}", "sumstats"))
+        await monitor.poll_once()
+        assert [len(call) for call in batch_client.describe_calls] == [100, 100, 50]
+        assert len(monitor.jobs) == 250
+
+        for i in range(250):
+            batch_client.statuses[f"job-{i}"] = "SUCCEEDED" if i % 2 == 0 else "FAILED"
+        for job in monitor.jobs.values():
+            job.next_poll = 0
+        async with status_hub.subscribe(f"job:{dataset_job_id}") as subscription:
+            await monitor.poll_once()
+            assert monitor.jobs == {}
+            assert await futures[0] == "sumstats SUCCEEDED"
+            assert await futures[1] == "sumstats FAILED"
+            assert (await anext(subscription))[1]["status"] == "sumstats SUCCEEDED"
+
+    asyncio.run(scenario())
+
+
+def test_poll_interval_backs_off():
+    monitor = BatchMonitor(FakeBatchClient(), FakeLogsClient(), min_poll_seconds=5, max_poll_seconds=60,
+                           autostart=False)
+    job = TrackedJob("job", "testuser", "ds", "sldsc", None)
+    assert monitor.poll_interval(job, job.submitted_at + 10) == 5
+    assert monitor.poll_interval(job, job.submitted_at + 300) == pytest.approx(30)
+    assert monitor.poll_interval(job, job.submitted_at + 3600) == 60
+
+
+def test_resume_unfinished_jobs(monkeypatch):
+    with get_db() as con:
+        con.execute(text("DELETE FROM dataset_jobs"))
+        con.commit()
+    batch_client = FakeBatchClient()
+    monitor = BatchMonitor(batch_client, FakeLogsClient(), autostart=False)
+    monkeypatch.setattr(batch, "monitor", monitor)
+
+    # tracked before the restart
+    database_utils.log_job_start(get_db(), "testuser", "ds-tracked", "RUNNING sldsc", "sldsc")
+    database_utils.record_job_submission(get_db(), "testuser", "ds-tracked", "job-tracked")
+    # started before batch job ids were stored, one still findable in Batch and one not
+    database_utils.log_job_start(get_db(), "testuser", "ds-orphan", "RUNNING sumstats")
+    database_utils.log_job_start(get_db(), "testuser", "ds-lost", "RUNNING sumstats")
+    batch_client.statuses.update({"job-tracked": "RUNNING", "job-orphan": "RUNNING"})
+    batch_client.parameters["job-orphan"] = {"username": "testuser", "dataset": "ds-orphan", "method": "sumstats"}
+    # already finished
+    database_utils.log_job_start(get_db(), "testuser", "ds-done", "RUNNING sumstats", "sumstats")
+    database_utils.record_job_submission(get_db(), "testuser", "ds-done", "job-done")
+    database_utils.log_job_end(get_db(), "testuser", "ds-done", "sumstats SUCCEEDED", "", "SUCCEEDED")
+
+    assert asyncio.run(batch.resume_jobs()) == 2
+    assert set(monitor.jobs) == {"job-tracked", "job-orphan"}
+    assert monitor.jobs["job-orphan"].method == "sumstats"
+    jobs = database_utils.get_jobs_for_user(get_db(), "testuser")
+    assert jobs[database_utils.get_dataset_hash("ds-lost", "testuser")]["status"] == "sumstats FAILED"
+
+
+def read_job_log(dataset) -> str:
+    job_log = job_logs.load_job_log(get_db(), "testuser", database_utils.get_dataset_hash(dataset, "testuser"))
+    return b''.join(job_log.lines(0, job_log.total_lines)).decode()
+
+
+def test_finished_job_captures_every_log_page():
+    logs_client = FakeLogsClient(page_size=1000)
+    logs_client.streams["stream-job-long"] = [f"line {i}" for i in range(25000)]
+    batch_client = FakeBatchClient()
+    monitor = BatchMonitor(batch_client, logs_client, min_poll_seconds=0, autostart=False)
+    database_utils.log_job_start(get_db(), "testuser", "ds-long", "RUNNING sldsc", "sldsc")
+
+    async def scenario():
+        batch_client.statuses["job-long"] = "SUCCEEDED"
+        done = monitor.track("job-long", "testuser", "ds-long", "sldsc")
+        await monitor.poll_once()
+        return await done
+
+    assert asyncio.run(scenario()) == "sldsc SUCCEEDED"
+    assert logs_client.calls == 26
+    assert read_job_log("ds-long").splitlines() == logs_client.streams["stream-job-long"]
+
+
+def test_running_job_log_is_captured_incrementally():
+    logs_client = FakeLogsClient(page_size=2)
+    logs_client.streams["stream-job-live"] = ["starting", "step 1"]
+    batch_client = FakeBatchClient()
+    monitor = BatchMonitor(batch_client, logs_client, min_poll_seconds=0, autostart=False,
+                           capture_running_logs=True)
+    database_utils.log_job_start(get_db(), "testuser", "ds-live", "RUNNING sldsc", "sldsc")
+
+    async def scenario():
+        batch_client.statuses["job-live"] = "RUNNING"
+        done = monitor.track("job-live", "testuser", "ds-live", "sldsc")
+        await monitor.poll_once()
+        assert read_job_log("ds-live") == "starting\nstep 1\n"
+
+        logs_client.streams["stream-job-live"] += ["step 2", "step 3", "done"]
+        batch_client.statuses["job-live"] = "SUCCEEDED"
+        monitor.jobs["job-live"].next_poll = 0
+        await monitor.poll_once()
+        return await done
+
+    asyncio.run(scenario())
+    assert read_job_log("ds-live") == "starting\nstep 1\nstep 2\nstep 3\ndone\n"
+
+
+def test_unreadable_log_falls_back_to_status_reason():
+    class BrokenLogsClient:
+        def get_log_events(self, **kwargs):
+            raise RuntimeError("throttled")
+    batch_client = FakeBatchClient()
+    monitor = BatchMonitor(batch_client, BrokenLogsClient(), min_poll_seconds=0, autostart=False)
+    database_utils.log_job_start(get_db(), "testuser", "ds-no-log", "RUNNING sldsc", "sldsc")
+
+    async def scenario():
+        batch_client.statuses["job-no-log"] = "FAILED"
+        batch_client.reasons["job-no-log"] = "Essential container in task exited"
+        done = monitor.track("job-no-log", "testuser", "ds-no-log", "sldsc")
+        await monitor.poll_once()
+        return await done
+
+    assert asyncio.run(scenario()) == "sldsc FAILED"
+    assert job_rows({"ds-no-log"})["ds-no-log"][0] == "sldsc FAILED"
+    assert read_job_log("ds-no-log") == "Essential container in task exited\n"
+
+
+def test_job_end_is_retried_until_recorded(monkeypatch):
+    batch_client = FakeBatchClient()
+    monitor = BatchMonitor(batch_client, FakeLogsClient(), min_poll_seconds=0, autostart=False)
+    database_utils.log_job_start(get_db(), "testuser", "ds-retry", "RUNNING sldsc", "sldsc")
+    log_job_end = database_utils.log_job_end
+    failures = [RuntimeError("lost connection")]
+
+    def flaky_log_job_end(*args):
+        if failures:
+            raise failures.pop()
+        log_job_end(*args)
+    monkeypatch.setattr(database_utils, "log_job_end", flaky_log_job_end)
+
+    async def scenario():
+        batch_client.statuses["job-retry"] = "SUCCEEDED"
+        done = monitor.track("job-retry", "testuser", "ds-retry", "sldsc")
+        await monitor.poll_once()
+        assert "job-retry" in monitor.jobs and not done.done()
+        monitor.jobs["job-retry"].next_poll = 0
+        await monitor.poll_once()
+        assert monitor.jobs == {}
+        return await done
+
+    assert asyncio.run(scenario()) == "sldsc SUCCEEDED"
+    assert job_rows({"ds-retry"})["ds-retry"][0] == "sldsc SUCCEEDED"
+
+
+def job_rows(datasets) -> dict:
+    with get_db() as con:
+        rows = con.execute(text("SELECT dataset, status, batch_job_id FROM dataset_jobs WHERE user = 'testuser'"))
+        return {row[0]: (row[1], row[2]) for row in rows if row[0] in datasets}
+
+
+def test_jobs_started_in_one_upsert():
+    database_utils.log_job_start(get_db(), "testuser", "bulk-0", "RUNNING sumstats", "sumstats")
+    database_utils.record_job_submission(get_db(), "testuser", "bulk-0", "old-job")
+    jobs = [(f"bulk-{i}", "sldsc" if i % 2 else "sumstats") for i in range(1200)]
+
+    database_utils.log_jobs_start(get_db(), "testuser", jobs)
+
+    rows = job_rows({dataset for dataset, _ in jobs})
+    assert len(rows) == 1200
+    # a job being rerun loses the batch job of its previous run
+    assert rows["bulk-0"] == ("RUNNING sumstats", None)
+    assert rows["bulk-1"] == ("RUNNING sldsc", None)
+
+
+@mock_aws
+def test_bulk_jobs_submitted_as_array_jobs(monkeypatch):
+    boto3.resource("s3", region_name="us-east-1").create_bucket(Bucket=s3.BUCKET_NAME)
+    batch_client = FakeBatchClient()
+    monitor = BatchMonitor(batch_client, FakeLogsClient(), min_poll_seconds=0, autostart=False)
+    monkeypatch.setattr(batch, "monitor", monitor)
+    monkeypatch.setattr(batch, "get_client", lambda service: batch_client)
+    monkeypatch.setattr(batch, "ARRAY_SIZE", 3)
+    monkeypatch.setattr(batch, "ARRAY_JOB_DEFINITION", "dig-ldsc-methods-array")
+    jobs = [(f"array-{i}", "sldsc") for i in range(7)]
+    database_utils.log_jobs_start(get_db(), "testuser", jobs)
+
+    async def scenario():
+        task = asyncio.create_task(batch.submit_and_await_jobs("testuser", jobs))
+        while len(monitor.jobs) < 7:
+            await asyncio.sleep(0.01)
+        for batch_job_id in monitor.jobs:
+            batch_client.statuses[batch_job_id] = "SUCCEEDED"
+        await monitor.poll_once()
+        await task
+
+    asyncio.run(scenario())
+    # two arrays of three and the leftover as an ordinary job
+    assert [submission.get("arrayProperties") for submission in batch_client.submissions] == \
+        [{"size": 3}, {"size": 3}, None]
+    assert batch_client.submissions[2]["parameters"] == {"username": "testuser", "dataset": "array-6",
+                                                          "method": "sldsc"}
+    manifest = batch_client.submissions[1]["parameters"]["manifest"]
+    assert json.loads(s3.get_object_body(manifest).read())[1] == {"dataset": "array-4", "method": "sldsc"}
+    # every dataset's row points at its own child, and each child was polled to the end
+    rows = job_rows({dataset for dataset, _ in jobs})
+    assert rows["array-4"] == ("sldsc SUCCEEDED", "parent-2:1")
+    assert rows["array-6"] == ("sldsc SUCCEEDED", "parent-3")
+    assert [len(call) for call in batch_client.describe_calls] == [7]
+    assert batch_client.submissions[0]["jobDefinition"] == "dig-ldsc-methods-array"
+    assert batch_client.submissions[2]["jobDefinition"] == batch.JOB_DEFINITION
+
+
+def test_bulk_jobs_submitted_one_by_one_without_an_array_job_definition(monkeypatch):
+    batch_client = FakeBatchClient()
+    monitor = BatchMonitor(batch_client, FakeLogsClient(), min_poll_seconds=0, autostart=False)
+    monkeypatch.setattr(batch, "monitor", monitor)
+    monkeypatch.setattr(batch, "get_client", lambda service: batch_client)
+    monkeypatch.setattr(batch, "ARRAY_JOB_DEFINITION", "")
+    jobs = [(f"single-{i}", "sldsc") for i in range(3)]
+    database_utils.log_jobs_start(get_db(), "testuser", jobs)
+
+    async def scenario():
+        task = asyncio.create_task(batch.submit_and_await_jobs("testuser", jobs))
+        while len(monitor.jobs) < 3:
+            await asyncio.sleep(0.01)
+        for batch_job_id in monitor.jobs:
+            batch_client.statuses[batch_job_id] = "SUCCEEDED"
+        await monitor.poll_once()
+        await task
+
+    asyncio.run(scenario())
+    assert [submission["parameters"] for submission in batch_client.submissions] == [
+        {"username": "testuser", "dataset": f"single-{i}", "method": "sldsc"} for i in range(3)]
+    assert all("arrayProperties" not in submission for submission in batch_client.submissions)
+    assert job_rows({"single-1"})["single-1"][0] == "sldsc SUCCEEDED"
+
+
+def test_rejected_array_job_fails_its_jobs(monkeypatch):
+    class RejectingClient:
+        def submit_job(self, **kwargs):
+            raise RuntimeError("queue is disabled")
+    monkeypatch.setattr(batch, "get_client", lambda service: RejectingClient())
+    jobs = [("rejected-0", "sumstats")]
+    database_utils.log_jobs_start(get_db(), "testuser", jobs)
+
+    asyncio.run(batch.submit_and_await_jobs("testuser", jobs))
+
+    assert job_rows({"rejected-0"})["rejected-0"] == ("sumstats FAILED", None)
+    assert "queue is disabled" in read_job_log("rejected-0")
+
+
+def test_start_analyses_endpoint(api_client):
+    headers = {"Authorization": f"Bearer {get_token(api_client)}"}
+
+    response = api_client.post("/api/start-analyses", headers=headers, json={"jobs": [
+        {"dataset": "api-0", "method": "sumstats"}, {"dataset": "api-1", "method": "sldsc"}]})
+    assert response.status_code == 200
+    assert response.json()["job_ids"]["api-1"] == database_utils.get_dataset_hash("api-1", "testuser")
+    # left for the scheduler to release
+    assert job_rows({"api-0", "api-1"}) == {"api-0": ("QUEUED sumstats", None), "api-1": ("QUEUED sldsc", None)}
+
+    response = api_client.post("/api/start-analyses", headers=headers, json={"jobs": [
+        {"dataset": "api-0", "method": "sumstats"}, {"dataset": "api-0", "method": "sldsc"}]})
+    assert response.status_code == 400
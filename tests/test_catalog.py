@@ -0,0 +1,59 @@
+import asyncio
+
+import boto3
+from moto import mock_aws
+from sqlalchemy import text
+from starlette.testclient import TestClient
+
+from job_server import catalog, database_utils, s3
+from job_server.database import get_db
+from job_server.model import DatasetInfo
+from tests.test_api import get_token, USER
+
+
+def clear_catalog():
+    with get_db() as con:
+        for table in ("dataset_catalog", "datasets", "dataset_jobs"):
+            con.execute(text(f"DELETE FROM {table}"))
+        con.commit()
+
+
+def dataset_info(name: str, ancestry: str) -> DatasetInfo:
+    return DatasetInfo(name=name, file=f"{name}.tsv", ancestry=ancestry, separator="\t", genome_build="GRCh37",
+                       phenotype=None, effective_n=None, col_map={})
+
+
+def test_datasets_listing_is_ordered_and_paged(api_client: TestClient):
+    clear_catalog()
+    for name, ancestry in [("b-ds", "EUR"), ("a-ds", "AFR"), ("c-ds", "EAS")]:
+        assert database_utils.insert_dataset(get_db(), USER, dataset_info(name, ancestry))
+    database_utils.log_job_start(get_db(), USER, "a-ds", "RUNNING sumstats")
+    headers = {"Authorization": f"Bearer {get_token(api_client)}"}
+
+    datasets = api_client.get("/api/datasets", headers=headers).json()
+    assert [d["dataset"] for d in datasets] == ["a-ds", "b-ds", "c-ds"]
+    assert datasets[0]["status"] == "RUNNING sumstats"
+    assert datasets[0]["id"] == database_utils.get_dataset_hash("a-ds", USER)
+
+    datasets = api_client.get("/api/datasets?orderBy=ancestry&orderDir=desc&limit=2&offset=0",
+                              headers=headers).json()
+    assert [d["ancestry"] for d in datasets] == ["EUR", "EAS"]
+
+    database_utils.delete_dataset(get_db(), USER, "b-ds")
+    datasets = api_client.get("/api/datasets", headers=headers).json()
+    assert [d["dataset"] for d in datasets] == ["a-ds", "c-ds"]
+
+
+@mock_aws
+def test_reconciler_paginates_s3():
+    clear_catalog()
+    boto3.resource("s3", region_name="us-east-1").create_bucket(Bucket=s3.BUCKET_NAME)
+    client = boto3.client("s3", region_name="us-east-1")
+    names = [f"ds-{i:04d}" for i in range(1005)]
+    for name in names:
+        client.put_object(Bucket=s3.BUCKET_NAME, Key=f"userdata/{USER}/genetic/{name}/raw/file.tsv", Body=b"a")
+    assert database_utils.insert_dataset(get_db(), USER, dataset_info("gone-ds", "EUR"))
+
+    asyncio.run(catalog.reconcile_all())
+
+    assert database_utils.get_catalog_datasets(get_db(), USER) == set(names)
@@ -0,0 +1,160 @@
+import asyncio
+import json
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event, text
+
+from job_server import api, database_utils
+from job_server.database import get_db, run_db, engine, create_db_engine, normalize_sql, query_stats
+from tests.test_api import get_token
+
+
+def clear_jobs():
+    with get_db() as con:
+        con.execute(text("DELETE FROM dataset_jobs"))
+        con.commit()
+
+
+def test_log_job_start_upserts():
+    clear_jobs()
+    database_utils.log_job_start(get_db(), "testuser", "ds1", "RUNNING sumstats")
+    database_utils.log_job_start(get_db(), "testuser", "ds1", "RUNNING sldsc")
+    jobs = database_utils.get_jobs_for_user(get_db(), "testuser")
+    assert [job["status"] for job in jobs.values()] == ["RUNNING sldsc"]
+
+
+def test_run_db_offloads_concurrent_calls():
+    clear_jobs()
+    database_utils.log_job_start(get_db(), "testuser", "ds1", "RUNNING sumstats")
+    job_id = database_utils.get_dataset_hash("ds1", "testuser")
+
+    async def read_concurrently():
+        return await asyncio.gather(*[run_db(database_utils.get_job_status, get_db(), job_id) for _ in range(20)])
+
+    assert asyncio.run(read_concurrently()) == ["RUNNING sumstats"] * 20
+
+
+def test_pool_is_configured():
+    if engine.dialect.name == 'mysql':
+        assert engine.pool._pre_ping
+        assert engine.pool._recycle > 0
+
+
+def test_in_memory_sqlite_is_refused():
+    # its single connection can't be shared by the db and Batch worker threads
+    for url in ("sqlite://", "sqlite:///:memory:"):
+        with pytest.raises(ValueError):
+            create_db_engine(url)
+
+
+def test_normalize_sql():
+    assert normalize_sql("SELECT * FROM datasets WHERE uploaded_by = %(user)s AND id IN (%(ids_1)s, %(ids_2)s)\n"
+                         "  AND metadata->>'$.name' = 'x' LIMIT 10") == \
+        "SELECT * FROM datasets WHERE uploaded_by = ? AND id IN (...) AND metadata->>'$.name' = ? LIMIT ?"
+
+
+def test_statements_and_checkouts_are_recorded(monkeypatch):
+    clear_jobs()
+    query_stats.reset()
+    monkeypatch.setattr(query_stats, "slow_query_ms", 0)
+    for i in range(3):
+        database_utils.log_job_start(get_db(), "testuser", f"ds{i}", "RUNNING sumstats")
+    database_utils.get_jobs_for_user(get_db(), "testuser")
+
+    snapshot = query_stats.snapshot(engine.pool)
+    inserts = [entry for entry in snapshot["statements"] if entry["sql"].startswith("INSERT INTO dataset_jobs")]
+    assert len(inserts) == 1
+    assert inserts[0]["count"] == 3
+    assert snapshot["pool"]["checkout"]["count"] == 4
+    assert snapshot["slow_queries"][-1]["sql"].startswith("SELECT")
+
+
+def test_db_stats_are_admin_only(api_client, monkeypatch):
+    headers = {"Authorization": f"Bearer {get_token(api_client)}"}
+    assert api_client.get("/api/admin/db-stats", headers=headers).status_code == 403
+    monkeypatch.setattr(api, "ADMIN_USERS", {"testuser"})
+    response = api_client.get("/api/admin/db-stats", headers=headers)
+    assert response.status_code == 200
+    assert {"statements", "pool", "slow_queries"} <= set(response.json())
+
+
+def test_results_cache_stats_are_admin_only(api_client, monkeypatch):
+    headers = {"Authorization": f"Bearer {get_token(api_client)}"}
+    assert api_client.get("/api/admin/results-cache", headers=headers).status_code == 403
+    monkeypatch.setattr(api, "ADMIN_USERS", {"testuser"})
+    assert "evictions" in api_client.get("/api/admin/results-cache", headers=headers).json()
+
+
+SEED_ROWS = 100_000
+
+
+@pytest.fixture(scope="module")
+def seeded_tables():
+    # a hundred thousand datasets and jobs spread over a thousand users
+    rows = [{"id": f"seed-{i:06d}", "user": f"seed-user-{i % 1000}", "name": f"dataset-{i}",
+             "metadata": json.dumps({"name": f"dataset-{i}", "ancestry": "EUR"})} for i in range(SEED_ROWS)]
+    with get_db() as con:
+        con.execute(text("INSERT INTO datasets (id, uploaded_by, metadata, uploaded_at) "
+                         "VALUES (:id, :user, :metadata, NOW())"), rows)
+        con.execute(text("INSERT INTO dataset_jobs (id, user, status, updated_at, dataset) "
+                         "VALUES (:id, :user, 'SUCCEEDED sumstats', NOW(), :name)"), rows)
+        con.commit()
+    yield
+    with get_db() as con:
+        con.execute(text("DELETE FROM datasets WHERE id LIKE 'seed-%'"))
+        con.execute(text("DELETE FROM dataset_jobs WHERE id LIKE 'seed-%'"))
+        con.commit()
+
+
+@contextmanager
+def issued_statements():
+    """
+    The (statement, parameters) pairs sent to the database inside the block, seen by the same engine event the
+    query stats are recorded from.
+    """
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+
+
+def explain(statement: str, parameters) -> list:
+    """
+    (table, index used or None) for each table the statement reads.
+    """
+    with get_db() as con:
+        if engine.dialect.name == 'sqlite':
+            plan = [row[3] for row in con.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+            return [(detail.split()[1], detail.split('INDEX ')[1].split()[0] if 'INDEX' in detail else None)
+                    for detail in plan if detail.startswith(('SCAN', 'SEARCH'))]
+        return [(row._mapping['table'], row._mapping['key'])
+                for row in con.exec_driver_sql(f"EXPLAIN {statement}", parameters)]
+
+
+def test_dataset_metadata_uses_index(seeded_tables):
+    with issued_statements() as statements:
+        metadata = database_utils.get_dataset_metadata(get_db(), "seed-user-7")
+    assert [explain(*statement) for statement in statements] == [[("datasets", "idx_datasets_uploaded_by_name")]]
+    assert len(metadata) == SEED_ROWS // 1000
+    assert metadata["dataset-7"]["ancestry"] == "EUR"
+
+
+def test_jobs_for_user_uses_index(seeded_tables):
+    with issued_statements() as statements:
+        jobs = database_utils.get_jobs_for_user(get_db(), "seed-user-7")
+    assert [explain(*statement) for statement in statements] == [[("dataset_jobs",
+                                                                    "idx_dataset_jobs_user_updated_at")]]
+    assert len(jobs) == SEED_ROWS // 1000
+
+
+def test_log_info_reads_stored_name(seeded_tables):
+    with get_db() as con:
+        con.execute(text("UPDATE dataset_jobs SET dataset = NULL WHERE id = 'seed-000007'"))
+        con.commit()
+    assert database_utils.get_log_info(get_db(), "seed-user-7", "seed-000007")["dataset"] == "dataset-7"
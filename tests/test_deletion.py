@@ -0,0 +1,99 @@
+import asyncio
+
+import boto3
+from moto import mock_aws
+
+from job_server import database_utils, deletion, s3
+from job_server.database import get_db
+from tests.test_api import get_token, USER
+from tests.test_catalog import clear_catalog, dataset_info
+
+
+def put_objects(client, dataset: str, count: int):
+    for i in range(count):
+        folder = ["raw", "sldsc/sldsc", "sldsc/intermediate"][i % 3]
+        client.put_object(Bucket=s3.BUCKET_NAME, Key=f"userdata/{USER}/genetic/{dataset}/{folder}/{i}", Body=b"a")
+
+
+def remaining(client, dataset: str) -> int:
+    return client.list_objects_v2(Bucket=s3.BUCKET_NAME, Prefix=f"userdata/{USER}/genetic/{dataset}/")["KeyCount"]
+
+
+def record_events(monkeypatch) -> list:
+    events = []
+
+    async def publish_job_status(username, job_id, data):
+        events.append((job_id, data))
+    monkeypatch.setattr(deletion, "publish_job_status", publish_job_status)
+    return events
+
+
+@mock_aws
+def test_bulk_delete_purges_in_background(api_client, monkeypatch):
+    clear_catalog()
+    events = record_events(monkeypatch)
+    boto3.resource("s3", region_name="us-east-1").create_bucket(Bucket=s3.BUCKET_NAME)
+    client = boto3.client("s3", region_name="us-east-1")
+    put_objects(client, "ds", 2500)
+    put_objects(client, "small", 3)
+    # shares a prefix with "ds" but isn't being deleted
+    put_objects(client, "ds2", 3)
+    for name in ["ds", "small", "ds2"]:
+        assert database_utils.insert_dataset(get_db(), USER, dataset_info(name, "EUR"))
+    headers = {"Authorization": f"Bearer {get_token(api_client)}"}
+
+    response = api_client.post("/api/delete-datasets", json={"datasets": ["ds", "small", "ds"]}, headers=headers)
+    assert response.status_code == 202
+    delete_id = response.json()["delete_id"]
+    assert response.json()["datasets"] == ["ds", "small"]
+
+    assert remaining(client, "ds") == 0
+    assert remaining(client, "small") == 0
+    assert remaining(client, "ds2") == 3
+    assert [d["dataset"] for d in api_client.get("/api/datasets", headers=headers).json()] == ["ds2"]
+    ds_id = database_utils.get_dataset_hash("ds", USER)
+    progress = [data["deleted_objects"] for job_id, data in events if job_id == ds_id]
+    assert progress[-1] == 2500 and len(progress) > 3
+    assert [data for job_id, data in events if job_id == ds_id][-1]["status"] == "DELETE SUCCEEDED"
+    assert events[-1] == (delete_id, {"status": "DELETE SUCCEEDED", "datasets": 2, "completed": 2, "failed": []})
+
+
+def test_deleting_datasets_are_hidden_at_once(api_client):
+    clear_catalog()
+    for name in ["a-ds", "b-ds"]:
+        assert database_utils.insert_dataset(get_db(), USER, dataset_info(name, "EUR"))
+    database_utils.mark_datasets_deleting(get_db(), USER, ["a-ds", "never-uploaded"])
+    assert [d["dataset"] for d in database_utils.get_catalog(get_db(), USER)] == ["b-ds"]
+    assert database_utils.get_deleting_datasets(get_db()) == {USER: ["a-ds", "never-uploaded"]}
+
+
+@mock_aws
+def test_failed_keys_are_retried(monkeypatch):
+    clear_catalog()
+    events = record_events(monkeypatch)
+    monkeypatch.setattr(deletion, "RETRY_SECONDS", 0)
+    boto3.resource("s3", region_name="us-east-1").create_bucket(Bucket=s3.BUCKET_NAME)
+    client = boto3.client("s3", region_name="us-east-1")
+    put_objects(client, "flaky", 10)
+    put_objects(client, "stuck", 10)
+    database_utils.mark_datasets_deleting(get_db(), USER, ["flaky", "stuck"])
+    delete_keys = s3.delete_keys
+    lost = []
+
+    def flaky_delete_keys(keys):
+        # every key of "stuck" always fails, and the first batch of "flaky" loses one key
+        if "/stuck/" in keys[0]:
+            return keys
+        if not lost:
+            lost.append(keys[0])
+            return keys[:1] + delete_keys(keys[1:])
+        return delete_keys(keys)
+    monkeypatch.setattr(s3, "delete_keys", flaky_delete_keys)
+
+    failed = asyncio.run(deletion.delete_datasets(USER, ["flaky", "stuck"], "delete-id"))
+
+    assert failed == ["stuck"]
+    assert remaining(client, "flaky") == 0
+    assert remaining(client, "stuck") == 10
+    assert [d["status"] for d in database_utils.get_catalog(get_db(), USER)] == ["DELETE FAILED"]
+    assert events[-1][1]["failed"] == ["stuck"]
@@ -0,0 +1,123 @@
+import asyncio
+import sys
+import time
+
+import pytest
+from sqlalchemy import text
+
+from job_server import batch, database_utils, execution
+from job_server.database import get_db
+from job_server.execution import ExecutionBackend, LocalBackend, RoutingBackend, create_execution_backend
+from tests.test_batch import job_rows, read_job_log
+from tests.test_catalog import dataset_info
+
+# prints its arguments, sleeps when asked to and fails for sldsc
+METHOD = (f"{sys.executable} -c \"import sys, time; print('\\n'.join(sys.argv[1:])); "
+          "time.sleep(float(sys.argv[2].split('-')[1]) if sys.argv[2].startswith('sleep-') else 0); "
+          "sys.exit(sys.argv[3] == 'sldsc')\" "
+          "{username} {dataset} {method}")
+
+
+def start(jobs):
+    database_utils.log_jobs_start(get_db(), "testuser", jobs)
+
+
+def test_local_backend_runs_jobs_in_processes():
+    jobs = [("local-ok", "sumstats"), ("local-bad", "sldsc")]
+    start(jobs)
+    asyncio.run(LocalBackend(METHOD).run("testuser", jobs))
+
+    rows = job_rows({"local-ok", "local-bad"})
+    assert rows["local-ok"][0] == "sumstats SUCCEEDED"
+    assert rows["local-bad"][0] == "sldsc FAILED"
+    assert rows["local-ok"][1].startswith(batch.LOCAL_JOB_PREFIX)
+    assert read_job_log("local-ok") == "testuser\nlocal-ok\nsumstats\n"
+
+
+def test_local_backend_is_bounded_and_times_out():
+    jobs = [(f"sleep-0.3-{i}", "sumstats") for i in range(4)]
+    start(jobs)
+    started = time.perf_counter()
+    asyncio.run(LocalBackend(METHOD, workers=2).run("testuser", jobs))
+    # two at a time
+    assert time.perf_counter() - started >= 0.6
+
+    start([("sleep-10", "sumstats")])
+    status = asyncio.run(LocalBackend(METHOD, timeout=0.5).run_job("testuser", "sleep-10", "sumstats"))
+    assert status == "sumstats FAILED"
+    assert read_job_log("sleep-10").endswith("Stopped after running for 0.5 seconds\n")
+
+
+def test_failed_log_write_stops_the_command(monkeypatch):
+    processes = []
+    create_subprocess_exec = asyncio.create_subprocess_exec
+
+    async def recording_create_subprocess_exec(*args, **kwargs):
+        processes.append(await create_subprocess_exec(*args, **kwargs))
+        return processes[-1]
+
+    def failing_write(self, lines):
+        raise RuntimeError("log storage is down")
+    monkeypatch.setattr(asyncio, "create_subprocess_exec", recording_create_subprocess_exec)
+    monkeypatch.setattr(execution.LogChunkWriter, "write", failing_write)
+    monkeypatch.setattr(execution, "LOG_LINES_PER_WRITE", 1)
+    start([("sleep-10-unlogged", "sumstats")])
+    backend = LocalBackend(METHOD, timeout=30)
+
+    started = time.perf_counter()
+    assert asyncio.run(backend.run_job("testuser", "sleep-10-unlogged", "sumstats")) == "sumstats FAILED"
+    assert time.perf_counter() - started < 5
+    assert processes[0].returncode is not None
+
+
+def test_unrunnable_command_fails_the_job():
+    start([("missing-command", "sumstats")])
+    backend = LocalBackend("/nonexistent/method {dataset}")
+    assert asyncio.run(backend.run_job("testuser", "missing-command", "sumstats")) == "sumstats FAILED"
+    assert read_job_log("missing-command").startswith("The job could not be run")
+
+
+class RecordingBackend(ExecutionBackend):
+    def __init__(self):
+        self.jobs = []
+
+    async def run(self, user, jobs):
+        self.jobs.extend(jobs)
+
+
+def test_small_jobs_are_routed_locally():
+    with get_db() as con:
+        con.execute(text("DELETE FROM datasets"))
+        con.commit()
+    for name, rows in [("small", 1000), ("large", 5000000)]:
+        info = dataset_info(name, "EUR")
+        info.row_count = rows
+        assert database_utils.insert_dataset(get_db(), "testuser", info)
+    local, remote = RecordingBackend(), RecordingBackend()
+    backend = RoutingBackend(local, remote, methods={"sumstats"}, max_rows=1000000)
+
+    asyncio.run(backend.run("testuser", [("small", "sumstats"), ("large", "sumstats"), ("small", "sldsc"),
+                                         ("never-validated", "sumstats")]))
+
+    assert local.jobs == [("small", "sumstats")]
+    assert remote.jobs == [("large", "sumstats"), ("small", "sldsc"), ("never-validated", "sumstats")]
+
+
+def test_backend_choice():
+    assert isinstance(create_execution_backend("batch"), execution.BatchBackend)
+    with pytest.raises(ValueError):
+        create_execution_backend("kubernetes")
+    # nothing to run without a command
+    with pytest.raises(ValueError):
+        LocalBackend("")
+
+
+def test_local_jobs_are_requeued_on_restart(monkeypatch):
+    with get_db() as con:
+        con.execute(text("DELETE FROM dataset_jobs"))
+        con.commit()
+    start([("interrupted", "sumstats")])
+    database_utils.record_job_submission(get_db(), "testuser", "interrupted", f"{batch.LOCAL_JOB_PREFIX}abc")
+
+    assert asyncio.run(batch.resume_jobs()) == 0
+    assert job_rows({"interrupted"}) == {"interrupted": ("QUEUED sumstats", None)}
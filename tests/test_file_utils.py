@@ -0,0 +1,71 @@
+import asyncio
+import gzip
+import io
+
+from fastapi import UploadFile
+
+from job_server import file_utils
+
+
+class CountingFile(io.BytesIO):
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+def sumstats(rows: int, delimiter: str = "\t") -> bytes:
+    header = delimiter.join(["chromosome", "position", "reference", "alt", "pValue", "beta"])
+    lines = [header] + [delimiter.join([str(i % 22 + 1), str(i * 100), "A", "G", f"{(i % 97) / 100:.4f}", "0.5"])
+                        for i in range(rows)]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def read_sample(data: bytes, **kwargs):
+    file = CountingFile(data)
+    lines = asyncio.run(file_utils.read_sample_lines(UploadFile(file, filename="upload"), **kwargs))
+    return lines, file
+
+
+def test_sample_reads_only_the_start_of_large_gzip():
+    data = gzip.compress(sumstats(500000), compresslevel=1)
+    lines, file = read_sample(data, max_lines=10)
+    assert len(lines) == 11
+    assert lines[0].startswith("chromosome\tposition")
+    assert lines[10] == "10\t900\tA\tG\t0.0900\t0.5"
+    assert file.bytes_read < len(data) / 10
+
+
+def test_sample_spans_gzip_members():
+    # bgzip style, one small member per block
+    data = b"".join(gzip.compress(line + b"\n") for line in sumstats(20).splitlines())
+    lines, _ = read_sample(data)
+    assert len(lines) == 21
+    assert lines[20].startswith("20\t1900\t")
+
+
+def test_sample_of_whole_small_file_keeps_last_line():
+    lines, _ = read_sample(b"a,b\r\n1,2\r\n3,4")
+    assert lines == ["a,b", "1,2", "3,4"]
+
+
+def test_sample_drops_partial_last_line():
+    lines, _ = read_sample(sumstats(1000), max_bytes=1000)
+    assert all(len(line.split("\t")) == 6 for line in lines)
+
+
+def test_detect_delimiter_from_content():
+    assert file_utils.detect_delimiter(["a\tb,c", "1\t2,3"]) == "\t"
+    assert file_utils.detect_delimiter(['a,"b,c",d', '1,"2,3",4']) == ","
+    assert file_utils.detect_delimiter(["a b c", "1 2 3"]) == " "
+    assert file_utils.detect_delimiter(["single"]) == ","
+
+
+def test_infer_column_types():
+    df = file_utils.parse_sample(["chromosome,position,pValue,rsid", "1,100,0.5,", "X,200,,rs1"], ",")
+    assert file_utils.infer_column_types(df) == {"chromosome": "TEXT", "position": "INTEGER",
+                                                 "pValue": "DECIMAL", "rsid": "TEXT"}
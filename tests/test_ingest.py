@@ -0,0 +1,98 @@
+import gzip
+import io
+import json
+
+import boto3
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from moto import mock_aws
+
+from job_server import ingest, s3
+from job_server.ingest import ingest_stream, ingest_upload
+from tests.test_api import BUCKET, USER
+from tests.test_validation import chunks, dataset, sumstats
+
+
+def test_ingest_stream_partitions_by_chromosome(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "ROW_GROUP_ROWS", 100)
+    data = sumstats(5000, {3: "chr1\t7\ta\tg\t1e-300\t0.5\t5000", 4: "x\t8\tC\tT\t0.5\t\t5000",
+                           5: "chrUn_gl000220\t9\tA\tG\t0.5\t0.1\t5000", 6: "24\t10\tA\tG\t0.5\t0.1\t5000"})
+    manifest = ingest_stream(chunks(gzip.compress(data)), dataset(), str(tmp_path))
+
+    assert manifest["columns"] == ["chromosome", "position", "reference", "alt", "pValue", "beta", "n"]
+    # the contig validation skips is left out, PLINK's 24 is Y
+    assert manifest["row_count"] == 4999
+    assert list(manifest["chromosomes"]) == [str(c) for c in range(1, 23)] + ["X", "Y"]
+    assert manifest["chromosomes"]["X"] == manifest["chromosomes"]["Y"] == 1
+
+    table = pq.read_table(tmp_path / "chromosome=1" / "part-0.parquet")
+    assert table.schema.field("position").type == pa.uint32()
+    assert table.schema.field("beta").type == pa.float32()
+    assert pq.ParquetFile(tmp_path / "chromosome=1" / "part-0.parquet").metadata.num_row_groups > 1
+    rows = table.to_pylist()
+    assert rows[0]["position"] == 1000
+    # file order is kept within a chromosome and alleles are upper cased
+    assert rows[1] == {"position": 7, "reference": "A", "alt": "G", "pValue": 1e-300, "beta": 0.5, "n": 5000}
+    assert pq.read_table(tmp_path / "chromosome=X" / "part-0.parquet").to_pylist()[0]["beta"] is None
+
+
+def read_partition(prefix: str, chromosome: str) -> pa.Table:
+    return pq.read_table(io.BytesIO(s3.get_object_body(ingest.partition_key(prefix, chromosome)).read()))
+
+
+def keys(prefix: str) -> list:
+    response = boto3.client("s3", region_name="us-east-1").list_objects_v2(Bucket=BUCKET, Prefix=prefix)
+    return sorted(item["Key"] for item in response.get("Contents", []))
+
+
+@mock_aws
+def test_failed_ingest_keeps_the_previous_copy(monkeypatch):
+    boto3.resource("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET)
+    raw_key = f"userdata/{USER}/genetic/ds/raw/sumstats.tsv.gz"
+    prefix = f"userdata/{USER}/genetic/ds/parquet"
+    s3.put_object(raw_key, gzip.compress(sumstats(2000)))
+    ingest_upload(raw_key, USER, dataset())
+
+    manifest = json.loads(s3.get_object_body(f"{prefix}/_manifest.json").read())
+    assert manifest["source"] == raw_key
+    assert len(read_partition(prefix, "2")) == manifest["chromosomes"]["2"]
+    ingested = keys(f"userdata/{USER}/genetic/ds/parquet")
+
+    # the upload is replaced, and ingesting it fails part way through writing
+    s3.put_object(raw_key, gzip.compress(sumstats(3000)))
+    upload_file = s3.upload_file
+
+    def failing_upload_file(local_path, key):
+        if "chromosome=3/" in key:
+            raise ConnectionError("connection reset")
+        upload_file(local_path, key)
+    monkeypatch.setattr(s3, "upload_file", failing_upload_file)
+    with pytest.raises(ConnectionError):
+        ingest_upload(raw_key, USER, dataset())
+    # nothing staged is left behind and the earlier copy is untouched
+    assert keys(f"userdata/{USER}/genetic/ds/parquet") == ingested
+    assert json.loads(s3.get_object_body(f"{prefix}/_manifest.json").read()) == manifest
+
+    monkeypatch.setattr(s3, "upload_file", upload_file)
+    assert ingest_upload(raw_key, USER, dataset())["row_count"] == 3000
+    assert keys(f"userdata/{USER}/genetic/ds/parquet") == ingested
+    assert len(read_partition(prefix, "2")) == json.loads(
+        s3.get_object_body(f"{prefix}/_manifest.json").read())["chromosomes"]["2"]
+
+
+@mock_aws
+def test_timed_out_ingest_is_not_swapped_in():
+    boto3.resource("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET)
+    raw_key = f"userdata/{USER}/genetic/ds/raw/sumstats.tsv.gz"
+    s3.put_object(raw_key, gzip.compress(sumstats(2000)))
+    ingest_upload(raw_key, USER, dataset())
+    ingested = keys(f"userdata/{USER}/genetic/ds/parquet")
+
+    s3.put_object(raw_key, gzip.compress(sumstats(3000)))
+    # the ingest has stopped by the time it raises, so whatever runs next sees the earlier copy
+    with pytest.raises(TimeoutError):
+        ingest_upload(raw_key, USER, dataset(), timeout=1e-9)
+    assert keys(f"userdata/{USER}/genetic/ds/parquet") == ingested
+    assert json.loads(s3.get_object_body(f"userdata/{USER}/genetic/ds/parquet/_manifest.json").read())[
+        "row_count"] == 2000
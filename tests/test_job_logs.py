@@ -0,0 +1,86 @@
+import zlib
+
+from sqlalchemy import text
+
+from job_server import database_utils, job_logs
+from job_server.database import get_db
+from job_server.job_logs import LogChunkWriter
+from tests.test_api import get_token
+
+LINES = [f"line {i} " + "x" * (i % 7) for i in range(1000)]
+FULL_LOG = "".join(line + "\n" for line in LINES)
+
+
+def store_log(monkeypatch, dataset="ds-log"):
+    monkeypatch.setattr(job_logs, "CHUNK_BYTES", 1024)
+    database_utils.log_job_start(get_db(), "testuser", dataset, "RUNNING sldsc", "sldsc")
+    job_id = database_utils.get_dataset_hash(dataset, "testuser")
+    writer = LogChunkWriter(job_id)
+    for start in range(0, len(LINES), 150):
+        writer.write(LINES[start:start + 150])
+    writer.flush()
+    return job_id
+
+
+def test_log_is_stored_in_chunks(monkeypatch):
+    job_id = store_log(monkeypatch)
+    job_log = job_logs.load_job_log(get_db(), "testuser", job_id)
+    assert len(job_log.chunks) > 10
+    assert job_log.total_lines == len(LINES)
+    assert job_log.total_bytes == len(FULL_LOG)
+    assert b"".join(job_log.lines(0, job_log.total_lines)).decode() == FULL_LOG
+    assert b"".join(job_log.lines(10, 20)).decode().splitlines() == LINES[10:20]
+    assert b"".join(job_log.byte_range(500, 2999)).decode() == FULL_LOG[500:3000]
+    assert job_logs.load_job_log(get_db(), "otheruser", job_id) is None
+
+
+def test_tail_reads_only_the_last_chunks(monkeypatch):
+    job_id = store_log(monkeypatch)
+    fetched = []
+    get_log_chunks = database_utils.get_log_chunks
+
+    def counting_get_log_chunks(db, job_id, seqs):
+        fetched.extend(seqs)
+        return get_log_chunks(db, job_id, seqs)
+
+    monkeypatch.setattr(database_utils, "get_log_chunks", counting_get_log_chunks)
+    job_log = job_logs.load_job_log(get_db(), "testuser", job_id)
+    tail = b"".join(job_log.lines(job_log.total_lines - 5, job_log.total_lines)).decode()
+    assert tail.splitlines() == LINES[-5:]
+    assert len(fetched) <= 2
+
+
+def test_legacy_log_is_decompressed(monkeypatch):
+    database_utils.log_job_start(get_db(), "testuser", "ds-legacy", "RUNNING sldsc", "sldsc")
+    job_id = database_utils.get_dataset_hash("ds-legacy", "testuser")
+    with get_db() as con:
+        con.execute(text("UPDATE dataset_jobs SET job_log = :job_log WHERE id = :id"),
+                    {"job_log": zlib.compress("first\nsecond".encode()), "id": job_id})
+        con.commit()
+    job_log = job_logs.load_job_log(get_db(), "testuser", job_id)
+    assert b"".join(job_log.lines(1, 2)) == b"second\n"
+
+
+def test_log_endpoint(api_client, monkeypatch):
+    job_id = store_log(monkeypatch)
+    headers = {"Authorization": f"Bearer {get_token(api_client)}"}
+
+    res = api_client.get(f"/api/log/{job_id}?tail=3", headers=headers)
+    assert res.status_code == 200
+    assert res.text.splitlines() == LINES[-3:]
+    assert res.headers["X-Log-Lines"] == str(len(LINES))
+    assert res.headers["X-Log-First-Line"] == str(len(LINES) - 3)
+
+    res = api_client.get(f"/api/log/{job_id}?start_line=5&end_line=8", headers=headers)
+    assert res.text.splitlines() == LINES[5:8]
+
+    res = api_client.get(f"/api/log/{job_id}", headers={**headers, "Range": "bytes=100-199"})
+    assert res.status_code == 206
+    assert res.text == FULL_LOG[100:200]
+    assert res.headers["Content-Range"] == f"bytes 100-199/{len(FULL_LOG)}"
+
+    assert api_client.get(f"/api/log/{job_id}", headers=headers).text == FULL_LOG
+    assert api_client.get("/api/log/not-a-job", headers=headers).status_code == 404
+
+    info = api_client.get(f"/api/log-info/{job_id}", headers=headers).json()
+    assert info == {"dataset": "ds-log", "lines": len(LINES), "bytes": len(FULL_LOG)}
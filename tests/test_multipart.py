@@ -0,0 +1,108 @@
+import gzip
+import json
+
+import boto3
+from moto import mock_aws
+from sqlalchemy import text
+
+from job_server import ingest, s3
+from job_server.database import get_db
+from tests.test_api import BUCKET, USER, get_token
+from tests.test_batch import job_rows
+from tests.test_validation import dataset, sumstats
+
+KEY = f"userdata/{USER}/genetic/ds/raw/sumstats.tsv.gz"
+
+
+def upload_parts(s3_client, upload_id: str, data: bytes, part_size: int, part_numbers: list) -> list:
+    parts = []
+    for part_number in part_numbers:
+        body = data[(part_number - 1) * part_size:part_number * part_size]
+        response = s3_client.upload_part(Bucket=BUCKET, Key=KEY, UploadId=upload_id, PartNumber=part_number,
+                                         Body=body)
+        parts.append({"part_number": part_number, "etag": response["ETag"]})
+    return parts
+
+
+def test_part_size_grows_for_huge_files():
+    assert s3.multipart_part_size(None) == s3.MULTIPART_PART_SIZE
+    assert s3.multipart_part_size(10 * 2 ** 30) == s3.MULTIPART_PART_SIZE
+    size = 5 * 2 ** 40
+    assert -(-size // s3.multipart_part_size(size)) <= s3.MULTIPART_MAX_PARTS
+
+
+@mock_aws
+def test_resumed_multipart_upload_is_finalized(api_client, monkeypatch):
+    monkeypatch.setattr(s3, "MULTIPART_PART_SIZE", s3.MULTIPART_MIN_PART_SIZE)
+    boto3.resource("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET)
+    s3_client = boto3.client("s3", region_name="us-east-1")
+    headers = {"Authorization": f"Bearer {get_token(api_client)}"}
+    # stored uncompressed so the file spans two parts
+    data = gzip.compress(sumstats(200000), 0)
+
+    response = api_client.post("/api/multipart-upload/ds", json={"filename": "sumstats.tsv.gz", "size": len(data)},
+                               headers=headers)
+    assert response.status_code == 200
+    upload = response.json()
+    assert upload["s3_path"] == KEY
+    assert upload["part_count"] == 2
+    upload_id, part_size = upload["upload_id"], upload["part_size"]
+
+    response = api_client.post(f"/api/multipart-upload/ds/{upload_id}/part-urls",
+                               json={"filename": "sumstats.tsv.gz", "part_numbers": [1, 2]}, headers=headers)
+    assert response.status_code == 200
+    urls = response.json()["urls"]
+    assert set(urls) == {"1", "2"}
+    assert all(f"uploadId={upload_id}" in url for url in urls.values())
+
+    # the connection drops after the first part, the client asks what arrived and sends the rest
+    upload_parts(s3_client, upload_id, data, part_size, [1])
+    response = api_client.get(f"/api/multipart-upload/ds/{upload_id}/parts", params={"filename": "sumstats.tsv.gz"},
+                              headers=headers)
+    assert [part["part_number"] for part in response.json()["parts"]] == [1]
+    upload_parts(s3_client, upload_id, data, part_size, [2])
+
+    with get_db() as con:
+        con.execute(text("DELETE FROM dataset_jobs WHERE dataset = 'ds'"))
+        con.execute(text("DELETE FROM datasets WHERE name = 'ds'"))
+        con.commit()
+    ingest_upload_async = ingest.ingest_upload_async
+    jobs_during_ingest = []
+
+    async def watched_ingest(*args):
+        jobs_during_ingest.append(job_rows({"ds"}))
+        await ingest_upload_async(*args)
+    monkeypatch.setattr(ingest, "ingest_upload_async", watched_ingest)
+    response = api_client.post("/api/finalize-upload", json={**dataset().model_dump(), "upload_id": upload_id},
+                               headers=headers)
+    assert response.status_code == 202
+    assert s3_client.get_object(Bucket=BUCKET, Key=KEY)["Body"].read() == data
+    # finalizing also ingests the upload
+    manifest = s3_client.get_object(Bucket=BUCKET, Key=f"userdata/{USER}/genetic/ds/parquet/_manifest.json")
+    assert json.loads(manifest["Body"].read())["row_count"] == 200000
+    # and queues the sumstats job once it is ingested
+    assert jobs_during_ingest == [{"ds": ("VALIDATING", None)}]
+    assert job_rows({"ds"})["ds"][0] == "QUEUED sumstats"
+
+
+@mock_aws
+def test_abort_multipart_upload(api_client):
+    boto3.resource("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET)
+    s3_client = boto3.client("s3", region_name="us-east-1")
+    headers = {"Authorization": f"Bearer {get_token(api_client)}"}
+    upload_id = api_client.post("/api/multipart-upload/ds", json={"filename": "sumstats.tsv.gz"},
+                                headers=headers).json()["upload_id"]
+    response = api_client.delete(f"/api/multipart-upload/ds/{upload_id}", params={"filename": "sumstats.tsv.gz"},
+                                 headers=headers)
+    assert response.status_code == 200
+    assert "Uploads" not in s3_client.list_multipart_uploads(Bucket=BUCKET)
+    response = api_client.get(f"/api/multipart-upload/ds/{upload_id}/parts", params={"filename": "sumstats.tsv.gz"},
+                              headers=headers)
+    assert response.status_code == 404
+
+
+def test_part_urls_are_capped(api_client):
+    response = api_client.post("/api/multipart-upload/ds/some-id/part-urls",
+                               json={"filename": "f", "part_numbers": list(range(1, 1002))},
+                               headers={"Authorization": f"Bearer {get_token(api_client)}"})
+    assert response.status_code == 400
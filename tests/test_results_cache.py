@@ -0,0 +1,87 @@
+import boto3
+from moto import mock_aws
+
+from job_server import s3
+from job_server.results_cache import ResultsCache
+
+RESULTS_PATH = "userdata/testuser/genetic/test-ds/sldsc/sldsc"
+RESULTS_TSV = "ann1\ttissue1\tbio1\t1.5\t0.01\nann2\ttissue2\tbio2\t0.5\t0.2\n"
+
+
+def put_results(body: str, results_path: str = RESULTS_PATH):
+    client = boto3.client("s3", region_name="us-east-1")
+    client.put_object(Bucket=s3.BUCKET_NAME, Key=f"{results_path}/tissue.output.tsv", Body=body.encode())
+
+
+def set_up_results():
+    boto3.resource("s3", region_name="us-east-1").create_bucket(Bucket=s3.BUCKET_NAME)
+    put_results(RESULTS_TSV)
+
+
+@mock_aws
+def test_memory_hit(tmp_path):
+    set_up_results()
+    cache = ResultsCache(cache_dir=str(tmp_path))
+    assert len(cache.get(RESULTS_PATH)) == 2
+    assert len(cache.get(RESULTS_PATH)) == 2
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 1
+
+
+@mock_aws
+def test_disk_tier_survives_restart(tmp_path):
+    set_up_results()
+    ResultsCache(cache_dir=str(tmp_path)).get(RESULTS_PATH)
+    restarted = ResultsCache(cache_dir=str(tmp_path))
+    df = restarted.get(RESULTS_PATH).df
+    assert df["pValue"].tolist() == [0.01, 0.2]
+    assert restarted.stats()["disk_hits"] == 1
+    assert restarted.stats()["misses"] == 0
+
+
+@mock_aws
+def test_rewritten_results_are_not_served(tmp_path):
+    set_up_results()
+    cache = ResultsCache(cache_dir=str(tmp_path), revalidate_seconds=0)
+    cache.get(RESULTS_PATH)
+    put_results("ann3\ttissue3\tbio3\t2.5\t0.001\n")
+    df = cache.get(RESULTS_PATH).df
+    assert df["annotation"].tolist() == ["ann3"]
+    assert cache.stats()["stale"] == 1
+
+
+@mock_aws
+def test_memory_budget_evicts(tmp_path):
+    set_up_results()
+    cache = ResultsCache(cache_dir=str(tmp_path), max_memory_bytes=1)
+    cache.get(RESULTS_PATH)
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["memory_bytes"] == 0
+
+
+@mock_aws
+def test_oldest_entry_is_evicted(tmp_path):
+    set_up_results()
+    other_path = RESULTS_PATH.replace("test-ds", "other-ds")
+    put_results(RESULTS_TSV, other_path)
+    entry_bytes = ResultsCache(cache_dir=str(tmp_path)).get(RESULTS_PATH).nbytes
+    cache = ResultsCache(cache_dir=str(tmp_path), max_memory_bytes=entry_bytes * 3 // 2)
+    cache.get(RESULTS_PATH)
+    cache.get(other_path)
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["entries"] == 1
+    assert cache.peek(RESULTS_PATH) is None
+    assert cache.peek(other_path) is not None
+
+
+@mock_aws
+def test_invalidate(tmp_path):
+    set_up_results()
+    cache = ResultsCache(cache_dir=str(tmp_path))
+    cache.get(RESULTS_PATH)
+    cache.invalidate(RESULTS_PATH)
+    cache.get(RESULTS_PATH)
+    assert cache.stats()["misses"] == 2
+    assert cache.stats()["disk_hits"] == 0
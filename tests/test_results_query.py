@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from job_server.results_query import ResultsQuery
+
+
+@pytest.fixture
+def results_df():
+    rng = np.random.default_rng(7)
+    n = 500
+    return pd.DataFrame({
+        'annotation': rng.choice(['coding', 'enhancer', 'promoter'], n),
+        'tissue': rng.choice(['liver', 'adipose', 'Pancreas', 'brain'], n),
+        'biosample': rng.choice([f"bio{i}" for i in range(20)], n),
+        'enrichment': rng.normal(1, 0.5, n),
+        'pValue': rng.uniform(0, 1, n),
+    })
+
+
+def test_default_page_sorted_by_p_value(results_df):
+    page = ResultsQuery(results_df).page({}, 0, 10)
+    expected_all = results_df.sort_values(by='pValue')
+    expected = expected_all.head(10)
+    assert [row['pValue'] for row in page['items']] == expected['pValue'].tolist()
+    assert page['totalRecords'] == len(results_df)
+    assert page['tissues'] == expected_all['tissue'].unique().tolist()
+    assert page['biosamples'] == expected_all['biosample'].unique().tolist()
+
+
+def test_combined_filters_match_pandas(results_df):
+    query = ResultsQuery(results_df)
+    page = query.page({'tissue': 'pan', 'pValue': '<0.5', 'annotation': 'eq:Enhancer'}, 0, 1000,
+                      'enrichment', False)
+    expected = results_df[results_df['tissue'].str.contains('pan', case=False) &
+                          (results_df['pValue'] < 0.5) &
+                          (results_df['annotation'] == 'enhancer')].sort_values(by='enrichment', ascending=False)
+    assert [row['enrichment'] for row in page['items']] == expected['enrichment'].tolist()
+    assert page['totalRecords'] == len(expected)
+    assert page['tissues'] == ['Pancreas']
+    assert page['annotations'] == ['enhancer']
+    assert page['biosamples'] == expected['biosample'].unique().tolist()
+
+
+def test_paging_and_text_sort(results_df):
+    query = ResultsQuery(results_df)
+    first = query.page({}, 0, 5, 'tissue', True)
+    second = query.page({}, 5, 5, 'tissue', True)
+    tissues = [row['tissue'] for row in first['items'] + second['items']]
+    assert tissues == sorted(results_df['tissue'].tolist())[:10]
+
+
+def test_bad_numeric_filter_is_ignored(results_df):
+    page = ResultsQuery(results_df).page({'pValue': '>abc'}, 0, 10)
+    assert page['totalRecords'] == len(results_df)
+
+
+def test_unknown_sort_field(results_df):
+    with pytest.raises(KeyError):
+        ResultsQuery(results_df).page({}, 0, 10, 'not_a_column')
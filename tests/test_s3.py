@@ -0,0 +1,33 @@
+import asyncio
+import time
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from job_server import s3
+
+
+@mock_aws
+def test_client_is_shared():
+    assert s3.get_client() is s3.get_client()
+
+
+@mock_aws
+def test_run_async_offloads_calls():
+    boto3.resource("s3", region_name="us-east-1").create_bucket(Bucket=s3.BUCKET_NAME)
+    client = boto3.client("s3", region_name="us-east-1")
+    for dataset in ["ds1", "ds2", "ds3"]:
+        client.put_object(Bucket=s3.BUCKET_NAME, Key=f"userdata/testuser/genetic/{dataset}/raw/file.tsv", Body=b"a")
+
+    async def list_concurrently():
+        return await asyncio.gather(*[s3.run_async(s3.get_datasets, "testuser") for _ in range(10)])
+
+    results = asyncio.run(list_concurrently())
+    assert all(sorted(result) == ["ds1", "ds2", "ds3"] for result in results)
+
+
+def test_run_async_times_out(monkeypatch):
+    monkeypatch.setattr(s3, "S3_CALL_TIMEOUT", 0.05)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(s3.run_async(time.sleep, 0.5))
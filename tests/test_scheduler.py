@@ -0,0 +1,179 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import text
+
+from job_server import database_utils, scheduler
+from job_server.database import engine, get_db
+from job_server.execution import ExecutionBackend, FakeBackend
+from job_server.scheduler import Scheduler, fair_order
+from job_server.status_hub import status_hub
+
+
+def clear_jobs():
+    with get_db() as con:
+        con.execute(text("DELETE FROM dataset_jobs"))
+        con.commit()
+
+
+def queued(user, count, priority=0):
+    return [{"id": f"{user}-{i}", "user": user, "priority": priority} for i in range(count)]
+
+
+def test_users_take_turns_within_a_priority():
+    jobs = queued("a", 1, priority=1) + queued("a", 4) + queued("b", 2) + queued("c", 1)
+    assert [job["id"] for job in fair_order(jobs)] == ["a-0", "a-0", "b-0", "c-0", "a-1", "b-1", "a-2", "a-3"]
+    # the turn carries on after whoever was released last
+    assert [job["id"] for job in fair_order(queued("a", 2) + queued("b", 1), after_user="a")] == \
+        ["b-0", "a-0", "a-1"]
+
+
+def test_heavy_user_does_not_starve_others():
+    clear_jobs()
+    backend = FakeBackend(0, 0)
+    jobs_scheduler = Scheduler(backend, max_running=3, max_running_per_user=2)
+
+    async def scenario():
+        await jobs_scheduler.enqueue("heavy", [(f"heavy-{i}", "sumstats") for i in range(6)])
+        await jobs_scheduler.enqueue("light1", [("light1-0", "sumstats"), ("light1-1", "sldsc")])
+        await jobs_scheduler.enqueue("light2", [("light2-0", "sumstats")], scheduler.SINGLE_PRIORITY)
+        released = []
+        # each pass runs what it released to the end before the next one
+        while released[-1:] != [0]:
+            released.append(await jobs_scheduler.schedule_once())
+            await asyncio.gather(*jobs_scheduler.tasks)
+        return released
+
+    # the single analysis first, then the users take turns, until only the heavy user's per-user limit is left
+    assert asyncio.run(scenario()) == [3, 3, 2, 1, 0]
+    assert [dataset for _, dataset in backend.started] == [
+        "light2-0", "heavy-0", "light1-0", "heavy-1", "light1-1", "heavy-2", "heavy-3", "heavy-4", "heavy-5"]
+    jobs = database_utils.get_jobs_for_user(get_db(), "heavy")
+    assert {job["status"] for job in jobs.values()} == {"sumstats SUCCEEDED"}
+
+
+def test_queue_positions_published_when_they_change(monkeypatch):
+    clear_jobs()
+    events = []
+
+    async def publish_job_status(username, job_id, data):
+        events.append(data)
+
+    async def publish_job_statuses(statuses):
+        events.extend(data for _, _, data in statuses)
+    monkeypatch.setattr(scheduler, "publish_job_status", publish_job_status)
+    monkeypatch.setattr(scheduler, "publish_job_statuses", publish_job_statuses)
+
+    class IdleBackend(ExecutionBackend):
+        async def run(self, user, jobs):
+            pass
+    jobs_scheduler = Scheduler(IdleBackend(), max_running=1, max_running_per_user=1)
+
+    async def scenario():
+        await jobs_scheduler.enqueue("queuer", [(f"q-{i}", "sldsc") for i in range(4)])
+        events.clear()
+        async with status_hub.subscribe(f"job:{database_utils.get_dataset_hash('q-2', 'queuer')}"):
+            assert await jobs_scheduler.schedule_once() == 1
+            first = list(events)
+            events.clear()
+            # still running, so nothing moves and nothing is sent
+            assert await jobs_scheduler.schedule_once() == 0
+            assert events == []
+            # the rest are sent once someone listens for them
+            async with status_hub.subscribe("user:queuer"):
+                assert await jobs_scheduler.schedule_once() == 0
+        return first
+
+    first = asyncio.run(scenario())
+    assert first[0] == {"status": "RUNNING sldsc", "dataset": "q-0", "method": "sldsc"}
+    # only the job someone is watching
+    assert [(event["dataset"], event["queue_position"]) for event in first[1:]] == [("q-2", 2)]
+    assert [(event["dataset"], event["queue_position"]) for event in events] == [("q-1", 1), ("q-3", 3)]
+
+
+def test_only_bulk_jobs_are_submitted_together():
+    clear_jobs()
+
+    class RecordingBackend(ExecutionBackend):
+        def __init__(self):
+            self.runs = []
+
+        async def run(self, user, jobs):
+            self.runs.append((user, jobs))
+    backend = RecordingBackend()
+    jobs_scheduler = Scheduler(backend, max_running=10, max_running_per_user=10)
+
+    async def scenario():
+        await jobs_scheduler.enqueue("testuser", [("single-0", "sumstats")], scheduler.SINGLE_PRIORITY)
+        await jobs_scheduler.enqueue("testuser", [("single-1", "sumstats")], scheduler.SINGLE_PRIORITY)
+        await jobs_scheduler.enqueue("testuser", [("bulk-0", "sldsc"), ("bulk-1", "sldsc")], bulk=True)
+        assert await jobs_scheduler.schedule_once() == 4
+        await asyncio.gather(*jobs_scheduler.tasks)
+
+    asyncio.run(scenario())
+    assert backend.runs == [("testuser", [("single-0", "sumstats")]), ("testuser", [("single-1", "sumstats")]),
+                            ("testuser", [("bulk-0", "sldsc"), ("bulk-1", "sldsc")])]
+
+
+def test_jobs_are_claimed_once():
+    clear_jobs()
+    database_utils.log_jobs_start(get_db(), "testuser", [("claimed", "sumstats")], 'QUEUED')
+    running, jobs = database_utils.get_job_queue(get_db(), 10)
+    assert running == {} and [job["dataset"] for job in jobs] == ["claimed"]
+    assert database_utils.claim_queued_jobs(get_db(), jobs, 10, 10) == jobs
+    assert database_utils.claim_queued_jobs(get_db(), jobs, 10, 10) == []
+    assert database_utils.get_job_queue(get_db(), 10) == ({"testuser": 1}, [])
+
+
+def test_claims_are_held_to_the_limits():
+    clear_jobs()
+    database_utils.log_jobs_start(get_db(), "a", [(f"a-{i}", "sumstats") for i in range(3)], 'QUEUED')
+    database_utils.log_jobs_start(get_db(), "b", [(f"b-{i}", "sumstats") for i in range(2)], 'QUEUED')
+    _, jobs = database_utils.get_job_queue(get_db(), 10)
+    # both processes read the queue while nothing was running
+    first = database_utils.claim_queued_jobs(get_db(), [job for job in jobs if job["dataset"] in ("a-0", "a-1")], 3, 2)
+    second = database_utils.claim_queued_jobs(get_db(), [job for job in jobs if job["dataset"] != "a-0"], 3, 2)
+    assert [job["dataset"] for job in first] == ["a-0", "a-1"]
+    assert [job["dataset"] for job in second] == ["b-0"]
+    assert database_utils.get_job_queue(get_db(), 10)[0] == {"a": 2, "b": 1}
+
+
+def test_concurrent_claims_stay_under_the_limits():
+    clear_jobs()
+    for user in "abcd":
+        database_utils.log_jobs_start(get_db(), user, [(f"{user}-{i}", "sumstats") for i in range(5)], 'QUEUED')
+    _, jobs = database_utils.get_job_queue(get_db(), 100)
+    # every process read the same queue and claims at the same time
+    with ThreadPoolExecutor(8) as pool:
+        claimed = list(pool.map(lambda _: database_utils.claim_queued_jobs(get_db(), jobs, 6, 2), range(8)))
+    running = database_utils.get_job_queue(get_db(), 100)[0]
+    assert sum(len(jobs) for jobs in claimed) == sum(running.values()) == 6
+    assert max(running.values()) == 2
+
+
+def test_claims_wait_for_the_claim_lock(monkeypatch):
+    if engine.dialect.name != 'mysql':
+        return
+    clear_jobs()
+    monkeypatch.setattr(database_utils, "CLAIM_LOCK_SECONDS", 0)
+    database_utils.log_jobs_start(get_db(), "testuser", [("locked", "sumstats")], 'QUEUED')
+    _, jobs = database_utils.get_job_queue(get_db(), 10)
+    with get_db() as holder:
+        holder.execute(text("SELECT GET_LOCK(:name, 0)"), {"name": database_utils.CLAIM_LOCK})
+        # another process is claiming, this one leaves it to the next pass
+        assert database_utils.claim_queued_jobs(get_db(), jobs, 10, 10) == []
+        holder.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": database_utils.CLAIM_LOCK})
+    assert database_utils.claim_queued_jobs(get_db(), jobs, 10, 10) == jobs
+
+
+def test_jobs_of_deleting_datasets_are_not_started():
+    clear_jobs()
+    database_utils.log_jobs_start(get_db(), "testuser", [("kept", "sumstats"), ("deleted", "sumstats")], 'QUEUED')
+    _, jobs = database_utils.get_job_queue(get_db(), 10)
+    database_utils.mark_datasets_deleting(get_db(), "testuser", ["deleted"])
+    assert [job["dataset"] for job in database_utils.get_job_queue(get_db(), 10)[1]] == ["kept"]
+    # queued again after the delete began, e.g. by an upload finishing
+    database_utils.log_jobs_start(get_db(), "testuser", [("deleted", "sumstats")], 'QUEUED')
+    assert [job["dataset"] for job in database_utils.claim_queued_jobs(get_db(), jobs, 10, 10)] == ["kept"]
+    assert "deleted" in database_utils.get_deleting_datasets(get_db())["testuser"]
+    database_utils.delete_dataset(get_db(), "testuser", "deleted")
@@ -0,0 +1,199 @@
+import asyncio
+import json
+
+from sqlalchemy import text
+
+from job_server import api, status_hub as hub_module, database_utils
+from job_server.database import get_db
+from job_server.model import User
+from job_server.status_hub import InProcessStatusHub, DatabaseStatusHub
+
+
+async def next_event(subscription):
+    return await asyncio.wait_for(anext(subscription), timeout=5)
+
+
+def test_broadcast_to_every_subscriber():
+    hub = InProcessStatusHub()
+
+    async def scenario():
+        subscriptions = [hub.subscribe("job:1") for _ in range(3)]
+        for subscription in subscriptions:
+            await subscription.__aenter__()
+        assert hub.subscriber_count("job:1") == 3
+        await hub.publish("job:1", {"status": "sumstats SUCCEEDED"})
+        received = [await next_event(subscription) for subscription in subscriptions]
+        for subscription in subscriptions:
+            await subscription.__aexit__()
+        return received
+
+    received = asyncio.run(scenario())
+    assert [data["status"] for _, data in received] == ["sumstats SUCCEEDED"] * 3
+    assert hub.subscriber_count("job:1") == 0
+
+
+def test_replay_after_last_event_id():
+    hub = InProcessStatusHub()
+
+    async def scenario():
+        first = await hub.publish("job:1", {"status": "RUNNING sldsc"})
+        await hub.publish("job:1", {"status": "sldsc SUCCEEDED"})
+        async with hub.subscribe("job:1", first) as subscription:
+            return await next_event(subscription)
+
+    event_id, data = asyncio.run(scenario())
+    assert event_id == 2
+    assert data["status"] == "sldsc SUCCEEDED"
+
+
+def test_idle_channels_are_bounded(monkeypatch):
+    monkeypatch.setattr(hub_module, "MAX_IDLE_CHANNELS", 5)
+    hub = InProcessStatusHub()
+
+    async def scenario():
+        async with hub.subscribe("job:watched"):
+            for i in range(50):
+                await hub.publish(f"job:{i}", {"status": "RUNNING sldsc"})
+            assert hub.channel_count() == 6
+            assert hub.subscriber_count("job:watched") == 1
+        await hub.publish("job:new", {"status": "RUNNING sldsc"})
+        assert hub.channel_count() == 5 and hub.subscriber_count("job:watched") == 0
+
+    asyncio.run(scenario())
+
+
+def test_database_hub_fans_out_across_workers():
+    with get_db() as con:
+        con.execute(text("DELETE FROM job_events"))
+        con.commit()
+    publisher, listener = DatabaseStatusHub(poll_seconds=0.01), DatabaseStatusHub(poll_seconds=0.01)
+
+    async def scenario():
+        async with listener.subscribe("job:1") as subscription:
+            await publisher.publish("job:2", {"status": "RUNNING sldsc"})
+            first = await publisher.publish("job:1", {"status": "RUNNING sldsc"})
+            # positions and the like are written in batches
+            await publisher.publish_many([("job:3", {"status": "QUEUED sldsc"}), ("job:1", {"status": "sldsc FAILED"})])
+            received = [await next_event(subscription), await next_event(subscription)]
+        # a client reconnecting to another worker picks up where it left off
+        async with publisher.subscribe("job:1", first) as subscription:
+            replayed = await next_event(subscription)
+        return received, replayed
+
+    received, replayed = asyncio.run(scenario())
+    assert [data["status"] for _, data in received] == ["RUNNING sldsc", "sldsc FAILED"]
+    assert replayed == received[1]
+
+
+def insert_event_with_id(event_id, channel, data):
+    with get_db() as con:
+        con.execute(text("INSERT INTO job_events (id, channel, payload, created_at) VALUES (:id, :channel, :payload, "
+                         "CURRENT_TIMESTAMP)"), {"id": event_id, "channel": channel, "payload": json.dumps(data)})
+        con.commit()
+
+
+def test_database_hub_delivers_ids_committed_out_of_order():
+    with get_db() as con:
+        con.execute(text("DELETE FROM job_events"))
+        con.commit()
+    listener = DatabaseStatusHub(poll_seconds=0.01)
+
+    async def scenario():
+        async with listener.subscribe("job:1") as subscription:
+            first = await listener.publish("job:1", {"status": "RUNNING sldsc"})
+            # a later id commits first, then the one handed out before it
+            insert_event_with_id(first + 2, "job:1", {"status": "later"})
+            received = [await next_event(subscription), await next_event(subscription)]
+            insert_event_with_id(first + 1, "job:1", {"status": "earlier"})
+            received.append(await next_event(subscription))
+            await listener.publish("job:1", {"status": "sldsc SUCCEEDED"})
+            received.append(await next_event(subscription))
+        return received
+
+    received = asyncio.run(scenario())
+    assert [data["status"] for _, data in received] == ["RUNNING sldsc", "later", "earlier", "sldsc SUCCEEDED"]
+
+
+def test_database_hub_poller_restarts_from_the_newest_event():
+    with get_db() as con:
+        con.execute(text("DELETE FROM job_events"))
+        con.commit()
+    publisher, listener = DatabaseStatusHub(poll_seconds=0.01), DatabaseStatusHub(poll_seconds=0.01)
+
+    async def scenario():
+        async with listener.subscribe("job:1") as subscription:
+            await publisher.publish("job:1", {"status": "RUNNING sldsc"})
+            await next_event(subscription)
+        await listener._poller
+        # published while nobody on this worker was listening
+        await publisher.publish("job:1", {"status": "sldsc FAILED"})
+        async with listener.subscribe("job:1") as subscription:
+            await publisher.publish("job:1", {"status": "RUNNING sldsc"})
+            return await next_event(subscription)
+
+    _, data = asyncio.run(scenario())
+    assert data["status"] == "RUNNING sldsc"
+
+
+def test_job_status_ends_on_terminal_status(api_client):
+    database_utils.log_job_start(get_db(), "testuser", "ds-finished", "RUNNING sldsc", "sldsc")
+    database_utils.log_job_end(get_db(), "testuser", "ds-finished", "sldsc SUCCEEDED", "", "SUCCEEDED")
+    job_id = database_utils.get_dataset_hash("ds-finished", "testuser")
+    with api_client.stream("GET", f"/api/job-status/{job_id}") as response:
+        body = response.read().decode()
+    assert response.status_code == 200
+    assert "sldsc SUCCEEDED" in body
+
+
+def test_job_status_reconnect_reads_the_stored_status(api_client):
+    database_utils.log_job_start(get_db(), "testuser", "ds-reconnect", "RUNNING sldsc", "sldsc")
+    job_id = database_utils.get_dataset_hash("ds-reconnect", "testuser")
+
+    async def scenario():
+        await hub_module.status_hub.publish(f"job:{job_id}", {"status": "QUEUED sldsc", "job_id": job_id})
+        response = await api.job_status(job_id, 0)
+        events = response.body_iterator
+        current = await anext(events)
+        await hub_module.publish_job_status("testuser", job_id, {"status": "sldsc SUCCEEDED"})
+        # the replayed QUEUED event is older than the stored status, so it is not sent after it
+        update = await asyncio.wait_for(anext(events), timeout=5)
+        await events.aclose()
+        return current, update
+
+    current, update = asyncio.run(scenario())
+    assert json.loads(current["data"])["status"] == "RUNNING sldsc"
+    assert json.loads(update["data"])["status"] == "sldsc SUCCEEDED"
+
+    # ids from before a restart of the in-process hub are ahead of anything it has now
+    database_utils.log_job_end(get_db(), "testuser", "ds-reconnect", "sldsc SUCCEEDED", "", "SUCCEEDED")
+    with api_client.stream("GET", f"/api/job-status/{job_id}", headers={"Last-Event-ID": "1000000"}) as response:
+        assert "sldsc SUCCEEDED" in response.read().decode()
+
+
+def test_job_status_is_published_per_user():
+    async def scenario():
+        async with hub_module.status_hub.subscribe("user:testuser") as subscription:
+            await hub_module.publish_job_status("testuser", "abc", {"status": "sumstats SUCCEEDED"})
+            return await next_event(subscription)
+
+    _, data = asyncio.run(scenario())
+    assert data == {"status": "sumstats SUCCEEDED", "job_id": "abc"}
+
+
+def test_job_events_starts_with_snapshot():
+    database_utils.log_job_start(get_db(), "testuser", "ds-running", "RUNNING sldsc", "sldsc")
+    job_id = database_utils.get_dataset_hash("ds-running", "testuser")
+
+    async def scenario():
+        response = await api.job_events(User(username="testuser"))
+        events = response.body_iterator
+        snapshot = await anext(events)
+        await hub_module.publish_job_status("testuser", job_id, {"status": "sldsc SUCCEEDED"})
+        update = await asyncio.wait_for(anext(events), timeout=5)
+        await events.aclose()
+        return snapshot, update
+
+    snapshot, update = asyncio.run(scenario())
+    assert snapshot["event"] == "snapshot"
+    assert json.loads(snapshot["data"])[job_id]["status"] == "RUNNING sldsc"
+    assert json.loads(update["data"]) == {"status": "sldsc SUCCEEDED", "job_id": job_id}
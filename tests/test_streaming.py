@@ -0,0 +1,27 @@
+import gzip
+
+import pytest
+
+from job_server.streaming import gzip_stream, parse_byte_range, RangeNotSatisfiable, accepts_gzip
+
+
+def test_gzip_stream_round_trip():
+    chunks = [b'a' * 1000, b'b' * 1000, b'']
+    assert gzip.decompress(b''.join(gzip_stream(chunks))) == b''.join(chunks)
+
+
+def test_parse_byte_range():
+    assert parse_byte_range(None, 100) is None
+    assert parse_byte_range('bytes=0-9', 100) == (0, 9)
+    assert parse_byte_range('bytes=90-', 100) == (90, 99)
+    assert parse_byte_range('bytes=-10', 100) == (90, 99)
+    assert parse_byte_range('bytes=50-500', 100) == (50, 99)
+    assert parse_byte_range('bytes=0-1,5-6', 100) is None
+    with pytest.raises(RangeNotSatisfiable):
+        parse_byte_range('bytes=100-', 100)
+
+
+def test_accepts_gzip():
+    assert accepts_gzip('gzip, deflate, br')
+    assert not accepts_gzip('gzip;q=0, deflate')
+    assert not accepts_gzip(None)
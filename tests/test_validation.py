@@ -0,0 +1,145 @@
+import asyncio
+import gzip
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from job_server import database_utils, uploads, validation
+from job_server.database import get_db
+from job_server.model import DatasetInfo
+from job_server.validation import ValidationError, validate_stream
+from tests.test_api import BUCKET, USER, get_token
+from tests.test_batch import job_rows, read_job_log
+
+
+def delete_dataset(name: str):
+    database_utils.delete_dataset(get_db(), USER, name)
+
+COL_MAP = {"chromosome": "CHR", "position": "BP", "reference": "A1", "alt": "A2", "pValue": "P", "beta": "BETA",
+           "n": "N"}
+
+
+def sumstats(rows: int, overrides: dict = None) -> bytes:
+    lines = ["CHR\tBP\tA1\tA2\tP\tBETA\tN"]
+    for i in range(rows):
+        lines.append((overrides or {}).get(i, f"{i % 22 + 1}\t{1000 + i}\tA\tG\t{(i % 100 + 1) / 101:.4f}\t0.1\t5000"))
+    return ("\n".join(lines) + "\n").encode()
+
+
+def dataset(col_map=None) -> DatasetInfo:
+    return DatasetInfo(name="ds", file="sumstats.tsv.gz", ancestry="EUR", separator="\t", genome_build="GRCh37",
+                       phenotype=None, effective_n=None, col_map=col_map or COL_MAP)
+
+
+def chunks(data: bytes, size: int = 4096):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+def test_valid_upload_stats():
+    data = gzip.compress(sumstats(5000, {7: "X\t99\tC\tT\t1e-9\t-0.2\t5000"}))
+    summary = validate_stream(chunks(data), dataset())
+    assert summary["row_count"] == 5000
+    assert summary["stats"]["columns"]["pValue"]["min"] == 1e-9
+    assert summary["stats"]["columns"]["beta"]["min"] == -0.2
+    assert summary["stats"]["genomeWideSignificant"] == 1
+    assert summary["stats"]["chromosomes"][-1] == "X"
+
+
+def test_row_errors_across_blocks(monkeypatch):
+    monkeypatch.setattr(validation, "BLOCK_BYTES", 2048)
+    data = sumstats(2000, {10: "1\t5\tA\tG\t1.5\t0.1\t5000", 1500: "\t5\tA\tG\t0.5\tinf\t5000"})
+    with pytest.raises(ValidationError) as e:
+        validate_stream(chunks(data), dataset(), ThreadPoolExecutor(2))
+    errors = {(error["row"], error["column"]) for error in e.value.errors}
+    # rows are file line numbers, the header is line 1
+    assert errors == {(12, "pValue"), (1502, "chromosome"), (1502, "beta")}
+    assert e.value.row_count == 2000
+
+
+def test_plink_codes_and_other_contigs(monkeypatch):
+    monkeypatch.setattr(validation, "BLOCK_BYTES", 2048)
+    data = sumstats(1000, {5: "chr23\t5\tA\tG\t0.5\t0.1\t5000", 6: "26\t5\tA\tG\t0.5\t0.1\t5000",
+                           700: "chrUn_gl000220\t5\tA\tG\t1.5\t0.1\t5000", 701: "GL000192.1\t5\tA\tG\t0.5\t0.1\t5000"})
+    summary = validate_stream(chunks(data), dataset(), ThreadPoolExecutor(2))
+    # other contigs are skipped rather than rejected, even with bad values
+    assert summary["row_count"] == 998
+    assert summary["stats"]["skippedRows"] == 2
+    assert summary["stats"]["chromosomes"][-2:] == ["MT", "X"]
+
+
+def test_duplicate_variants(monkeypatch):
+    monkeypatch.setattr(validation, "BLOCK_BYTES", 2048)
+    data = sumstats(1000, {900: "1\t1000\ta\tg\t0.5\t0.1\t5000"})
+    with pytest.raises(ValidationError) as e:
+        validate_stream(chunks(data), dataset(), ThreadPoolExecutor(2))
+    assert e.value.errors == [{"row": 902, "column": "variant", "value": None, "error": "duplicate variant"}]
+
+
+def test_malformed_row():
+    data = sumstats(10, {4: "1\t1004\tA\tG\t0.5\t0.1\t5000\textra"})
+    with pytest.raises(ValidationError) as e:
+        validate_stream(chunks(data), dataset(), ThreadPoolExecutor(1))
+    assert e.value.errors[0]["row"] == 6
+
+
+def test_mapped_columns_must_exist():
+    with pytest.raises(ValidationError, match="not in the file: SE"):
+        validate_stream(chunks(sumstats(10)), dataset({**COL_MAP, "se": "SE"}))
+    with pytest.raises(ValidationError, match="not mapped: alt"):
+        validate_stream(chunks(sumstats(10)), dataset({k: v for k, v in COL_MAP.items() if k != "alt"}))
+
+
+def test_blank_lines_are_skipped():
+    data = sumstats(20, {10: "1\t5\tA\tG\t1.5\t0.1\t5000"}).replace(b"\n", b"\n\n", 3)
+    with pytest.raises(ValidationError) as e:
+        validate_stream(chunks(data), dataset(), ThreadPoolExecutor(1))
+    # rows keep the line number they are on in the file
+    assert [(error["row"], error["column"]) for error in e.value.errors] == [(15, "pValue")]
+    assert e.value.row_count == 20
+    data = sumstats(20).replace(b"\n", b"\r\n").replace(b"\r\n5\t", b"\r\n\r\n5\t", 1)
+    assert validate_stream(chunks(data), dataset(), ThreadPoolExecutor(1))["row_count"] == 20
+
+
+@mock_aws
+def test_finalize_upload_rejects_bad_file(api_client):
+    boto3.resource("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET)
+    s3_client = boto3.client("s3", region_name="us-east-1")
+    key = f"userdata/{USER}/genetic/ds/raw/sumstats.tsv.gz"
+    s3_client.put_object(Bucket=BUCKET, Key=key,
+                         Body=gzip.compress(sumstats(100, {3: "1\t1003\tA\tG\tnot-a-number\t0.1\t5000"})))
+    delete_dataset("ds")
+    response = api_client.post("/api/finalize-upload", json=dataset().model_dump(),
+                               headers={"Authorization": f"Bearer {get_token(api_client)}"})
+    # checked in the background, which the test client runs before returning
+    assert response.status_code == 202
+    assert job_rows({"ds"})["ds"][0] == "validation FAILED"
+    assert read_job_log("ds") == "1 invalid rows\nline 5 (pValue): not a p-value in [0, 1], saw not-a-number\n"
+    # the rejected file is kept, with the report alongside it
+    assert s3_client.list_objects_v2(Bucket=BUCKET, Prefix=key)["KeyCount"] == 1
+    metadata = database_utils.get_dataset_metadata(get_db(), USER)["ds"]
+    assert metadata["validation"]["errors"] == [{"row": 5, "column": "pValue", "value": "not-a-number",
+                                                 "error": "not a p-value in [0, 1]"}]
+    assert metadata["row_count"] is None
+    # and it can't be analysed
+    response = api_client.post("/api/start-analysis", json={"dataset": "ds", "method": "sumstats"},
+                               headers={"Authorization": f"Bearer {get_token(api_client)}"})
+    assert response.status_code == 409
+    assert job_rows({"ds"})["ds"][0] == "validation FAILED"
+
+
+@mock_aws
+def test_interrupted_validation_is_resumed(api_client):
+    boto3.resource("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET)
+    boto3.client("s3", region_name="us-east-1").put_object(
+        Bucket=BUCKET, Key=f"userdata/{USER}/genetic/ds/raw/sumstats.tsv.gz", Body=gzip.compress(sumstats(100)))
+    delete_dataset("ds")
+    assert database_utils.insert_dataset(get_db(), USER, dataset())
+    database_utils.log_job_start(get_db(), USER, "ds", database_utils.VALIDATING_STATUS,
+                                 database_utils.VALIDATION_METHOD)
+
+    assert asyncio.run(uploads.resume_uploads()) == 1
+    assert job_rows({"ds"})["ds"][0] == "QUEUED sumstats"
+    assert database_utils.get_dataset_metadata(get_db(), USER)["ds"]["row_count"] == 100